@@ -145,6 +145,48 @@ app_license = "mit"
 # 	}
 # }
 
+doc_events = {
+	"Employee": {
+		"after_insert": "task_manager.services.attendance_cache.invalidate_employee_cache",
+		"on_update": "task_manager.services.attendance_cache.invalidate_employee_cache",
+		"after_rename": "task_manager.services.attendance_cache.invalidate_employee_cache",
+		"on_trash": "task_manager.services.attendance_cache.invalidate_employee_cache",
+	},
+	"Biometric Device Mapping": {
+		"on_update": "task_manager.services.attendance_cache.invalidate_device_mapping_cache",
+	},
+	"Employee Checkin": {
+		"after_insert": [
+			"task_manager.services.attendance_cache.invalidate_last_punch",
+			"task_manager.services.attendance_summary.refresh_for_checkin",
+		],
+		"on_update": [
+			"task_manager.services.attendance_cache.invalidate_last_punch",
+			"task_manager.services.attendance_summary.refresh_for_checkin",
+		],
+		"on_trash": "task_manager.services.attendance_cache.invalidate_last_punch",
+		"after_delete": "task_manager.services.attendance_summary.refresh_for_checkin",
+	},
+	"Leave Application": {
+		"on_update": "task_manager.services.fetch_checkins_cache.invalidate_for_leave",
+		"on_submit": "task_manager.services.fetch_checkins_cache.invalidate_for_leave",
+		"on_update_after_submit": "task_manager.services.fetch_checkins_cache.invalidate_for_leave",
+		"on_cancel": "task_manager.services.fetch_checkins_cache.invalidate_for_leave",
+		"on_trash": "task_manager.services.fetch_checkins_cache.invalidate_for_leave",
+	},
+	"Leave Allocation": {
+		"on_update": "task_manager.services.fetch_checkins_cache.invalidate_for_leave",
+		"on_submit": "task_manager.services.fetch_checkins_cache.invalidate_for_leave",
+		"on_update_after_submit": "task_manager.services.fetch_checkins_cache.invalidate_for_leave",
+		"on_cancel": "task_manager.services.fetch_checkins_cache.invalidate_for_leave",
+		"on_trash": "task_manager.services.fetch_checkins_cache.invalidate_for_leave",
+	},
+	"Holiday List": {
+		"on_update": "task_manager.services.fetch_checkins_cache.invalidate_for_holiday_list",
+		"on_trash": "task_manager.services.fetch_checkins_cache.invalidate_for_holiday_list",
+	},
+}
+
 # Scheduled Tasks
 # ---------------
 
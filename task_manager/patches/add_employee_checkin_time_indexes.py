@@ -0,0 +1,9 @@
+import frappe
+
+
+def execute():
+    """
+    Index Employee Checkin for per-employee and whole-day time range queries
+    """
+    frappe.db.add_index("Employee Checkin", ["employee", "time"], index_name="employee_time_index")
+    frappe.db.add_index("Employee Checkin", ["time"], index_name="time_index")
@@ -0,0 +1,13 @@
+from datetime import timedelta
+
+from frappe.utils import getdate, today
+
+from task_manager.services.attendance_summary import rebuild_daily_summaries
+
+
+def execute():
+    """
+    Backfill Daily Attendance Summary for the windows the dashboards read: last month to date
+    """
+    last_month_start = (getdate(today()).replace(day=1) - timedelta(days=1)).replace(day=1)
+    rebuild_daily_summaries(last_month_start)
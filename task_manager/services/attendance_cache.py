@@ -0,0 +1,379 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+import frappe
+from frappe.utils import getdate
+
+
+# Each shared entry is stored in Redis as (version, value) under one key, next
+# to a version token that changes whenever the entry is invalidated. A stored
+# value is only used while its version is the current one, so a value built
+# before an invalidation is never served after it. Workers keep their own copy
+# of the decoded value and only reload it when the version moves, so a hit
+# costs one small Redis read and no SQL.
+CACHE_PREFIX = "task_manager:attendance_cache:"
+EMPLOYEE_INDEX_KEY = "employee_index"
+DEVICE_MAPPING_KEY = "device_mapping"
+LAST_PUNCH_KEY = "last_punch"
+HIERARCHY_KEY = "reporting_hierarchy"
+LAST_PUNCH_TTL = 2 * 24 * 60 * 60  # seconds; an employee-day stops changing once the day is over
+
+# Per-worker layer: key -> (version, value)
+_local_cache = {}
+
+
+def _get_shared(key, builder):
+    """
+    Return the cached value for key, building and publishing it on a miss
+
+    The value is published only if the version is unchanged after building,
+    so a reader racing an invalidation does not store data from before it.
+    """
+    cache = frappe.cache()
+    version_key = f"{CACHE_PREFIX}{key}:version"
+    version = cache.get_value(version_key)
+    if version is None:
+        version = frappe.generate_hash(length=12)
+        cache.set_value(version_key, version)
+
+    entry = _local_cache.get(key)
+    if entry and entry[0] == version:
+        return entry[1]
+
+    stored = cache.get_value(f"{CACHE_PREFIX}{key}:entry")
+    if stored and stored[0] == version:
+        value = stored[1]
+    else:
+        value = builder()
+        if cache.get_value(version_key) != version:
+            # Invalidated while building: serve this once, but neither publish nor keep it
+            return value
+        cache.set_value(f"{CACHE_PREFIX}{key}:entry", (version, value))
+
+    _local_cache[key] = (version, value)
+    return value
+
+
+def get_cache_version(key):
+    """
+    Current version token of a shared entry; changes whenever the entry is invalidated
+    """
+    return frappe.cache().get_value(f"{CACHE_PREFIX}{key}:version")
+
+
+def _invalidate_shared(key):
+    """
+    Drop a shared entry everywhere; workers notice the new version on their next read
+    """
+    def _invalidate():
+        cache = frappe.cache()
+        cache.set_value(f"{CACHE_PREFIX}{key}:version", frappe.generate_hash(length=12))
+        cache.delete_value(f"{CACHE_PREFIX}{key}:entry")
+        _local_cache.pop(key, None)
+
+    _invalidate()
+
+    # A reader may rebuild from data this transaction has not committed yet, so clear again after commit
+    run_after_commit(_invalidate)
+
+
+def run_after_commit(callback):
+    """
+    Run callback once the current transaction commits, or now if the site cannot defer it
+    """
+    after_commit = getattr(frappe.db, "after_commit", None)
+    if after_commit is not None:
+        after_commit.add(callback)
+    else:
+        callback()
+
+
+# ---------------------------------------------------------------------------
+# Employee resolution
+# ---------------------------------------------------------------------------
+
+def _build_employee_index():
+    """
+    Load every employee once: biometric punching code and employee_name to (name, employee_name)
+    """
+    employees = frappe.get_all(
+        "Employee",
+        fields=["name", "employee_name", "attendance_device_id"],
+        order_by="modified desc"
+    )
+
+    by_device_id = {}
+    by_employee_name = {}
+    for employee in employees:
+        entry = (employee.name, employee.employee_name)
+        if employee.attendance_device_id:
+            by_device_id.setdefault(str(employee.attendance_device_id), entry)
+        if employee.employee_name:
+            # Same pick as frappe.db.get_value on a duplicate name: most recently modified
+            by_employee_name.setdefault(employee.employee_name, entry)
+
+    return {"by_device_id": by_device_id, "by_employee_name": by_employee_name}
+
+
+def get_employee_by_device_id(punchingcode):
+    """
+    (name, employee_name) for a biometric punching code, or None
+    """
+    return _get_shared(EMPLOYEE_INDEX_KEY, _build_employee_index)["by_device_id"].get(str(punchingcode))
+
+
+def get_employees_by_device_ids(punchingcodes):
+    """
+    Map each known punching code to (name, employee_name)
+    """
+    by_device_id = _get_shared(EMPLOYEE_INDEX_KEY, _build_employee_index)["by_device_id"]
+    return {
+        str(punchingcode): by_device_id[str(punchingcode)]
+        for punchingcode in punchingcodes
+        if str(punchingcode) in by_device_id
+    }
+
+
+def get_employee_by_name(employee_name):
+    """
+    (name, employee_name) for an employee_name, or None
+    """
+    return _get_shared(EMPLOYEE_INDEX_KEY, _build_employee_index)["by_employee_name"].get(employee_name)
+
+
+def invalidate_employee_cache(doc=None, method=None):
+    """
+    Employee doc_events hook
+    """
+    _invalidate_shared(EMPLOYEE_INDEX_KEY)
+
+    # Only a new manager or an (in)activation reshapes the reporting tree
+    if method != "on_update" or doc is None or doc.has_value_changed("reports_to") or doc.has_value_changed("status"):
+        _invalidate_shared(HIERARCHY_KEY)
+
+
+# ---------------------------------------------------------------------------
+# Reporting hierarchy
+# ---------------------------------------------------------------------------
+
+def _build_reporting_hierarchy():
+    """
+    Euler tour of the active employees' reports_to tree
+
+    Every employee's direct and indirect reports form one contiguous slice of
+    order, given by intervals[employee] = (start, end) with the employee itself at start.
+    """
+    employees = frappe.get_all("Employee", filters={"status": "Active"}, fields=["name", "reports_to"], order_by="name")
+
+    children = defaultdict(list)
+    reporting = set()
+    for employee in employees:
+        if employee.reports_to:
+            children[employee.reports_to].append(employee.name)
+            reporting.add(employee.name)
+
+    # Top of the tree first; managers outside the active set still head their reports,
+    # and whatever is left afterwards sits on a reports_to cycle
+    starts = [employee.name for employee in employees if employee.name not in reporting]
+    starts += [manager for manager in children if manager not in reporting]
+    starts += list(reporting)
+
+    order = []
+    first_index = {}
+    intervals = {}
+    for root in starts:
+        if root in first_index:
+            continue
+        first_index[root] = len(order)
+        order.append(root)
+        stack = [(root, iter(children.get(root, ())))]
+        while stack:
+            node, pending = stack[-1]
+            for child in pending:
+                if child not in first_index:
+                    first_index[child] = len(order)
+                    order.append(child)
+                    stack.append((child, iter(children.get(child, ()))))
+                    break
+            else:
+                stack.pop()
+                intervals[node] = (first_index[node], len(order))
+
+    return {"order": order, "intervals": intervals}
+
+
+def get_all_subordinates(manager_id):
+    """
+    Every active employee reporting to manager_id directly or indirectly
+    """
+    if not manager_id:
+        return []
+
+    hierarchy = _get_shared(HIERARCHY_KEY, _build_reporting_hierarchy)
+    span = hierarchy["intervals"].get(manager_id)
+    if not span:
+        return []
+    return hierarchy["order"][span[0] + 1:span[1]]
+
+
+def is_subordinate(employee_id, manager_id):
+    """
+    True when employee_id reports to manager_id directly or indirectly, in O(1)
+    """
+    intervals = _get_shared(HIERARCHY_KEY, _build_reporting_hierarchy)["intervals"]
+    employee_span = intervals.get(employee_id)
+    manager_span = intervals.get(manager_id)
+    if not employee_span or not manager_span:
+        return False
+    return manager_span[0] < employee_span[0] < manager_span[1]
+
+
+# ---------------------------------------------------------------------------
+# Device routing
+# ---------------------------------------------------------------------------
+
+def _build_device_mapping():
+    """
+    Index the Biometric Device Mapping rows by serial number
+    """
+    device_doc = frappe.get_single("Biometric Device Mapping")
+
+    mapping = {}
+    for row in device_doc.table_sgvh:
+        # First row wins, as the old linear scan did
+        mapping.setdefault(row.serial_number, {
+            'database_table': row.database_table,
+            'location': row.location
+        })
+    return mapping
+
+
+def get_device_mapping(device_id):
+    """
+    {'database_table', 'location'} for a device serial number, or None
+    """
+    return _get_shared(DEVICE_MAPPING_KEY, _build_device_mapping).get(device_id)
+
+
+def invalidate_device_mapping_cache(doc=None, method=None):
+    """
+    Biometric Device Mapping doc_events hook
+    """
+    _invalidate_shared(DEVICE_MAPPING_KEY)
+
+
+# ---------------------------------------------------------------------------
+# Last punch of the day
+# ---------------------------------------------------------------------------
+
+def _last_punch_key(employee_id, checkin_date):
+    return f"{CACHE_PREFIX}{LAST_PUNCH_KEY}:{employee_id}:{getdate(checkin_date)}"
+
+
+def get_last_punches(employee_days):
+    """
+    Map each (employee, date) to the (time, log_type) of its latest Employee Checkin
+
+    Served from Redis; days not cached yet are read with one indexed range query
+    and written back. Days without any checkin are left out.
+    """
+    cache = frappe.cache()
+    last_punches = {}
+    missing = set()
+    for employee_id, checkin_date in employee_days:
+        key = (employee_id, getdate(checkin_date))
+        value = cache.get_value(_last_punch_key(*key))
+        if value is None:
+            missing.add(key)
+        else:
+            last_punches[key] = value
+
+    if missing:
+        start = datetime.combine(min(day for _, day in missing), time.min)
+        end = datetime.combine(max(day for _, day in missing) + timedelta(days=1), time.min)
+        for employee_id, checkin_time, log_type in frappe.db.sql(
+            """
+            SELECT employee, time, log_type FROM `tabEmployee Checkin`
+            WHERE employee IN %(employees)s AND time >= %(start)s AND time < %(end)s
+            ORDER BY time
+            """,
+            {"employees": list({employee_id for employee_id, _ in missing}), "start": start, "end": end},
+        ):
+            key = (employee_id, getdate(checkin_time))
+            if key in missing:
+                last_punches[key] = (checkin_time, log_type)
+
+        for key in missing:
+            if key in last_punches:
+                cache.set_value(_last_punch_key(*key), last_punches[key], expires_in_sec=LAST_PUNCH_TTL)
+
+    return last_punches
+
+
+def get_last_punch(employee_id, checkin_date):
+    """
+    (time, log_type) of the employee's latest checkin on checkin_date, or None
+    """
+    return get_last_punches([(employee_id, checkin_date)]).get((employee_id, getdate(checkin_date)))
+
+
+def record_last_punch(employee_id, checkin_time, log_type):
+    """
+    Publish a new latest punch for its employee-day once the insert commits
+    """
+    def _record():
+        frappe.cache().set_value(
+            _last_punch_key(employee_id, checkin_time), (checkin_time, log_type), expires_in_sec=LAST_PUNCH_TTL
+        )
+
+    run_after_commit(_record)
+
+
+def resequence_employee_day(employee_id, checkin_date):
+    """
+    Re-alternate IN/OUT over one employee-day in time order after a late punch landed in it
+
+    Only rows whose log_type changes are written. Returns {checkin name: log_type}.
+    """
+    start = datetime.combine(getdate(checkin_date), time.min)
+    rows = frappe.db.sql(
+        """
+        SELECT name, time, log_type FROM `tabEmployee Checkin`
+        WHERE employee = %s AND time >= %s AND time < %s
+        ORDER BY time, name
+        FOR UPDATE
+        """,
+        (employee_id, start, start + timedelta(days=1)),
+    )
+
+    log_types = {}
+    log_type = None
+    for name, checkin_time, current_log_type in rows:
+        log_type = "OUT" if log_type == "IN" else "IN"
+        log_types[name] = log_type
+        if current_log_type != log_type:
+            frappe.db.sql("UPDATE `tabEmployee Checkin` SET log_type = %s WHERE name = %s", (log_type, name))
+
+    if rows:
+        record_last_punch(employee_id, rows[-1][1], log_type)
+    return log_types
+
+
+def invalidate_last_punch(doc=None, method=None):
+    """
+    Employee Checkin doc_events hook, for checkins written outside the punch APIs
+    """
+    keys = set()
+    for checkin in (doc, doc and doc.get_doc_before_save()):
+        # An edit may move the checkin to another employee or day
+        if checkin and checkin.get("employee") and checkin.get("time"):
+            keys.add(_last_punch_key(checkin.employee, checkin.time))
+    if not keys:
+        return
+
+    def _invalidate():
+        for key in keys:
+            frappe.cache().delete_value(key)
+
+    _invalidate()
+    run_after_commit(_invalidate)
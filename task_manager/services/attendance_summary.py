@@ -0,0 +1,267 @@
+import json
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+import frappe
+from frappe.utils import getdate, now_datetime, time_diff_in_hours, today
+
+from task_manager.services.fetch_checkins_cache import ATTENDANCE, invalidate_for_employee_days, invalidate_responses
+
+
+# One Daily Attendance Summary row per (employee, date), derived only from that
+# day's Employee Checkin rows. Leaves and holidays change independently of
+# punches, so they are still applied when the rows are read.
+SUMMARY_TABLE = "tabDaily Attendance Summary"
+UPSERT_CHUNK_SIZE = 500  # rows per multi-row INSERT
+REBUILD_DAYS_PER_CHUNK = 7  # days loaded and committed together by rebuild_daily_summaries
+
+
+def _summary_name(employee_id, summary_date):
+    # Same as the DocType's autoname expression: format:{employee}-{date}
+    return f"{employee_id}-{getdate(summary_date).isoformat()}"
+
+
+def _summarize_logs(logs):
+    """
+    Pair one employee-day's (time, log_type) punches in time order
+
+    Mirrors _calculate_employee_work_hours, except that an IN still waiting for
+    its OUT is kept in open_in_time instead of being closed here, because
+    whether it shows as ongoing depends on the day it is read.
+    """
+    total_working_hours = 0.0
+    last_in_time = None
+    first_in_time = None
+    last_out_time = None
+    checkin_pairs = []
+
+    for checkin_time, log_type in logs:
+        if log_type == "IN":
+            if first_in_time is None:
+                first_in_time = checkin_time
+            if last_in_time is None:
+                last_in_time = checkin_time
+        elif log_type == "OUT":
+            if last_in_time:
+                session_duration = time_diff_in_hours(checkin_time, last_in_time)
+                total_working_hours += session_duration
+                checkin_pairs.append({
+                    "in_time": last_in_time.strftime("%H:%M"),
+                    "out_time": checkin_time.strftime("%H:%M"),
+                    "duration": round(session_duration, 2)
+                })
+                last_in_time = None
+            last_out_time = checkin_time
+
+    return {
+        "daily_working_hours": round(total_working_hours, 2),
+        "entry_time": first_in_time.strftime("%H:%M") if first_in_time else None,
+        "exit_time": last_out_time.strftime("%H:%M") if last_out_time else None,
+        "open_in_time": last_in_time.strftime("%H:%M") if last_in_time else None,
+        "punch_count": len(logs),
+        "checkin_pairs": checkin_pairs,
+    }
+
+
+def _load_checkins(start_date, end_date, employees=None):
+    """
+    {(employee, date): [(time, log_type), ...]} for checkins between start_date and end_date inclusive
+    """
+    conditions = "time >= %(start)s AND time < %(end)s"
+    params = {
+        "start": datetime.combine(getdate(start_date), time.min),
+        "end": datetime.combine(getdate(end_date) + timedelta(days=1), time.min),
+    }
+    if employees is not None:
+        conditions += " AND employee IN %(employees)s"
+        params["employees"] = list(employees)
+
+    logs = defaultdict(list)
+    for employee_id, checkin_time, log_type in frappe.db.sql(
+        f"""
+        SELECT employee, time, log_type FROM `tabEmployee Checkin`
+        WHERE {conditions}
+        ORDER BY employee, time
+        """,
+        params,
+    ):
+        logs[(employee_id, checkin_time.date())].append((checkin_time, log_type))
+    return logs
+
+
+def _upsert_summaries(summaries):
+    """
+    Write {(employee, date): summary} rows, replacing existing ones
+    """
+    now = now_datetime()
+    user = frappe.session.user
+    rows = [
+        (
+            _summary_name(employee_id, summary_date), now, now, user, user,
+            employee_id, summary_date, summary["daily_working_hours"], summary["entry_time"],
+            summary["exit_time"], summary["open_in_time"], summary["punch_count"],
+            json.dumps(summary["checkin_pairs"])
+        )
+        for (employee_id, summary_date), summary in summaries.items()
+    ]
+
+    for offset in range(0, len(rows), UPSERT_CHUNK_SIZE):
+        chunk = rows[offset:offset + UPSERT_CHUNK_SIZE]
+        placeholders = ", ".join(["(%s, %s, %s, %s, %s, 0, 0, %s, %s, %s, %s, %s, %s, %s, %s)"] * len(chunk))
+        frappe.db.sql(f"""
+            INSERT INTO `{SUMMARY_TABLE}`
+            (name, creation, modified, modified_by, owner, docstatus, idx,
+             employee, date, daily_working_hours, entry_time, exit_time, open_in_time, punch_count, checkin_pairs)
+            VALUES {placeholders}
+            ON DUPLICATE KEY UPDATE
+                modified = VALUES(modified), modified_by = VALUES(modified_by),
+                daily_working_hours = VALUES(daily_working_hours), entry_time = VALUES(entry_time),
+                exit_time = VALUES(exit_time), open_in_time = VALUES(open_in_time),
+                punch_count = VALUES(punch_count), checkin_pairs = VALUES(checkin_pairs)
+        """, [value for row in chunk for value in row])
+
+
+def refresh_daily_summaries(employee_days):
+    """
+    Recompute the summary rows of the given (employee, date) pairs from their checkins
+
+    Called after punches are inserted, resequenced or edited; the caller owns the
+    transaction. A failure is logged rather than raised so a punch is never lost
+    because its derived row could not be written; rebuild_daily_summaries repairs it.
+    """
+    employee_days = {(employee_id, getdate(summary_date)) for employee_id, summary_date in employee_days}
+    if not employee_days:
+        return
+
+    try:
+        invalidate_for_employee_days(employee_days)
+    except Exception as e:
+        # A cache outage must not roll back the punch; rebuild_daily_summaries also clears stale responses
+        frappe.log_error(f"Error invalidating cached fetch_checkins responses: {str(e)}", "Daily Attendance Summary Error")
+
+    try:
+        days = [summary_date for _, summary_date in employee_days]
+        logs = _load_checkins(min(days), max(days), {employee_id for employee_id, _ in employee_days})
+
+        summaries = {key: _summarize_logs(logs[key]) for key in employee_days if logs.get(key)}
+        if summaries:
+            _upsert_summaries(summaries)
+
+        # Days whose last checkin was removed or moved away
+        emptied = [_summary_name(*key) for key in employee_days if key not in summaries]
+        if emptied:
+            frappe.db.sql(f"DELETE FROM `{SUMMARY_TABLE}` WHERE name IN %(names)s", {"names": emptied})
+
+    except Exception as e:
+        frappe.log_error(f"Error refreshing daily attendance summaries: {str(e)}", "Daily Attendance Summary Error")
+
+
+def refresh_for_checkin(doc=None, method=None):
+    """
+    Employee Checkin doc_events hook: covers checkins written through documents, such as auto-close OUTs
+    """
+    employee_days = set()
+    for checkin in (doc, doc and doc.get_doc_before_save()):
+        # An edit may move the checkin to another employee or day
+        if checkin and checkin.get("employee") and checkin.get("time"):
+            employee_days.add((checkin.employee, getdate(checkin.time)))
+    refresh_daily_summaries(employee_days)
+
+
+def rebuild_daily_summaries(from_date, to_date=None, employees=None):
+    """
+    Recompute every summary row between from_date and to_date (default: today), for backfills
+
+        bench --site <site> execute task_manager.services.attendance_summary.rebuild_daily_summaries --kwargs "{'from_date': '2025-01-01'}"
+    """
+    start_date = getdate(from_date)
+    end_date = getdate(to_date or today())
+    if isinstance(employees, str):
+        employees = [employees]
+
+    rebuilt = 0
+    chunk_start = start_date
+    while chunk_start <= end_date:
+        chunk_end = min(chunk_start + timedelta(days=REBUILD_DAYS_PER_CHUNK - 1), end_date)
+
+        conditions = "date BETWEEN %(start)s AND %(end)s"
+        params = {"start": chunk_start, "end": chunk_end}
+        if employees is not None:
+            conditions += " AND employee IN %(employees)s"
+            params["employees"] = list(employees)
+        frappe.db.sql(f"DELETE FROM `{SUMMARY_TABLE}` WHERE {conditions}", params)
+
+        logs = _load_checkins(chunk_start, chunk_end, employees)
+        _upsert_summaries({key: _summarize_logs(day_logs) for key, day_logs in logs.items()})
+        frappe.db.commit()
+
+        rebuilt += len(logs)
+        chunk_start = chunk_end + timedelta(days=1)
+
+    # Cached dashboard responses over the rebuilt range were computed from the old rows
+    invalidate_responses(ATTENDANCE, employees, [(start_date, end_date)])
+
+    return {"from_date": str(start_date), "to_date": str(end_date), "rows": rebuilt}
+
+
+def get_daily_summaries(from_date, to_date, employees=None):
+    """
+    Summary rows of active employees between from_date and to_date, shaped like _calculate_employee_work_hours output
+
+    employees limits the rows to those employee ids; None reads every active employee.
+    """
+    conditions = "das.date BETWEEN %(from_date)s AND %(to_date)s AND em.status = 'Active'"
+    params = {"from_date": getdate(from_date), "to_date": getdate(to_date)}
+    if employees is not None:
+        if not employees:
+            return []
+        conditions += " AND das.employee IN %(employees)s"
+        params["employees"] = list(employees)
+
+    rows = frappe.db.sql(
+        f"""
+        SELECT
+            das.employee, das.date, das.daily_working_hours, das.entry_time, das.exit_time,
+            das.open_in_time, das.checkin_pairs,
+            em.employee_name AS emp_display_name, em.department, em.custom_team, em.reports_to, em.image
+        FROM `{SUMMARY_TABLE}` AS das
+        JOIN `tabEmployee` AS em ON das.employee = em.name
+        WHERE {conditions}
+        ORDER BY das.employee, das.date
+        """,
+        params,
+        as_dict=True,
+    )
+
+    current_date = getdate(today())
+    summaries = []
+    for row in rows:
+        checkin_pairs = json.loads(row.checkin_pairs) if row.checkin_pairs else []
+        exit_time = row.exit_time
+        ongoing = bool(row.open_in_time) and row.date == current_date
+
+        # Close the dangling IN the way the live calculation does for the day being read
+        if row.open_in_time:
+            if ongoing:
+                checkin_pairs.append({"in_time": row.open_in_time, "out_time": "Ongoing", "duration": 0.0, "ongoing": True})
+                exit_time = None
+            else:
+                checkin_pairs.append({"in_time": row.open_in_time, "out_time": row.open_in_time, "duration": 0.0, "ongoing": False})
+                exit_time = row.open_in_time
+
+        summaries.append({
+            "employee": row.employee,
+            "emp_display_name": row.emp_display_name,
+            "department": row.department,
+            "custom_team": row.custom_team,
+            "reports_to": row.reports_to,
+            "image": row.image,
+            "date": row.date.isoformat(),
+            "daily_working_hours": row.daily_working_hours,
+            "entry_time": row.entry_time,
+            "exit_time": exit_time,
+            "checkin_pairs": checkin_pairs,
+            "has_ongoing_session": ongoing
+        })
+
+    return summaries
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""Load generator and benchmark for the biometric WebSocket gateway.
+
+Simulates devices speaking the reg / sendlog / getalllog / senduser protocol
+against a BiometricServer, with a local stub ERP whose latency and failure
+rate are configurable, and reports throughput, ack latency, queue depth and
+memory.
+
+By default the server runs in-process on a temporary data directory, so the
+real queue and CSV logs are not touched:
+
+    python benchmark_biometric.py --devices 200 --duration 60 --backlog 5000
+
+Use --server-url to drive an already running gateway instead; queue depth
+and memory are then not sampled.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import websockets
+from aiohttp import web
+
+import biometric_to_server as gateway
+
+logger = logging.getLogger("benchmark")
+
+
+class StubErp:
+    """Local stand-in for the ERP add_checkin / add_checkins endpoints"""
+
+    def __init__(self, latency_ms: float, failure_rate: float):
+        self.latency = latency_ms / 1000.0
+        self.failure_rate = failure_rate
+        self.requests = 0
+        self.records = 0
+        self.failures = 0
+        self._runner: Optional[web.AppRunner] = None
+
+    async def _respond(self, record_count: int, body):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            self.failures += 1
+            return web.Response(status=503, text="stub ERP failure")
+        self.records += record_count
+        return web.json_response({"message": body})
+
+    async def _add_checkin(self, request: web.Request):
+        await request.post()
+        return await self._respond(1, {"status": "success"})
+
+    async def _add_checkins(self, request: web.Request):
+        form = await request.post()
+        checkins = json.loads(form["checkins"])
+        return await self._respond(len(checkins), [{"status": "success"} for _ in checkins])
+
+    async def start(self, port: int) -> str:
+        app = web.Application()
+        app.router.add_post(gateway.ERP_API, self._add_checkin)
+        app.router.add_post(gateway.ERP_BULK_API, self._add_checkins)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, "127.0.0.1", port).start()
+        return f"http://127.0.0.1:{port}/"
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+
+class BenchStats:
+    def __init__(self):
+        self.frames = 0
+        self.records = 0  # records in frames the gateway accepted
+        self.refused_frames = 0
+        self.refused_records = 0  # records in frames refused, e.g. "Server busy"
+        self.errors = 0
+        self.latencies: Dict[str, List[float]] = {}
+        self.queue_depth: List[Dict] = []
+        self.rss_samples: List[float] = []
+
+    def record_ack(self, cmd: str, latency: float, records: int, accepted: bool):
+        self.frames += 1
+        if accepted:
+            self.records += records
+        elif records:
+            self.refused_frames += 1
+            self.refused_records += records
+        else:
+            self.errors += 1
+        self.latencies.setdefault(cmd, []).append(latency)
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(int(round(pct / 100.0 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def _current_rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _make_records(count: int, start: datetime, enroll_ids: int) -> List[Dict]:
+    return [
+        {
+            "enrollid": str(random.randint(1, enroll_ids)),
+            "name": "Bench User",
+            "time": (start + timedelta(seconds=i)).strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        for i in range(count)
+    ]
+
+
+async def _send_frame(ws, stats: BenchStats, frame: Dict, records: int):
+    started = time.perf_counter()
+    await ws.send(json.dumps(frame))
+    reply = json.loads(await ws.recv())
+    stats.record_ack(frame["cmd"], time.perf_counter() - started, records, bool(reply.get("result")))
+
+
+async def simulate_device(index: int, args, url: str, stats: BenchStats, deadline: float):
+    """One device: register, optionally replay a backlog, then push live punches"""
+    serial_number = f"BENCH{index:05d}"
+    try:
+        async with websockets.connect(url, max_size=None) as ws:
+            await _send_frame(ws, stats, {"cmd": "reg", "sn": serial_number}, 0)
+
+            if args.backlog:
+                history_start = datetime.now() - timedelta(days=30)
+                for offset in range(0, args.backlog, args.backlog_frame):
+                    count = min(args.backlog_frame, args.backlog - offset)
+                    records = _make_records(count, history_start + timedelta(seconds=offset), args.enroll_ids)
+                    await _send_frame(ws, stats, {"cmd": "getalllog", "record": records}, count)
+
+            await _send_frame(ws, stats, {"cmd": "senduser", "enrollid": index + 1, "name": "Bench User"}, 0)
+
+            # Spread devices out so frames do not arrive in lockstep
+            await asyncio.sleep(random.uniform(0, args.frame_interval))
+            while time.perf_counter() < deadline:
+                records = _make_records(args.records_per_frame, datetime.now(), args.enroll_ids)
+                await _send_frame(ws, stats, {"cmd": "sendlog", "record": records}, args.records_per_frame)
+                await asyncio.sleep(args.frame_interval)
+
+    except Exception as e:
+        stats.errors += 1
+        logger.warning(f"Device {serial_number} failed: {e}")
+
+
+async def sample_server(server: Optional["gateway.BiometricServer"], stats: BenchStats, started: float):
+    """Sample queue depth and memory once a second"""
+    while True:
+        sample = {"t": round(time.perf_counter() - started, 1)}
+        if server is not None:
+            sample["local_queue"] = await server.local_queue.count()
+            sample["ingest_log"] = await server.ingest_log.count()
+        stats.queue_depth.append(sample)
+        stats.rss_samples.append(_current_rss_mb())
+        await asyncio.sleep(1)
+
+
+def report(stats: BenchStats, elapsed: float, erp: Optional[StubErp]) -> Dict:
+    all_latencies = [latency for values in stats.latencies.values() for latency in values]
+    summary = {
+        "elapsed_s": round(elapsed, 2),
+        "frames": stats.frames,
+        "records": stats.records,
+        "refused_frames": stats.refused_frames,
+        "refused_records": stats.refused_records,
+        "errors": stats.errors,
+        "frames_per_s": round(stats.frames / elapsed, 1) if elapsed else 0,
+        "records_per_s": round(stats.records / elapsed, 1) if elapsed else 0,
+        "ack_latency_ms": {},
+        "queue_depth": stats.queue_depth,
+        "rss_mb": {
+            "start": round(stats.rss_samples[0], 1) if stats.rss_samples else None,
+            "peak": round(max(stats.rss_samples), 1) if stats.rss_samples else None,
+            "end": round(stats.rss_samples[-1], 1) if stats.rss_samples else None,
+        },
+    }
+
+    for cmd, values in list(stats.latencies.items()) + [("all", all_latencies)]:
+        if values:
+            summary["ack_latency_ms"][cmd] = {
+                "count": len(values),
+                "mean": round(statistics.fmean(values) * 1000, 2),
+                "p50": round(_percentile(values, 50) * 1000, 2),
+                "p95": round(_percentile(values, 95) * 1000, 2),
+                "p99": round(_percentile(values, 99) * 1000, 2),
+            }
+
+    if erp is not None:
+        summary["erp"] = {"requests": erp.requests, "records": erp.records, "failures": erp.failures}
+
+    print(f"\nElapsed {summary['elapsed_s']}s  frames {stats.frames}  records {stats.records}  errors {stats.errors}")
+    print(f"Refused: {stats.refused_frames} frames, {stats.refused_records} records")
+    print(f"Throughput: {summary['frames_per_s']} frames/s, {summary['records_per_s']} records/s")
+    print(f"{'command':<10} {'count':>8} {'mean':>9} {'p50':>9} {'p95':>9} {'p99':>9}  (ack latency, ms)")
+    for cmd, values in summary["ack_latency_ms"].items():
+        print(f"{cmd:<10} {values['count']:>8} {values['mean']:>9} {values['p50']:>9} {values['p95']:>9} {values['p99']:>9}")
+    if stats.queue_depth and "local_queue" in stats.queue_depth[-1]:
+        peak_queue = max(sample["local_queue"] for sample in stats.queue_depth)
+        peak_ingest = max(sample["ingest_log"] for sample in stats.queue_depth)
+        print(f"Queue depth: LocalQueue peak {peak_queue}, end {stats.queue_depth[-1]['local_queue']}; "
+              f"ingest log peak {peak_ingest}, end {stats.queue_depth[-1]['ingest_log']}")
+    print(f"RSS MB: start {summary['rss_mb']['start']}, peak {summary['rss_mb']['peak']}, end {summary['rss_mb']['end']}")
+    if erp is not None:
+        print(f"Stub ERP: {erp.requests} requests, {erp.records} records, {erp.failures} injected failures")
+
+    return summary
+
+
+async def run(args) -> Dict:
+    erp = None
+    server = None
+    server_task = None
+    url = args.server_url
+
+    if url is None:
+        erp = StubErp(args.erp_latency_ms, args.erp_failure_rate)
+        gateway.ERP_URL = await erp.start(args.erp_port)
+        gateway.ERP_BATCH_ENABLED = not args.no_batch
+        gateway.INGEST_ACK_FIRST = args.ack_first
+        gateway.MAX_CONNECTIONS = max(gateway.MAX_CONNECTIONS, args.devices)
+
+        data_dir = args.data_dir or tempfile.mkdtemp(prefix="biometric-bench-")
+        server = gateway.BiometricServer("127.0.0.1", args.port, data_dir=data_dir)
+        server_task = asyncio.create_task(server.start_server())
+        await asyncio.sleep(0.5)
+        if server_task.done():
+            await erp.stop()
+            raise SystemExit(f"Gateway failed to start on port {args.port}")
+        url = f"ws://127.0.0.1:{args.port}"
+        logger.info(f"In-process gateway on {url}, data in {data_dir}")
+
+    stats = BenchStats()
+    started = time.perf_counter()
+    sampler = asyncio.create_task(sample_server(server, stats, started))
+    deadline = started + args.duration
+
+    try:
+        await asyncio.gather(*(
+            simulate_device(index, args, url, stats, deadline) for index in range(args.devices)
+        ))
+        elapsed = time.perf_counter() - started
+
+        # Let the queue drain for a moment so the depth curve shows recovery
+        if server is not None and args.drain_wait:
+            await asyncio.sleep(args.drain_wait)
+    finally:
+        sampler.cancel()
+        if server_task:
+            server_task.cancel()
+            await asyncio.gather(server_task, return_exceptions=True)
+        if erp:
+            await erp.stop()
+
+    return report(stats, elapsed, erp)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the biometric WebSocket gateway")
+    parser.add_argument("--devices", type=int, default=50, help="simulated devices")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of live sendlog traffic")
+    parser.add_argument("--frame-interval", type=float, default=1.0, help="seconds between sendlog frames per device")
+    parser.add_argument("--records-per-frame", type=int, default=1, help="records per sendlog frame")
+    parser.add_argument("--backlog", type=int, default=0, help="getalllog records each device replays on connect")
+    parser.add_argument("--backlog-frame", type=int, default=500, help="records per getalllog frame")
+    parser.add_argument("--enroll-ids", type=int, default=500, help="distinct enroll ids to draw from")
+    parser.add_argument("--erp-latency-ms", type=float, default=20, help="stub ERP response latency")
+    parser.add_argument("--erp-failure-rate", type=float, default=0.0, help="fraction of stub ERP calls returning 503")
+    parser.add_argument("--erp-port", type=int, default=18001, help="port for the stub ERP")
+    parser.add_argument("--port", type=int, default=18190, help="port for the in-process gateway")
+    parser.add_argument("--no-batch", action="store_true", help="disable bulk forwarding")
+    parser.add_argument("--ack-first", action="store_true", help="enable the acknowledge-first ingest mode")
+    parser.add_argument("--drain-wait", type=float, default=5, help="seconds to keep sampling after traffic stops")
+    parser.add_argument("--data-dir", help="gateway data directory (default: a temporary directory)")
+    parser.add_argument("--server-url", help="benchmark a running gateway instead of an in-process one")
+    parser.add_argument("--json", dest="json_path", help="write the full report to this file")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    # The gateway logs every punch at INFO; keep the benchmark output readable
+    logging.getLogger().setLevel(logging.WARNING)
+    logger.setLevel(logging.INFO)
+
+    summary = asyncio.run(run(args))
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Regression benchmark for Employee Checkin date-range queries.
+
+Copies the Employee Checkin table definition (with the indexes added by
+task_manager.patches.add_employee_checkin_time_indexes) into a scratch table,
+grows its history step by step and times the same one-day and one-month
+windows with the old DATE(time) predicates and the half-open range
+predicates. With the range form the timings should stay flat as history
+grows; the DATE() form grows with the table.
+
+Run against a development site; only the scratch table is written:
+
+    bench --site <site> execute task_manager.services.benchmark_checkin_queries.run
+    bench --site <site> execute task_manager.services.benchmark_checkin_queries.run --kwargs "{'steps': [100000, 1000000]}"
+"""
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import frappe
+
+SCRATCH_TABLE = "_bench_employee_checkin"
+EMPLOYEES = 500  # distinct employees in the generated history
+PUNCHES_PER_DAY = 4  # per employee
+INSERT_CHUNK_SIZE = 5000  # rows per multi-row INSERT
+REPEATS = 5  # timed runs per query, median reported
+
+QUERIES = {
+    "day, DATE(time) =": (
+        "SELECT employee, time, log_type FROM `{table}` WHERE DATE(time) = %(day)s ORDER BY employee, time"
+    ),
+    "day, range": (
+        "SELECT employee, time, log_type FROM `{table}` "
+        "WHERE time >= %(day)s AND time < %(day)s + INTERVAL 1 DAY ORDER BY employee, time"
+    ),
+    "employee-day, DATE(time) =": (
+        "SELECT log_type FROM `{table}` WHERE employee = %(employee)s AND DATE(time) = %(day)s "
+        "ORDER BY time DESC LIMIT 1"
+    ),
+    "employee-day, range": (
+        "SELECT log_type FROM `{table}` WHERE employee = %(employee)s "
+        "AND time >= %(day)s AND time < %(day)s + INTERVAL 1 DAY ORDER BY time DESC LIMIT 1"
+    ),
+    "month, DATE(time) BETWEEN": (
+        "SELECT employee, time, log_type FROM `{table}` "
+        "WHERE DATE(time) BETWEEN %(month_start)s AND %(month_end)s ORDER BY employee, time"
+    ),
+    "month, range": (
+        "SELECT employee, time, log_type FROM `{table}` "
+        "WHERE time >= %(month_start)s AND time < %(month_end)s + INTERVAL 1 DAY ORDER BY employee, time"
+    ),
+}
+
+
+def _create_scratch_table():
+    """
+    Fresh copy of the Employee Checkin table definition, indexes included
+    """
+    frappe.db.sql_ddl(f"DROP TABLE IF EXISTS `{SCRATCH_TABLE}`")
+    frappe.db.sql_ddl(f"CREATE TABLE `{SCRATCH_TABLE}` LIKE `tabEmployee Checkin`")
+    for index_name, columns in (("employee_time_index", "employee, time"), ("time_index", "time")):
+        existing = frappe.db.sql(f"SHOW INDEX FROM `{SCRATCH_TABLE}` WHERE Key_name = %s", (index_name,))
+        if not existing:
+            frappe.db.sql_ddl(f"ALTER TABLE `{SCRATCH_TABLE}` ADD INDEX `{index_name}` ({columns})")
+
+
+def _grow_history(rows, target, last_day):
+    """
+    Append whole days of punches going back from last_day until the table holds target rows
+    """
+    punches_per_day = EMPLOYEES * PUNCHES_PER_DAY
+    day = last_day - timedelta(days=rows // punches_per_day)
+    batch = []
+    while rows < target:
+        for employee in range(EMPLOYEES):
+            start = datetime.combine(day, datetime.min.time()) + timedelta(hours=8, minutes=random.randint(0, 90))
+            for punch in range(PUNCHES_PER_DAY):
+                rows += 1
+                batch.append((
+                    f"BENCH-{rows:09d}", f"HR-EMP-{employee:05d}",
+                    start + timedelta(hours=3 * punch), "OUT" if punch % 2 else "IN"
+                ))
+        if len(batch) >= INSERT_CHUNK_SIZE:
+            _insert(batch)
+            batch = []
+        day -= timedelta(days=1)
+    if batch:
+        _insert(batch)
+    frappe.db.commit()
+    frappe.db.sql(f"ANALYZE TABLE `{SCRATCH_TABLE}`")
+    return rows
+
+
+def _insert(batch):
+    placeholders = ", ".join(["(%s, NOW(), NOW(), 'Administrator', 'Administrator', 0, 0, %s, %s, %s)"] * len(batch))
+    frappe.db.sql(f"""
+        INSERT INTO `{SCRATCH_TABLE}`
+        (name, creation, modified, modified_by, owner, docstatus, idx, employee, time, log_type)
+        VALUES {placeholders}
+    """, [value for row in batch for value in row])
+
+
+def _time_query(query, params):
+    timings = []
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        frappe.db.sql(query.format(table=SCRATCH_TABLE), params)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def run(steps=None, keep_table=False):
+    """
+    Time each query at every history size in steps; returns {rows: {query: median ms}}
+    """
+    steps = sorted(steps or [50000, 200000, 1000000])
+    last_day = datetime.now().date()
+    params = {
+        "day": last_day - timedelta(days=1),
+        "employee": "HR-EMP-00042",
+        "month_start": last_day - timedelta(days=30),
+        "month_end": last_day - timedelta(days=1),
+    }
+
+    _create_scratch_table()
+    report = {}
+    rows = 0
+    try:
+        for target in steps:
+            rows = _grow_history(rows, target, last_day)
+            report[rows] = {label: round(_time_query(query, params), 2) for label, query in QUERIES.items()}
+
+            print(f"\n{rows:,} rows")
+            for label, elapsed in report[rows].items():
+                print(f"  {label:<28} {elapsed:>10.2f} ms")
+    finally:
+        if not keep_table:
+            frappe.db.sql_ddl(f"DROP TABLE IF EXISTS `{SCRATCH_TABLE}`")
+
+    return report
@@ -2,15 +2,36 @@
 import asyncio
 import websockets
 import json
-import requests
+import aiohttp
 from datetime import datetime
 import logging
 import os
-from typing import Dict, Optional, Tuple, List
+import re
+from typing import Dict, Optional, Tuple, List, NamedTuple
 import csv
 import sqlite3
 import time
+import random
 from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+import io
+import multiprocessing
+import signal
+import threading
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from aiohttp import web
+
+# Optional faster JSON codecs; the stdlib json module is the fallback
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
 
 # Logging Configuration
 logging.basicConfig(
@@ -22,6 +43,7 @@ logger = logging.getLogger(__name__)
 # ERPNext Configuration
 ERP_URL = "http://192.168.0.68:8001/"
 ERP_API = "/api/method/clean_plus.services.biometric_server_erp2.add_checkin"
+ERP_BULK_API = "/api/method/clean_plus.services.biometric_server_erp2.add_checkins"
 
 HOST = "0.0.0.0"
 PORT = 8190
@@ -31,7 +53,65 @@ MAX_RETRY_ATTEMPTS = 3
 RETRY_DELAY_BASE = 2  # seconds
 REQUEST_TIMEOUT = 10  # seconds
 MAX_CONNECTIONS = 50
-CONNECTION_TIMEOUT = 300  # 5 minutes
+CONNECTION_TIMEOUT = 300  # 5 minutes without a message before a connection is reaped
+CLEANUP_INTERVAL = 60  # seconds between stale connection sweeps
+
+# Batched forwarding configuration
+ERP_BATCH_ENABLED = True
+ERP_BATCH_MAX_SIZE = 200  # records per bulk add_checkins call
+ERP_BATCH_WINDOW = 0.5  # seconds replayed records wait for more records before flushing
+ERP_BATCH_LIVE_WINDOW = 0.005  # seconds a live punch waits, so its device is acked promptly
+ERP_BATCH_MAX_INFLIGHT = 4  # concurrent bulk calls to ERP
+ERP_BATCH_DEVICE_SHARE = 25  # records taken from one device before moving to the next
+REPLAY_BUFFER_MAX = 5000  # replayed (getalllog) records waiting for ERP before devices are told to back off
+DEVICE_INBOUND_FRAMES = 4  # frames buffered per connection before reads pause
+
+# HTTP connection pool configuration
+HTTP_POOL_SIZE = 100  # total open connections to ERP
+HTTP_POOL_PER_HOST = 20  # open connections per ERP host
+HTTP_KEEPALIVE_TIMEOUT = 60  # seconds an idle connection is kept alive
+
+# Local queue configuration
+QUEUE_SYNCHRONOUS = "NORMAL"  # with WAL, only a power loss can drop the last commits
+QUEUE_MAX_RETRIES = 10  # attempts before a row is moved to the dead-letter table
+QUEUE_BACKOFF_BASE = 30  # seconds before the first retry of a queued row
+QUEUE_BACKOFF_MAX = 3600  # cap on the delay between retries of one row
+QUEUE_ID_CHUNK_SIZE = 500  # ids per IN (...) list in bulk queue statements
+QUEUE_DRAIN_CONCURRENCY = 8  # concurrent ERP calls while draining the queue
+QUEUE_BATCH_MIN = 10  # rows per drain batch while ERP is struggling
+QUEUE_BATCH_MAX = 2000  # rows per drain batch once ERP keeps up
+QUEUE_IDLE_INTERVAL = 5  # seconds between polls when nothing is due
+QUEUE_FAILURE_BACKOFF_MAX = 60  # cap on the pause after a batch hit an ERP outage
+
+# Circuit breaker configuration
+CIRCUIT_FAILURE_THRESHOLD = 5  # consecutive ERP outages before the circuit opens
+CIRCUIT_RESET_TIMEOUT = 30  # seconds the circuit stays open before a probe
+
+# Acknowledge-first ingest configuration
+INGEST_ACK_FIRST = False  # ack frames once durably logged, forward to ERP in the background
+INGEST_FORWARD_BATCH = 1000  # log rows read per forwarder pass
+INGEST_IDLE_INTERVAL = 1  # seconds the forwarder waits for new frames when caught up
+
+# Replay de-duplication configuration
+DEDUP_ENABLED = True
+DEDUP_CACHE_SIZE = 50000  # recent (device, enroll id, time) keys held in memory
+DEDUP_TTL = 90 * 24 * 3600  # seconds a seen punch is remembered on disk
+DEDUP_PRUNE_INTERVAL = 3600  # seconds between expired key sweeps
+DEDUP_BUSY_TIMEOUT = 5  # seconds a worker waits for another worker's write to the shared index
+
+# CSV audit log configuration
+AUDIT_FLUSH_ROWS = 500  # buffered rows that trigger a write
+AUDIT_FLUSH_INTERVAL = 2  # seconds between periodic writes
+
+# Multi-process configuration
+WORKER_PROCESSES = 1  # above 1, a supervisor runs this many SO_REUSEPORT workers
+WORKER_RESTART_DELAY = 2  # seconds before a crashed worker is restarted
+
+# Metrics configuration
+METRICS_ENABLED = True
+METRICS_HOST = "0.0.0.0"
+METRICS_PORT = 9190  # workers listen on METRICS_PORT + worker id
+LOOP_LAG_INTERVAL = 0.5  # seconds between event-loop lag probes
 
 
 def _safe_join_url(base: str, path: str) -> str:
@@ -45,69 +125,275 @@ def _safe_remote_addr(addr: Optional[Tuple[str, int]]) -> str:
     return f"{host}:{port}"
 
 
+def _partition_files(queue_dir: str, prefix: str) -> Dict[str, str]:
+    """Existing {suffix: path} files of a store: prefix.db and its per-worker prefix_w<N>.db"""
+    pattern = re.compile(rf"{re.escape(prefix)}(_w\d+)?\.db")
+    files = {}
+    for filename in os.listdir(queue_dir):
+        match = pattern.fullmatch(filename)
+        if match:
+            files[match.group(1) or ""] = os.path.join(queue_dir, filename)
+    return files
+
+
+def _remove_sqlite_files(db_path: str):
+    for path in (db_path, f"{db_path}-wal", f"{db_path}-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+if orjson is not None:
+    _json_loads = orjson.loads
+    _JSON_DECODE_ERRORS = (orjson.JSONDecodeError,)
+
+    def _json_dumps(obj) -> str:
+        return orjson.dumps(obj).decode()
+
+elif msgspec is not None:
+    _json_loads = msgspec.json.Decoder().decode
+    _JSON_DECODE_ERRORS = (msgspec.DecodeError,)
+    _msgspec_encoder = msgspec.json.Encoder()
+
+    def _json_dumps(obj) -> str:
+        return _msgspec_encoder.encode(obj).decode()
+
+else:
+    _json_loads = json.loads
+    _json_dumps = json.dumps
+    _JSON_DECODE_ERRORS = (json.JSONDecodeError,)
+
+
+class Punch(NamedTuple):
+    """One validated attendance record, parsed once and reused downstream"""
+    enroll_id: str
+    name: str
+    timestamp_str: str  # device format, %Y-%m-%d %H:%M:%S
+    erp_time: str  # ERP format, %d-%m-%Y %H:%M:%S
+
+
+def _make_punch(enroll_id, name, timestamp_str) -> Optional[Punch]:
+    """Validate a device timestamp and build a Punch, or None when it is malformed
+
+    Device timestamps have a fixed layout, so the separators are checked by
+    position and the ERP format is built by slicing; fromisoformat only
+    validates the digits and the calendar date, which is far cheaper than
+    strptime.
+    """
+    if (not isinstance(timestamp_str, str) or len(timestamp_str) != 19 or timestamp_str[10] != " "
+            or timestamp_str[4] != "-" or timestamp_str[7] != "-"
+            or timestamp_str[13] != ":" or timestamp_str[16] != ":"):
+        return None
+    try:
+        datetime.fromisoformat(timestamp_str)
+    except ValueError:
+        return None
+
+    erp_time = f"{timestamp_str[8:10]}-{timestamp_str[5:7]}-{timestamp_str[0:4]} {timestamp_str[11:]}"
+    return Punch(enroll_id, name, timestamp_str, erp_time)
+
+
+_cloudtime_cache = [0, ""]  # epoch second, formatted time
+
+
+def _cloudtime() -> str:
+    """Current time for device replies, formatted at most once per second"""
+    second = int(time.time())
+    if second != _cloudtime_cache[0]:
+        _cloudtime_cache[0] = second
+        _cloudtime_cache[1] = datetime.fromtimestamp(second).strftime("%Y-%m-%d %H:%M:%S")
+    return _cloudtime_cache[1]
+
+
+def _is_erp_outage(response: Dict) -> bool:
+    """True when a failed response means ERP is unreachable rather than rejecting the data"""
+    if response['success']:
+        return False
+    status = response.get('status')
+    return status is None or status >= 500
+
+
+class CircuitOpenError(Exception):
+    """Raised when the ERP circuit breaker is open and no request was sent"""
+
+
 class LocalQueue:
-    """SQLite-based local queue for failed ERP requests"""
+    """SQLite-based local queue for failed ERP requests
+
+    A single long-lived connection is owned by a dedicated writer thread, so
+    every queue operation runs on the same connection without reopening the
+    file, and bulk operations commit once per batch instead of once per row.
+    """
     
     def __init__(self, db_path: str):
         self.db_path = db_path
-        self._init_db()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.enqueued_total = 0
+        self.dead_lettered_total = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="local-queue")
+        self._executor.submit(self._init_db).result()
 
     def _init_db(self):
         """Initialize SQLite database for queue"""
         try:
             os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
             
-            with sqlite3.connect(self.db_path) as conn:
-                conn.execute("""
-                    CREATE TABLE IF NOT EXISTS failed_requests (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        punchingcode TEXT NOT NULL,
-                        employee_name TEXT NOT NULL,
-                        timestamp_str TEXT NOT NULL,
-                        device_id TEXT NOT NULL,
-                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                        retry_count INTEGER DEFAULT 0,
-                        last_error TEXT
-                    )
-                """)
-                conn.commit()
+            self._conn = sqlite3.connect(self.db_path)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(f"PRAGMA synchronous={QUEUE_SYNCHRONOUS}")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS failed_requests (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    punchingcode TEXT NOT NULL,
+                    employee_name TEXT NOT NULL,
+                    timestamp_str TEXT NOT NULL,
+                    device_id TEXT NOT NULL,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    retry_count INTEGER DEFAULT 0,
+                    last_error TEXT,
+                    next_attempt_at REAL NOT NULL DEFAULT 0
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS dead_requests (
+                    id INTEGER PRIMARY KEY,
+                    punchingcode TEXT NOT NULL,
+                    employee_name TEXT NOT NULL,
+                    timestamp_str TEXT NOT NULL,
+                    device_id TEXT NOT NULL,
+                    created_at DATETIME,
+                    retry_count INTEGER,
+                    last_error TEXT,
+                    dead_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+            # Queues created before scheduled retries lack next_attempt_at
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(failed_requests)")]
+            if "next_attempt_at" not in columns:
+                self._conn.execute(
+                    "ALTER TABLE failed_requests ADD COLUMN next_attempt_at REAL NOT NULL DEFAULT 0"
+                )
+
+            # Rows are polled by due time: an indexed range read over next_attempt_at,
+            # with each due row then fetched by its id
+            self._conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_failed_requests_next_attempt
+                ON failed_requests (next_attempt_at)
+            """)
+
+            # Rows that exhausted their retries under an older limit go straight to dead letters
+            exhausted = [row[0] for row in self._conn.execute(
+                "SELECT id FROM failed_requests WHERE retry_count >= ?", (QUEUE_MAX_RETRIES,)
+            )]
+            self._move_to_dead_letter(exhausted)
+            self._conn.commit()
         except Exception as e:
             logger.error(f"Failed to initialize local queue database: {e}")
             raise
 
+    def _move_to_dead_letter(self, request_ids: List[int]):
+        """Move rows to dead_requests; caller owns the transaction"""
+        # Chunked to stay under SQLite's bound-parameter limit
+        for offset in range(0, len(request_ids), QUEUE_ID_CHUNK_SIZE):
+            chunk = request_ids[offset:offset + QUEUE_ID_CHUNK_SIZE]
+            placeholders = ", ".join("?" * len(chunk))
+            self._conn.execute(f"""
+                INSERT OR REPLACE INTO dead_requests
+                (id, punchingcode, employee_name, timestamp_str, device_id, created_at, retry_count, last_error)
+                SELECT id, punchingcode, employee_name, timestamp_str, device_id, created_at, retry_count, last_error
+                FROM failed_requests WHERE id IN ({placeholders})
+            """, chunk)
+            self._conn.execute(f"DELETE FROM failed_requests WHERE id IN ({placeholders})", chunk)
+
+        if request_ids:
+            self.dead_lettered_total += len(request_ids)
+            logger.warning(f"Moved {len(request_ids)} requests to dead-letter table after {QUEUE_MAX_RETRIES} retries")
+
+    @staticmethod
+    def _backoff_delay(retry_count: int) -> float:
+        """Exponential backoff with jitter for a row that has failed retry_count times"""
+        delay = min(QUEUE_BACKOFF_BASE * (2 ** max(retry_count - 1, 0)), QUEUE_BACKOFF_MAX)
+        return delay * random.uniform(0.8, 1.2)
+
+    async def _run(self, func, *args):
+        """Run a database operation on the writer thread"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
     async def add_failed_request(self, punchingcode: str, name: str, timestamp_str: str, device_id: str, error: str):
         """Add failed request to queue"""
+        await self.add_failed_requests([(punchingcode, name, timestamp_str, device_id, error)])
+
+    async def add_failed_requests(self, entries: List[Tuple[str, str, str, str, str]]):
+        """Add many failed requests to queue in one transaction
+
+        Each entry is (punchingcode, employee_name, timestamp_str, device_id, error).
+        Raises if the rows could not be stored, so callers never count them as queued.
+        """
+        if not entries:
+            return
+
         try:
             def _insert():
-                with sqlite3.connect(self.db_path) as conn:
-                    conn.execute("""
+                with self._conn:
+                    next_attempt_at = time.time() + QUEUE_BACKOFF_BASE
+                    self._conn.executemany("""
                         INSERT INTO failed_requests 
-                        (punchingcode, employee_name, timestamp_str, device_id, last_error)
-                        VALUES (?, ?, ?, ?, ?)
-                    """, (punchingcode, name, timestamp_str, device_id, str(error)))
-                    conn.commit()
+                        (punchingcode, employee_name, timestamp_str, device_id, last_error, next_attempt_at)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    """, [
+                        (code, name, ts, device, str(error), next_attempt_at)
+                        for code, name, ts, device, error in entries
+                    ])
             
-            await asyncio.to_thread(_insert)
-            logger.info(f"Added failed request to queue: {punchingcode} at {timestamp_str}")
+            await self._run(_insert)
+            self.enqueued_total += len(entries)
+            if len(entries) == 1:
+                logger.info(f"Added failed request to queue: {entries[0][0]} at {entries[0][2]}")
+            else:
+                logger.info(f"Added {len(entries)} failed requests to queue")
             
         except Exception as e:
             logger.error(f"Failed to add request to queue: {e}")
+            raise
+
+    async def count(self) -> int:
+        """Number of requests waiting in the queue"""
+        try:
+            return await self._run(
+                lambda: self._conn.execute("SELECT COUNT(*) FROM failed_requests").fetchone()[0]
+            )
+        except Exception as e:
+            logger.error(f"Failed to count queued requests: {e}")
+            return 0
+
+    async def oldest_age(self) -> float:
+        """Seconds since the oldest queued request was first queued, 0 when empty"""
+        try:
+            # Ids are assigned in insertion order, so the lowest id is the oldest row
+            age = await self._run(lambda: self._conn.execute("""
+                SELECT strftime('%s', 'now') - strftime('%s', created_at)
+                FROM failed_requests ORDER BY id LIMIT 1
+            """).fetchone())
+            return float(age[0]) if age and age[0] is not None else 0.0
+        except Exception as e:
+            logger.error(f"Failed to read oldest queued request: {e}")
+            return 0.0
 
     async def get_pending_requests(self, limit: int = 10) -> List[Dict]:
-        """Get pending requests from queue"""
+        """Get requests whose next attempt is due, oldest schedule first"""
         try:
             def _fetch():
-                with sqlite3.connect(self.db_path) as conn:
-                    conn.row_factory = sqlite3.Row
-                    cursor = conn.execute("""
-                        SELECT * FROM failed_requests 
-                        WHERE retry_count < ? 
-                        ORDER BY created_at ASC 
-                        LIMIT ?
-                    """, (MAX_RETRY_ATTEMPTS, limit))
-                    return [dict(row) for row in cursor.fetchall()]
+                cursor = self._conn.execute("""
+                    SELECT * FROM failed_requests 
+                    WHERE next_attempt_at <= ? 
+                    ORDER BY next_attempt_at ASC 
+                    LIMIT ?
+                """, (time.time(), limit))
+                columns = [column[0] for column in cursor.description]
+                return [dict(zip(columns, row)) for row in cursor.fetchall()]
             
-            return await asyncio.to_thread(_fetch)
+            return await self._run(_fetch)
             
         except Exception as e:
             logger.error(f"Failed to fetch pending requests: {e}")
@@ -115,45 +401,1022 @@ class LocalQueue:
 
     async def update_retry_count(self, request_id: int, error: str = None):
         """Update retry count for a request"""
+        await self.update_retry_counts([request_id], error)
+
+    async def update_retry_counts(self, request_ids: List[int], error: str = None):
+        """Record a failed attempt for many requests in one transaction
+
+        Each row is rescheduled with exponential backoff; rows that reach
+        QUEUE_MAX_RETRIES are moved to the dead-letter table.
+        """
+        if not request_ids:
+            return
+
         try:
             def _update():
-                with sqlite3.connect(self.db_path) as conn:
-                    conn.execute("""
-                        UPDATE failed_requests 
-                        SET retry_count = retry_count + 1, last_error = ?
-                        WHERE id = ?
-                    """, (str(error) if error else None, request_id))
-                    conn.commit()
+                now = time.time()
+                exhausted = []
+                with self._conn:
+                    for request_id in request_ids:
+                        row = self._conn.execute(
+                            "SELECT retry_count FROM failed_requests WHERE id = ?", (request_id,)
+                        ).fetchone()
+                        if not row:
+                            continue
+
+                        retry_count = row[0] + 1
+                        self._conn.execute("""
+                            UPDATE failed_requests 
+                            SET retry_count = ?, last_error = ?, next_attempt_at = ?
+                            WHERE id = ?
+                        """, (retry_count, str(error) if error else None,
+                              now + self._backoff_delay(retry_count), request_id))
+
+                        if retry_count >= QUEUE_MAX_RETRIES:
+                            exhausted.append(request_id)
+
+                    self._move_to_dead_letter(exhausted)
             
-            await asyncio.to_thread(_update)
+            await self._run(_update)
             
         except Exception as e:
             logger.error(f"Failed to update retry count: {e}")
 
     async def remove_request(self, request_id: int):
         """Remove successfully processed request"""
+        await self.remove_requests([request_id])
+
+    async def remove_requests(self, request_ids: List[int]):
+        """Remove many successfully processed requests in one transaction"""
+        if not request_ids:
+            return
+
         try:
             def _delete():
-                with sqlite3.connect(self.db_path) as conn:
-                    conn.execute("DELETE FROM failed_requests WHERE id = ?", (request_id,))
-                    conn.commit()
+                with self._conn:
+                    self._conn.executemany(
+                        "DELETE FROM failed_requests WHERE id = ?",
+                        [(request_id,) for request_id in request_ids]
+                    )
             
-            await asyncio.to_thread(_delete)
+            await self._run(_delete)
             
         except Exception as e:
             logger.error(f"Failed to remove request: {e}")
 
+    def adopt(self, db_path: str) -> int:
+        """Move every row of another queue file into this queue and delete the file
+
+        Used for partitions no worker owns any more; returns the number of queued rows moved.
+        """
+        def _adopt():
+            self._conn.execute("ATTACH DATABASE ? AS stray", (db_path,))
+            try:
+                tables = {row[0] for row in self._conn.execute("SELECT name FROM stray.sqlite_master WHERE type = 'table'")}
+                moved = 0
+                with self._conn:
+                    if "failed_requests" in tables:
+                        # Queues created before scheduled retries lack next_attempt_at
+                        columns = [row[1] for row in self._conn.execute("PRAGMA stray.table_info(failed_requests)")]
+                        next_attempt_at = "next_attempt_at" if "next_attempt_at" in columns else "0"
+                        moved = self._conn.execute(f"""
+                            INSERT INTO failed_requests
+                            (punchingcode, employee_name, timestamp_str, device_id, created_at, retry_count, last_error, next_attempt_at)
+                            SELECT punchingcode, employee_name, timestamp_str, device_id, created_at, retry_count, last_error, {next_attempt_at}
+                            FROM stray.failed_requests ORDER BY id
+                        """).rowcount
+                        self._conn.execute("DELETE FROM stray.failed_requests")
+                    if "dead_requests" in tables:
+                        self._conn.execute("""
+                            INSERT INTO dead_requests
+                            (punchingcode, employee_name, timestamp_str, device_id, created_at, retry_count, last_error, dead_at)
+                            SELECT punchingcode, employee_name, timestamp_str, device_id, created_at, retry_count, last_error, dead_at
+                            FROM stray.dead_requests ORDER BY id
+                        """)
+                        self._conn.execute("DELETE FROM stray.dead_requests")
+            finally:
+                self._conn.execute("DETACH DATABASE stray")
+
+            _remove_sqlite_files(db_path)
+            return moved
+
+        return self._executor.submit(_adopt).result()
+
+    def close(self):
+        """Close the connection and stop the writer thread"""
+        def _close():
+            if self._conn:
+                self._conn.close()
+                self._conn = None
+
+        self._executor.submit(_close).result()
+        self._executor.shutdown(wait=True)
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker shared by every path that calls ERP
+
+    Consecutive outages open the circuit; while open no request is sent.
+    After the reset timeout a single probe is let through and its outcome
+    closes or re-opens the circuit.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout: float = CIRCUIT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    def is_open(self) -> bool:
+        """True while requests would be rejected without sending a probe"""
+        if self.state == self.OPEN:
+            return time.monotonic() - self._opened_at < self.reset_timeout
+        return self.state == self.HALF_OPEN and self._probe_in_flight
+
+    def allow_request(self) -> bool:
+        """Whether a request may be sent now; claims the probe slot when due"""
+        if self.state == self.CLOSED:
+            return True
+
+        if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+            logger.info("ERP circuit half-open, sending probe")
+
+        if self.state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+
+        return False
+
+    def release_probe(self):
+        """Free the probe slot without an outcome, e.g. when the probe was cancelled"""
+        if self.state == self.HALF_OPEN:
+            self._probe_in_flight = False
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            logger.info("ERP circuit closed")
+        self.state = self.CLOSED
+        self._failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self._failures += 1
+        if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(f"ERP circuit opened after {self._failures} consecutive failures")
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+
+class IngestLog:
+    """Durable write-ahead log of accepted device records
+
+    Frames are appended in one fully synced transaction before the device is
+    acked. A forwarder reads rows after the stored checkpoint and advances it
+    once they are delivered or handed to LocalQueue, so nothing is lost across
+    restarts. Concurrent appends are group-committed on the writer thread.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pending: List[Tuple[List[Tuple[str, str, str, str]], asyncio.Future]] = []
+        # Frames are queued on the event loop and taken on the writer thread
+        self._pending_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-log")
+        self._executor.submit(self._init_db).result()
+
+    def _init_db(self):
+        """Initialize SQLite database for the ingest log"""
+        try:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+
+            self._conn = sqlite3.connect(self.db_path)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=FULL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS ingest_log (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    punchingcode TEXT NOT NULL,
+                    employee_name TEXT NOT NULL,
+                    timestamp_str TEXT NOT NULL,
+                    device_id TEXT NOT NULL,
+                    received_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS ingest_checkpoint (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    last_seq INTEGER NOT NULL
+                )
+            """)
+            self._conn.execute("INSERT OR IGNORE INTO ingest_checkpoint (id, last_seq) VALUES (1, 0)")
+            self._conn.commit()
+        except Exception as e:
+            logger.error(f"Failed to initialize ingest log database: {e}")
+            raise
+
+    async def _run(self, func, *args):
+        """Run a database operation on the writer thread"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def append(self, entries: List[Tuple[str, str, str, str]]):
+        """Durably append one frame's records
+
+        Each entry is (punchingcode, employee_name, timestamp_str, device_id).
+        Returns once the rows are synced to disk; raises if they could not be.
+        """
+        if not entries:
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        with self._pending_lock:
+            self._pending.append((entries, future))
+        await self._run(self._commit_pending)
+        await future
+
+    def _commit_pending(self):
+        # Whatever frames arrived since the last commit share this transaction
+        with self._pending_lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        try:
+            with self._conn:
+                for entries, _ in batch:
+                    self._conn.executemany("""
+                        INSERT INTO ingest_log (punchingcode, employee_name, timestamp_str, device_id)
+                        VALUES (?, ?, ?, ?)
+                    """, entries)
+            error = None
+        except Exception as e:
+            error = e
+
+        for _, future in batch:
+            future.get_loop().call_soon_threadsafe(self._resolve, future, error)
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, error: Optional[Exception]):
+        if future.done():
+            return
+        if error is None:
+            future.set_result(None)
+        else:
+            future.set_exception(error)
+
+    async def read_after_checkpoint(self, limit: int) -> List[Dict]:
+        """Rows not yet forwarded, oldest first"""
+        def _fetch():
+            cursor = self._conn.execute("""
+                SELECT * FROM ingest_log
+                WHERE seq > (SELECT last_seq FROM ingest_checkpoint WHERE id = 1)
+                ORDER BY seq ASC
+                LIMIT ?
+            """, (limit,))
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+        return await self._run(_fetch)
+
+    async def count(self) -> int:
+        """Number of logged rows not yet forwarded"""
+        return await self._run(
+            lambda: self._conn.execute("SELECT COUNT(*) FROM ingest_log").fetchone()[0]
+        )
+
+    async def checkpoint(self, seq: int, forwarded: List[int] = ()):
+        """Mark everything up to seq, plus the rows in forwarded, as forwarded and drop those rows"""
+        def _checkpoint():
+            with self._conn:
+                self._conn.execute("UPDATE ingest_checkpoint SET last_seq = ? WHERE id = 1", (seq,))
+                self._conn.execute("DELETE FROM ingest_log WHERE seq <= ?", (seq,))
+                self._conn.executemany("DELETE FROM ingest_log WHERE seq = ?", [(row_seq,) for row_seq in forwarded])
+
+        await self._run(_checkpoint)
+
+    def adopt(self, db_path: str) -> int:
+        """Append the unforwarded rows of another ingest log file to this one and delete the file
+
+        Used for partitions no worker owns any more; returns the number of rows moved.
+        """
+        def _adopt():
+            self._conn.execute("ATTACH DATABASE ? AS stray", (db_path,))
+            try:
+                tables = {row[0] for row in self._conn.execute("SELECT name FROM stray.sqlite_master WHERE type = 'table'")}
+                moved = 0
+                with self._conn:
+                    if "ingest_log" in tables:
+                        moved = self._conn.execute("""
+                            INSERT INTO ingest_log (punchingcode, employee_name, timestamp_str, device_id, received_at)
+                            SELECT punchingcode, employee_name, timestamp_str, device_id, received_at
+                            FROM stray.ingest_log
+                            WHERE seq > COALESCE((SELECT last_seq FROM stray.ingest_checkpoint WHERE id = 1), 0)
+                            ORDER BY seq
+                        """).rowcount
+                        self._conn.execute("DELETE FROM stray.ingest_log")
+            finally:
+                self._conn.execute("DETACH DATABASE stray")
+
+            _remove_sqlite_files(db_path)
+            return moved
+
+        return self._executor.submit(_adopt).result()
+
+    def close(self):
+        """Close the connection and stop the writer thread"""
+        def _close():
+            if self._conn:
+                self._conn.close()
+                self._conn = None
+
+        self._executor.submit(_close).result()
+        self._executor.shutdown(wait=True)
+
+
+class PunchDedupIndex:
+    """Index of punches already accepted, keyed on (device, enroll id, time)
+
+    Devices resend records after reconnects and in getalllog dumps. Recent
+    keys sit in an in-memory LRU, so most replays are recognised with a dict
+    lookup; older ones fall through to a SQLite table on the index's own
+    thread. Keys expire after DEDUP_TTL. Punches are only marked once they
+    are sent or durably queued, so a frame that was refused is not dropped
+    when the device resends it.
+
+    Under the supervisor every worker opens the same file: a device that
+    reconnects lands on an arbitrary worker, and its replays must still be
+    recognised there. The LRU only holds keys known to be seen, so it never
+    hides a key another worker recorded.
+    """
+
+    def __init__(self, db_path: str, capacity: int = DEDUP_CACHE_SIZE, ttl: float = DEDUP_TTL):
+        self.db_path = db_path
+        self.capacity = capacity
+        self.ttl = ttl
+        self._recent: "OrderedDict[Tuple[str, str, str], float]" = OrderedDict()  # key -> seen at
+        self._reserved = set()  # keys of punches being forwarded right now
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="dedup-index")
+        self._executor.submit(self._init_db).result()
+
+    def _init_db(self):
+        """Initialize SQLite database for the index"""
+        try:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+
+            self._conn = sqlite3.connect(self.db_path, timeout=DEDUP_BUSY_TIMEOUT)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(f"PRAGMA synchronous={QUEUE_SYNCHRONOUS}")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS seen_punches (
+                    device_id TEXT NOT NULL,
+                    punchingcode TEXT NOT NULL,
+                    timestamp_str TEXT NOT NULL,
+                    seen_at REAL NOT NULL,
+                    PRIMARY KEY (device_id, punchingcode, timestamp_str)
+                ) WITHOUT ROWID
+            """)
+            self._conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_seen_punches_seen_at
+                ON seen_punches (seen_at)
+            """)
+            self._conn.commit()
+        except Exception as e:
+            logger.error(f"Failed to initialize de-duplication index: {e}")
+            raise
+
+    async def _run(self, func, *args):
+        """Run a database operation on the index thread"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    @staticmethod
+    def _key(device_id: str, punch: Punch) -> Tuple[str, str, str]:
+        return device_id, str(punch.enroll_id), punch.timestamp_str
+
+    def _remember(self, key: Tuple[str, str, str], seen_at: float):
+        self._recent[key] = seen_at
+        self._recent.move_to_end(key)
+        if len(self._recent) > self.capacity:
+            self._recent.popitem(last=False)
+
+    async def filter_new(self, device_id: str, punches: List[Punch]) -> List[Punch]:
+        """Drop punches already seen, including repeats within the same frame
+
+        The punches returned are reserved until mark_seen or release, so a
+        resent frame arriving while they are still being forwarded is dropped.
+        """
+        now = time.time()
+        expired_before = now - self.ttl
+        fresh = []
+        unknown = []
+        frame_keys = set()
+
+        for punch in punches:
+            key = self._key(device_id, punch)
+            if key in frame_keys:
+                continue
+            frame_keys.add(key)
+
+            if key in self._reserved:
+                continue
+            seen_at = self._recent.get(key)
+            if seen_at is not None and seen_at >= expired_before:
+                self._recent.move_to_end(key)
+                continue
+            unknown.append((key, punch))
+
+        if not unknown:
+            return fresh
+
+        # Reserved before the lookup yields, so a concurrent copy of the frame stops above
+        self._reserved.update(key for key, _ in unknown)
+
+        def _lookup():
+            found = {}
+            for key, _ in unknown:
+                row = self._conn.execute("""
+                    SELECT seen_at FROM seen_punches
+                    WHERE device_id = ? AND punchingcode = ? AND timestamp_str = ?
+                """, key).fetchone()
+                if row and row[0] >= expired_before:
+                    found[key] = row[0]
+            return found
+
+        try:
+            persisted = await self._run(_lookup)
+        except Exception as e:
+            # Forwarding a duplicate is better than losing a punch
+            logger.error(f"De-duplication lookup failed, forwarding frame as new: {e}")
+            persisted = {}
+
+        for key, punch in unknown:
+            if key in persisted:
+                self._reserved.discard(key)
+                self._remember(key, persisted[key])
+            else:
+                fresh.append(punch)
+        return fresh
+
+    def release(self, device_id: str, punches: List[Punch]):
+        """Drop the reservations filter_new took; punches not marked seen may be forwarded again"""
+        for punch in punches:
+            self._reserved.discard(self._key(device_id, punch))
+
+    async def mark_seen(self, device_id: str, punches: List[Punch]):
+        """Record punches as accepted, in memory and on disk"""
+        if not punches:
+            return
+
+        now = time.time()
+        keys = [self._key(device_id, punch) for punch in punches]
+        for key in keys:
+            self._remember(key, now)
+
+        def _insert():
+            with self._conn:
+                self._conn.executemany("""
+                    INSERT OR REPLACE INTO seen_punches (device_id, punchingcode, timestamp_str, seen_at)
+                    VALUES (?, ?, ?, ?)
+                """, [key + (now,) for key in keys])
+
+        try:
+            await self._run(_insert)
+        except Exception as e:
+            logger.error(f"Failed to persist {len(keys)} seen punches: {e}")
+
+    async def prune(self) -> int:
+        """Delete keys older than the TTL; returns how many were removed"""
+        def _delete():
+            with self._conn:
+                return self._conn.execute(
+                    "DELETE FROM seen_punches WHERE seen_at < ?", (time.time() - self.ttl,)
+                ).rowcount
+
+        return await self._run(_delete)
+
+    async def run_periodic_prune(self):
+        """Background task expiring old keys"""
+        while True:
+            await asyncio.sleep(DEDUP_PRUNE_INTERVAL)
+            try:
+                removed = await self.prune()
+                if removed:
+                    logger.info(f"Pruned {removed} expired punches from de-duplication index")
+            except Exception as e:
+                logger.error(f"Error pruning de-duplication index: {e}")
+
+    def adopt(self, db_path: str) -> int:
+        """Merge the keys of another index file into this one and delete the file
+
+        Used for the per-worker files older versions kept; returns the number of keys moved.
+        """
+        def _adopt():
+            self._conn.execute("ATTACH DATABASE ? AS stray", (db_path,))
+            try:
+                tables = {row[0] for row in self._conn.execute("SELECT name FROM stray.sqlite_master WHERE type = 'table'")}
+                moved = 0
+                with self._conn:
+                    if "seen_punches" in tables:
+                        moved = self._conn.execute("""
+                            INSERT OR IGNORE INTO seen_punches (device_id, punchingcode, timestamp_str, seen_at)
+                            SELECT device_id, punchingcode, timestamp_str, seen_at
+                            FROM stray.seen_punches WHERE seen_at >= ?
+                        """, (time.time() - self.ttl,)).rowcount
+            finally:
+                self._conn.execute("DETACH DATABASE stray")
+
+            _remove_sqlite_files(db_path)
+            return moved
+
+        return self._executor.submit(_adopt).result()
+
+    def close(self):
+        """Close the connection and stop the index thread"""
+        def _close():
+            if self._conn:
+                self._conn.close()
+                self._conn = None
+
+        self._executor.submit(_close).result()
+        self._executor.shutdown(wait=True)
+
+
+class ErpHttpClient:
+    """Shared keep-alive connection pool for ERP requests"""
+
+    def __init__(self, pool_size: int = HTTP_POOL_SIZE, per_host: int = HTTP_POOL_PER_HOST,
+                 timeout: float = REQUEST_TIMEOUT):
+        self.pool_size = pool_size
+        self.per_host = per_host
+        self.timeout = timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # Session is created lazily so it binds to the running event loop
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                limit_per_host=self.per_host,
+                keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    async def post_form(self, url: str, data: Dict) -> Dict:
+        """POST form data, returning {'success', 'body'} or {'success', 'error'}"""
+        try:
+            async with self._get_session().post(url, data=data) as response:
+                body = await response.text()
+
+                if response.status == 200:
+                    return {'success': True, 'body': body}
+                else:
+                    return {
+                        'success': False,
+                        'status': response.status,
+                        'error': f"HTTP {response.status}: {body[:200]}"
+                    }
+
+        except asyncio.TimeoutError:
+            return {'success': False, 'error': 'Request timeout'}
+        except aiohttp.ClientConnectionError:
+            return {'success': False, 'error': 'Connection error'}
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+
+
+PRIORITY_LIVE = 0  # sendlog: punches happening now
+PRIORITY_REPLAY = 1  # getalllog: history dumped after a reconnect
+
+
+class ErpBatchForwarder:
+    """Coalesces checkins from many devices into bulk ERP calls
+
+    Records wait in per-device queues, one set per priority, and each batch
+    is composed only when a send slot frees up. Live punches are taken
+    before replayed history, and within a priority devices are served
+    round-robin, so one device replaying a large backlog cannot hold back
+    the others.
+    """
+
+    def __init__(self, send_batch, max_size: int = ERP_BATCH_MAX_SIZE,
+                 window: float = ERP_BATCH_WINDOW, max_inflight: int = ERP_BATCH_MAX_INFLIGHT,
+                 device_share: int = ERP_BATCH_DEVICE_SHARE, replay_limit: int = REPLAY_BUFFER_MAX,
+                 live_window: float = ERP_BATCH_LIVE_WINDOW):
+        # send_batch(items) -> List[Optional[bool]], one result per item in order:
+        # True sent, False queued, None neither
+        self._send_batch = send_batch
+        self.max_size = max_size
+        self.window = window
+        self.live_window = live_window
+        self.device_share = device_share
+        self.replay_limit = replay_limit
+        # priority -> device id -> waiting (item, future) pairs, in round-robin order
+        self._queues: Tuple[OrderedDict, ...] = (OrderedDict(), OrderedDict())
+        self._queued = [0, 0]
+        self._wakeup = asyncio.Event()
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._inflight = set()
+        self._slots = asyncio.Semaphore(max_inflight)
+
+    def queued(self, priority: int) -> int:
+        return self._queued[priority]
+
+    def accepts_replay(self, count: int) -> bool:
+        """Whether count more replayed records fit; an idle forwarder takes any frame"""
+        waiting = self._queued[PRIORITY_REPLAY]
+        return waiting == 0 or waiting + count <= self.replay_limit
+
+    async def submit(self, items: List[Dict], device_id: str = "", priority: int = PRIORITY_LIVE) -> List[Optional[bool]]:
+        """Queue items for bulk calls and wait for their per-item results"""
+        if not items:
+            return []
+
+        loop = asyncio.get_running_loop()
+        futures = [loop.create_future() for _ in items]
+        self._queues[priority].setdefault(device_id, deque()).extend(zip(items, futures))
+        self._queued[priority] += len(items)
+
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch_loop())
+        else:
+            self._wakeup.set()
+
+        return list(await asyncio.gather(*futures))
+
+    async def _dispatch_loop(self):
+        """Send batches until nothing is waiting
+
+        A partial batch of replayed records waits up to the window for more;
+        once a live punch is waiting only the much shorter live window applies.
+        A full batch goes out as soon as a slot is free.
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+
+        while sum(self._queued):
+            window = self.live_window if self._queued[PRIORITY_LIVE] else self.window
+            remaining = started + window - loop.time()
+            if sum(self._queued) < self.max_size and remaining > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._slots.acquire()
+            # Composed after the slot is granted, so punches that arrived meanwhile go first
+            self._dispatch(self._take_batch())
+
+    def _take_batch(self) -> List[Tuple[Dict, asyncio.Future]]:
+        batch = []
+        for priority, queues in enumerate(self._queues):
+            while queues and len(batch) < self.max_size:
+                device_id, queue = next(iter(queues.items()))
+                take = min(len(queue), self.device_share, self.max_size - len(batch))
+                batch.extend(queue.popleft() for _ in range(take))
+                self._queued[priority] -= take
+
+                if queue:
+                    queues.move_to_end(device_id)
+                else:
+                    del queues[device_id]
+        return batch
+
+    def _dispatch(self, batch: List[Tuple[Dict, asyncio.Future]]):
+        """Start sending a batch; the caller has already acquired a slot"""
+        task = asyncio.create_task(self._run_batch(batch))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _run_batch(self, batch: List[Tuple[Dict, asyncio.Future]]):
+        try:
+            results = await self._send_batch([item for item, _ in batch])
+        except Exception as e:
+            logger.error(f"Bulk ERP forwarding failed for {len(batch)} records: {e}")
+            results = [None] * len(batch)
+        finally:
+            self._slots.release()
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(None if result is None else bool(result))
+
+    async def flush(self):
+        """Send anything still pending and wait for in-flight batches (used on shutdown)"""
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            await asyncio.gather(self._dispatcher, return_exceptions=True)
+            self._dispatcher = None
+
+        while sum(self._queued):
+            await self._slots.acquire()
+            self._dispatch(self._take_batch())
+
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+
+
+class RegistryControlServer:
+    """Supervisor side of the worker control channel
+
+    Holds the global device registry so MAX_CONNECTIONS and serial number
+    ownership stay consistent across worker processes. Workers talk to it
+    over a Unix socket with one JSON object per line.
+    """
+
+    def __init__(self, socket_path: str, max_connections: int = MAX_CONNECTIONS):
+        self.socket_path = socket_path
+        self.max_connections = max_connections
+        self.devices: Dict[str, Dict] = {}  # serial number -> {"worker", "addr"}
+        # serial number -> control connection that registered it; a worker may reconnect
+        # its channel, so ownership is tracked per connection rather than per worker id
+        self._owners: Dict[str, asyncio.StreamWriter] = {}
+        self._server = None
+
+    async def start(self):
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        self._server = await asyncio.start_unix_server(self._handle_worker, path=self.socket_path)
+        logger.info(f"Control channel listening on {self.socket_path}")
+
+    async def _handle_worker(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        worker_id = None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+
+                request = json.loads(line)
+                worker_id = request.get("worker", worker_id)
+                reply = self._dispatch(request, writer)
+
+                writer.write((json.dumps(reply) + "\n").encode())
+                await writer.drain()
+
+        except asyncio.CancelledError:
+            pass  # supervisor shutting down
+        except Exception as e:
+            logger.error(f"Control channel error for worker {worker_id}: {e}")
+        finally:
+            # Devices registered over this connection are released; ones the worker
+            # registered again over a newer connection are kept
+            stale = [sn for sn, owner in self._owners.items() if owner is writer]
+            for sn in stale:
+                del self.devices[sn]
+                del self._owners[sn]
+            if stale:
+                logger.info(f"Released {len(stale)} devices held by worker {worker_id}")
+            writer.close()
+
+    def _dispatch(self, request: Dict, connection: asyncio.StreamWriter) -> Dict:
+        op = request.get("op")
+        serial_number = request.get("sn")
+
+        if op == "register":
+            # A serial number re-registering replaces its old entry instead of using a new slot
+            if serial_number not in self.devices and len(self.devices) >= self.max_connections:
+                return {"ok": False, "reason": "Server connection limit reached"}
+            self.devices[serial_number] = {"worker": request.get("worker"), "addr": request.get("addr")}
+            self._owners[serial_number] = connection
+            return {"ok": True}
+
+        if op == "unregister":
+            entry = self.devices.get(serial_number)
+            if entry and entry["worker"] == request.get("worker"):
+                del self.devices[serial_number]
+                del self._owners[serial_number]
+            return {"ok": True}
+
+        if op == "devices":
+            return {"ok": True, "devices": self.devices}
+
+        return {"ok": False, "reason": f"Unknown op: {op}"}
+
+    async def close(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+
+class RegistryControlClient:
+    """Worker side of the control channel"""
+
+    def __init__(self, socket_path: str, worker_id: int):
+        self.socket_path = socket_path
+        self.worker_id = worker_id
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._lock = asyncio.Lock()
+
+    async def request(self, op: str, **fields) -> Dict:
+        """Send one request and wait for its reply, reconnecting if needed"""
+        message = dict(fields, op=op, worker=self.worker_id)
+        async with self._lock:
+            if self._writer is None or self._writer.is_closing():
+                self._reader, self._writer = await asyncio.open_unix_connection(self.socket_path)
+
+            try:
+                self._writer.write((json.dumps(message) + "\n").encode())
+                await self._writer.drain()
+                line = await asyncio.wait_for(self._reader.readline(), timeout=REQUEST_TIMEOUT)
+                if not line:
+                    raise ConnectionError("Control channel closed")
+                return json.loads(line)
+            except Exception:
+                self._writer.close()
+                self._writer = None
+                raise
+
+    async def close(self):
+        if self._writer:
+            self._writer.close()
+            self._writer = None
+
+
+class Histogram:
+    """Fixed-bucket histogram rendered in Prometheus text format"""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str = "") -> List[str]:
+        prefix = f"{labels}," if labels else ""
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, self.counts):
+            cumulative += bucket_count
+            lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {self.count}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {self.sum}")
+        lines.append(f"{name}_count{suffix} {self.count}")
+        return lines
+
+
+def _label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class GatewayMetrics:
+    """In-process counters and histograms for the gateway
+
+    Recording is a plain dict or list increment on the event loop, so the
+    message hot path pays no locking or I/O; everything is formatted only
+    when /metrics is scraped.
+    """
+
+    LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+    FRAME_COMMANDS = ("reg", "sendlog", "getalllog", "senduser")
+
+    def __init__(self):
+        self.frames_received: Dict[str, int] = {}
+        self.device_records: Dict[str, int] = {}
+        self.record_outcomes: Dict[str, int] = {"sent": 0, "queued": 0, "failed": 0}
+        self.erp_requests: Dict[Tuple[str, str], int] = {}
+        self.erp_latency: Dict[str, Histogram] = {}
+        self.erp_retries = 0
+        self.queue_rescheduled = 0
+        self.flow_control_rejections = 0
+        self.duplicates_dropped = 0
+        self.loop_lag = Histogram(self.LAG_BUCKETS)
+        self.last_loop_lag = 0.0
+
+    def count_frame(self, cmd):
+        # Unknown commands share a label so a misbehaving device cannot grow the series set
+        key = cmd if cmd in self.FRAME_COMMANDS else "other"
+        self.frames_received[key] = self.frames_received.get(key, 0) + 1
+
+    def count_records(self, device_id: str, count: int):
+        self.device_records[device_id] = self.device_records.get(device_id, 0) + count
+
+    def count_outcomes(self, results: List[Optional[bool]]):
+        for success in results:
+            outcome = "failed" if success is None else "sent" if success else "queued"
+            self.record_outcomes[outcome] += 1
+
+    def observe_erp_request(self, endpoint: str, result: str, duration: float):
+        key = (endpoint, result)
+        self.erp_requests[key] = self.erp_requests.get(key, 0) + 1
+        histogram = self.erp_latency.get(endpoint)
+        if histogram is None:
+            histogram = self.erp_latency[endpoint] = Histogram(self.LATENCY_BUCKETS)
+        histogram.observe(duration)
+
+    def observe_loop_lag(self, lag: float):
+        self.last_loop_lag = lag
+        self.loop_lag.observe(lag)
+
+    def render(self, gauges: Dict[str, Tuple[str, float]]) -> str:
+        """Prometheus text exposition; gauges maps name -> (help, value)"""
+        lines = [
+            "# HELP biometric_frames_received_total Frames received from devices by command",
+            "# TYPE biometric_frames_received_total counter",
+        ]
+        for cmd, value in self.frames_received.items():
+            lines.append(f'biometric_frames_received_total{{cmd="{cmd}"}} {value}')
+
+        lines += [
+            "# HELP biometric_device_records_total Attendance records received per device",
+            "# TYPE biometric_device_records_total counter",
+        ]
+        for device_id, value in self.device_records.items():
+            lines.append(f'biometric_device_records_total{{device="{_label_value(device_id)}"}} {value}')
+
+        lines += [
+            "# HELP biometric_records_processed_total Records by forwarding outcome",
+            "# TYPE biometric_records_processed_total counter",
+        ]
+        for outcome, value in self.record_outcomes.items():
+            lines.append(f'biometric_records_processed_total{{outcome="{outcome}"}} {value}')
+
+        lines += [
+            "# HELP biometric_erp_requests_total ERP HTTP requests by endpoint and result",
+            "# TYPE biometric_erp_requests_total counter",
+        ]
+        for (endpoint, result), value in self.erp_requests.items():
+            lines.append(f'biometric_erp_requests_total{{endpoint="{endpoint}",result="{result}"}} {value}')
+
+        lines += [
+            "# HELP biometric_erp_request_seconds ERP HTTP request latency",
+            "# TYPE biometric_erp_request_seconds histogram",
+        ]
+        for endpoint, histogram in self.erp_latency.items():
+            lines += histogram.render("biometric_erp_request_seconds", f'endpoint="{endpoint}"')
+
+        lines += [
+            "# HELP biometric_erp_retries_total In-line ERP retries before a record is queued",
+            "# TYPE biometric_erp_retries_total counter",
+            f"biometric_erp_retries_total {self.erp_retries}",
+            "# HELP biometric_queue_rescheduled_total Queued requests rescheduled after a failed retry",
+            "# TYPE biometric_queue_rescheduled_total counter",
+            f"biometric_queue_rescheduled_total {self.queue_rescheduled}",
+            "# HELP biometric_flow_control_rejections_total Replay frames refused while the replay buffer was full",
+            "# TYPE biometric_flow_control_rejections_total counter",
+            f"biometric_flow_control_rejections_total {self.flow_control_rejections}",
+            "# HELP biometric_duplicates_dropped_total Replayed records dropped as already seen",
+            "# TYPE biometric_duplicates_dropped_total counter",
+            f"biometric_duplicates_dropped_total {self.duplicates_dropped}",
+            "# HELP biometric_event_loop_lag_seconds Delay of the lag probe beyond its scheduled wake-up",
+            "# TYPE biometric_event_loop_lag_seconds histogram",
+        ]
+        lines += self.loop_lag.render("biometric_event_loop_lag_seconds")
+
+        for name, (help_text, value) in gauges.items():
+            metric_type = "counter" if name.endswith("_total") else "gauge"
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}", f"{name} {value}"]
+
+        return "\n".join(lines) + "\n"
+
 
 class BiometricServer:
-    def __init__(self, host="0.0.0.0", port=8190):
+    def __init__(self, host="0.0.0.0", port=8190, worker_id: Optional[int] = None,
+                 control_path: Optional[str] = None, data_dir: Optional[str] = None,
+                 worker_count: int = WORKER_PROCESSES):
         self.host = host
         self.port = port
+        self.worker_id = worker_id
         self.connected_devices: Dict[websockets.WebSocketServerProtocol, str] = {}
         self.device_info: Dict[str, str] = {}
         self.connection_times: Dict[websockets.WebSocketServerProtocol, float] = {}
+        self.last_message_times: Dict[websockets.WebSocketServerProtocol, float] = {}
+        self.device_sockets: Dict[str, websockets.WebSocketServerProtocol] = {}
         
-        # Ensure directories exist relative to the script location
-        script_dir = os.path.dirname(os.path.abspath(__file__))
+        # Ensure directories exist relative to the script location (or data_dir)
+        script_dir = data_dir or os.path.dirname(os.path.abspath(__file__))
         self.commands_dir = os.path.join(script_dir, "commands")
         self.logs_dir = os.path.join(script_dir, "logs")
         self.queue_dir = os.path.join(script_dir, "queue")
@@ -161,16 +1424,64 @@ class BiometricServer:
         os.makedirs(self.commands_dir, exist_ok=True)
         os.makedirs(self.logs_dir, exist_ok=True)
         os.makedirs(self.queue_dir, exist_ok=True)
+        self.audit_writer = AuditCsvWriter(self.logs_dir)
+        self._audit_flush_task = None
 
         self.erp_endpoint = _safe_join_url(ERP_URL, ERP_API)
-        
+        self.erp_bulk_endpoint = _safe_join_url(ERP_URL, ERP_BULK_API)
+        self.erp_batcher = ErpBatchForwarder(self._send_batch_to_erp_with_retry)
+        self.http_client = ErpHttpClient()
+        self.circuit_breaker = CircuitBreaker()
+
+        # Workers each own a partition of the queue and ingest log
+        suffix = "" if worker_id is None else f"_w{worker_id}"
+
         # Initialize local queue
-        queue_db_path = os.path.join(self.queue_dir, "failed_requests.db")
+        queue_db_path = os.path.join(self.queue_dir, f"failed_requests{suffix}.db")
         self.local_queue = LocalQueue(queue_db_path)
+        self.ingest_log = IngestLog(os.path.join(self.queue_dir, f"ingest_log{suffix}.db"))
+        # One index for all workers, so replays are caught whichever worker the device reaches
+        self.dedup_index = PunchDedupIndex(os.path.join(self.queue_dir, "seen_punches.db"))
+        self._dedup_prune_task = None
+        if worker_id in (None, 0):
+            self._adopt_stray_partitions(worker_count)
+        self._ingest_wakeup = asyncio.Event()
+        self._ingest_forwarder_task = None
         
         # Start background task for processing failed requests
         self._queue_processor_task = None
 
+        # Registry shared with sibling workers, when running under the supervisor
+        self.control = RegistryControlClient(control_path, worker_id) if control_path else None
+
+        self.metrics = GatewayMetrics()
+        self._metrics_runner: Optional[web.AppRunner] = None
+        self._loop_lag_task = None
+
+    def _adopt_stray_partitions(self, worker_count: int):
+        """Take over queue, ingest log and index files that no running worker owns
+
+        Switching supervisor mode on or off, or lowering WORKER_PROCESSES,
+        leaves rows in files nobody opens any more; the single process or
+        worker 0 moves them into its own partition at startup. Per-worker
+        de-duplication files are merged into the shared index.
+        """
+        worker_suffixes = {""} if self.worker_id is None else {f"_w{i}" for i in range(worker_count)}
+        stores = (
+            (self.local_queue, "failed_requests", worker_suffixes),
+            (self.ingest_log, "ingest_log", worker_suffixes),
+            (self.dedup_index, "seen_punches", {""}),
+        )
+        for store, prefix, owned in stores:
+            for suffix, path in sorted(_partition_files(self.queue_dir, prefix).items()):
+                if suffix in owned:
+                    continue
+                try:
+                    moved = store.adopt(path)
+                    logger.info(f"Adopted {moved} rows from {os.path.basename(path)}")
+                except Exception as e:
+                    logger.error(f"Failed to adopt {os.path.basename(path)}: {e}")
+
     async def register_device(self, websocket, data):
         """Register device with connection limits and validation"""
         try:
@@ -178,13 +1489,34 @@ class BiometricServer:
             if not serial_number:
                 return {"ret": "reg", "result": False, "reason": "Missing serial number"}
 
-            # Check connection limits
-            if len(self.connected_devices) >= MAX_CONNECTIONS:
-                logger.warning(f"Connection limit reached. Rejecting device: {serial_number}")
-                return {"ret": "reg", "result": False, "reason": "Server connection limit reached"}
-
             client_addr = _safe_remote_addr(websocket.remote_address)
+
+            # Check connection limits; a known serial number reuses its slot
+            if self.control:
+                allowed, reason = await self._register_with_supervisor(serial_number, client_addr)
+            else:
+                allowed = serial_number in self.device_sockets or len(self.device_sockets) < MAX_CONNECTIONS
+                reason = "Server connection limit reached"
+
+            if not allowed:
+                logger.warning(f"{reason}. Rejecting device: {serial_number}")
+                return {"ret": "reg", "result": False, "reason": reason}
+
+            # A socket registering under a new serial number gives up its old one
+            previous_serial = self.connected_devices.get(websocket)
+            if previous_serial and previous_serial != serial_number and self.device_sockets.get(previous_serial) is websocket:
+                del self.device_sockets[previous_serial]
+                self.device_info.pop(previous_serial, None)
+
+            # A device that reconnected before its old socket timed out replaces it
+            old_socket = self.device_sockets.get(serial_number)
+            if old_socket is not None and old_socket is not websocket:
+                logger.info(f"Device {serial_number} re-registered, closing previous connection")
+                self._cleanup_device_connection(old_socket)
+                asyncio.create_task(self._close_quietly(old_socket))
+
             self.connected_devices[websocket] = serial_number
+            self.device_sockets[serial_number] = websocket
             self.device_info[serial_number] = client_addr
             self.connection_times[websocket] = time.time()
 
@@ -193,119 +1525,404 @@ class BiometricServer:
             return {
                 "ret": "reg",
                 "result": True,
-                "cloudtime": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "cloudtime": _cloudtime(),
             }
             
         except Exception as e:
             logger.error(f"Error in device registration: {e}")
             return {"ret": "reg", "result": False, "reason": "Registration failed"}
 
-    async def _send_to_erp_with_retry(self, punchingcode: str, name: str, timestamp_str: str, device_id: str) -> bool:
+    async def _register_with_supervisor(self, serial_number: str, client_addr: str) -> Tuple[bool, str]:
+        """Claim a slot in the global registry, falling back to the local limit"""
+        try:
+            reply = await self.control.request("register", sn=serial_number, addr=client_addr)
+            return reply.get("ok", False), reply.get("reason", "")
+        except Exception as e:
+            logger.warning(f"Control channel unavailable, using local connection limit: {e}")
+            return len(self.connected_devices) < MAX_CONNECTIONS, "Server connection limit reached"
+
+    async def _unregister_with_supervisor(self, websocket):
+        serial_number = self.connected_devices.get(websocket)
+        # Sockets already replaced by a re-registration no longer own their serial number
+        if not self.control or not serial_number or self.device_sockets.get(serial_number) is not websocket:
+            return
+        try:
+            await self.control.request("unregister", sn=serial_number)
+        except Exception as e:
+            logger.warning(f"Failed to release {serial_number} with supervisor: {e}")
+
+    async def _send_to_erp_with_retry(self, punch: Punch, device_id: str) -> bool:
         """Send to ERP with retry logic and exponential backoff"""
-        
+        name = punch.name
+
         for attempt in range(MAX_RETRY_ATTEMPTS):
             try:
-                # Parse and validate timestamp
-                try:
-                    timestamp = datetime.strptime(timestamp_str, "%Y-%m-%d %H:%M:%S")
-                except ValueError as e:
-                    logger.error(f"Invalid timestamp format: {timestamp_str} - {e}")
-                    return False
+                if self.circuit_breaker.is_open():
+                    raise CircuitOpenError("ERP circuit open")
 
                 payload = {
-                    "punchingcode": punchingcode,
+                    "punchingcode": punch.enroll_id,
                     "employee_name": name,
-                    "time": timestamp.strftime("%d-%m-%Y %H:%M:%S"),
+                    "time": punch.erp_time,
                     "device_id": device_id,
                 }
 
                 # Make HTTP request with timeout
-                response = await asyncio.to_thread(
-                    self._make_http_request, payload
-                )
+                response = await self._make_http_request(payload)
                 
                 if response['success']:
                     logger.info(f"ERP Checkin log added for {name} at {payload['time']} from {device_id} (attempt {attempt + 1})")
                     return True
+                elif response.get('circuit_open'):
+                    raise CircuitOpenError(response['error'])
                 else:
                     raise Exception(response['error'])
 
             except Exception as e:
                 logger.warning(f"ERP request failed (attempt {attempt + 1}/{MAX_RETRY_ATTEMPTS}): {e}")
                 
-                if attempt == MAX_RETRY_ATTEMPTS - 1:
+                if attempt == MAX_RETRY_ATTEMPTS - 1 or isinstance(e, CircuitOpenError):
                     # Final attempt failed, queue for later
-                    await self.local_queue.add_failed_request(punchingcode, name, timestamp_str, device_id, str(e))
+                    await self.local_queue.add_failed_request(punch.enroll_id, name, punch.timestamp_str, device_id, str(e))
                     logger.error(f"All retry attempts failed for {name}. Added to queue.")
                     return False
                 else:
                     # Wait before retry with exponential backoff
+                    self.metrics.erp_retries += 1
                     delay = RETRY_DELAY_BASE ** (attempt + 1)
                     await asyncio.sleep(delay)
         
         return False
 
-    def _make_http_request(self, payload: Dict) -> Dict:
-        """Blocking HTTP request to be run in thread"""
+    async def _make_http_request(self, payload: Dict) -> Dict:
+        """HTTP request over the shared ERP connection pool"""
+        return await self._post_through_breaker(self.erp_endpoint, payload)
+
+    async def _post_through_breaker(self, url: str, data: Dict) -> Dict:
+        """POST to ERP unless the circuit is open, feeding the outcome back to the breaker"""
+        if not self.circuit_breaker.allow_request():
+            return {'success': False, 'circuit_open': True, 'error': 'ERP circuit open'}
+
+        # While half-open the only request let through is the probe
+        is_probe = self.circuit_breaker.state == CircuitBreaker.HALF_OPEN
+        started = time.perf_counter()
         try:
-            response = requests.post(
-                self.erp_endpoint, 
-                data=payload, 
-                timeout=REQUEST_TIMEOUT
-            )
-            
-            if response.status_code == 200:
-                return {'success': True}
+            response = await self.http_client.post_form(url, data)
+        except asyncio.CancelledError:
+            # A cancelled probe has no outcome; free its slot so the next request can probe
+            if is_probe:
+                self.circuit_breaker.release_probe()
+            raise
+        endpoint = "bulk" if url == self.erp_bulk_endpoint else "single"
+
+        if _is_erp_outage(response):
+            self.circuit_breaker.record_failure()
+            result = "outage"
+        else:
+            self.circuit_breaker.record_success()
+            result = "success" if response['success'] else "error"
+
+        self.metrics.observe_erp_request(endpoint, result, time.perf_counter() - started)
+        return response
+
+    async def _post_checkin_batch(self, items: List[Dict]) -> List[Optional[str]]:
+        """One bulk ERP attempt; returns None or the rejection error per item
+
+        Raises when the call itself fails, so callers can tell an ERP outage
+        apart from individual records being rejected.
+        """
+        checkins = [
+            {
+                "punchingcode": item["punchingcode"],
+                "employee_name": item["employee_name"],
+                "time": item["time"],
+                "device_id": item["device_id"],
+            }
+            for item in items
+        ]
+
+        response = await self._make_bulk_http_request(checkins)
+        if response.get('circuit_open'):
+            raise CircuitOpenError(response['error'])
+        if not response['success']:
+            raise Exception(response['error'])
+
+        item_results = response['results']
+        if not isinstance(item_results, list) or len(item_results) != len(items):
+            raise Exception(f"Unexpected bulk response for {len(items)} records: {str(item_results)[:200]}")
+
+        errors = []
+        for item_result in item_results:
+            if isinstance(item_result, dict) and item_result.get("status") == "success":
+                errors.append(None)
             else:
-                return {
-                    'success': False, 
-                    'error': f"HTTP {response.status_code}: {response.text[:200]}"
-                }
-                
-        except requests.exceptions.Timeout:
-            return {'success': False, 'error': 'Request timeout'}
-        except requests.exceptions.ConnectionError:
-            return {'success': False, 'error': 'Connection error'}
-        except Exception as e:
-            return {'success': False, 'error': str(e)}
+                error = item_result.get("error") if isinstance(item_result, dict) else item_result
+                errors.append(str(error))
+        return errors
 
-    async def store_attendance(self, records, device_id):
-        """Store attendance with improved error handling"""
-        if not records:
-            return {"ret": "sendlog", "result": False, "reason": "No records provided"}
+    async def _send_batch_to_erp_with_retry(self, items: List[Dict]) -> List[Optional[bool]]:
+        """Send a batch to the bulk ERP endpoint, queueing whatever fails
 
-        processed_count = 0
-        failed_count = 0
+        True sent, False queued, None could be neither sent nor queued.
+        """
+        for attempt in range(MAX_RETRY_ATTEMPTS):
+            try:
+                errors = await self._post_checkin_batch(items)
+                break
 
-        for record in records:
+            except Exception as e:
+                logger.warning(f"Bulk ERP request failed (attempt {attempt + 1}/{MAX_RETRY_ATTEMPTS}): {e}")
+
+                if attempt == MAX_RETRY_ATTEMPTS - 1 or isinstance(e, CircuitOpenError):
+                    try:
+                        await self.local_queue.add_failed_requests([
+                            (item["punchingcode"], item["employee_name"], item["timestamp_str"], item["device_id"], str(e))
+                            for item in items
+                        ])
+                    except Exception:
+                        return [None] * len(items)
+                    logger.error(f"All retry attempts failed for batch of {len(items)}. Added to queue.")
+                    return [False] * len(items)
+
+                self.metrics.erp_retries += 1
+                delay = RETRY_DELAY_BASE ** (attempt + 1)
+                await asyncio.sleep(delay)
+
+        results = []
+        rejected = []
+        for item, error in zip(items, errors):
+            if error is None:
+                logger.info(f"ERP Checkin log added for {item['employee_name']} at {item['time']} from {item['device_id']}")
+                results.append(True)
+            else:
+                logger.warning(f"ERP rejected checkin for {item['employee_name']} at {item['time']}: {error}")
+                rejected.append(
+                    (item["punchingcode"], item["employee_name"], item["timestamp_str"], item["device_id"], error)
+                )
+                results.append(False)
+
+        try:
+            await self.local_queue.add_failed_requests(rejected)
+        except Exception:
+            # Rejected records that could not be queued were neither sent nor queued
+            results = [None if result is False else result for result in results]
+        return results
+
+    async def _make_bulk_http_request(self, checkins: List[Dict]) -> Dict:
+        """Bulk HTTP request over the shared ERP connection pool"""
+        response = await self._post_through_breaker(self.erp_bulk_endpoint, {"checkins": _json_dumps(checkins)})
+        if not response['success']:
+            return response
+
+        try:
+            return {'success': True, 'results': _json_loads(response['body']).get("message")}
+        except (ValueError, *_JSON_DECODE_ERRORS) as e:
+            return {'success': False, 'error': f"Invalid JSON response: {e}"}
+
+    @staticmethod
+    def _build_checkin_item(punch: Punch, device_id: str) -> Dict:
+        """Build a bulk checkin item"""
+        return {
+            "punchingcode": punch.enroll_id,
+            "employee_name": punch.name,
+            "timestamp_str": punch.timestamp_str,
+            "time": punch.erp_time,
+            "device_id": device_id,
+        }
+
+    async def _forward_batched(self, valid_records: List[Punch], device_id: str,
+                               priority: int = PRIORITY_LIVE) -> List[Optional[bool]]:
+        """Forward a frame's records through the shared bulk batcher"""
+        if self.circuit_breaker.is_open():
+            # ERP is down: queue straight away so the device is acked without waiting
             try:
-                name = record.get("name")
-                enroll_id = record.get("enrollid")
-                timestamp = record.get("time")
+                await self.local_queue.add_failed_requests([
+                    (punch.enroll_id, punch.name, punch.timestamp_str, device_id, "ERP circuit open")
+                    for punch in valid_records
+                ])
+            except Exception:
+                return [None] * len(valid_records)
+            return [False] * len(valid_records)
 
-                if not enroll_id or not timestamp or not name:
-                    logger.warning(f"Malformed record skipped: {record}")
-                    continue
+        items = [self._build_checkin_item(punch, device_id) for punch in valid_records]
+        return await self.erp_batcher.submit(items, device_id, priority)
+
+    async def _forward_records(self, valid_records: List[Punch], device_id: str,
+                               priority: int = PRIORITY_LIVE) -> List[Optional[bool]]:
+        """Forward records to ERP; True sent, False queued, None errored"""
+        if ERP_BATCH_ENABLED:
+            return await self._forward_batched(valid_records, device_id, priority)
 
+        results = []
+        for punch in valid_records:
+            try:
                 # Send to ERP with retry logic
-                success = await self._send_to_erp_with_retry(enroll_id, name, timestamp, device_id)
-                
-                if success:
+                results.append(await self._send_to_erp_with_retry(punch, device_id))
+            except Exception as e:
+                logger.error(f"Error processing attendance record: {e}")
+                results.append(None)
+        return results
+
+    async def _log_outcomes(self, valid_records: List[Punch], results: List[Optional[bool]], device_id: str) -> Tuple[int, int]:
+        """Write forwarding outcomes to the CSV audit log; returns (processed, failed)"""
+        self.metrics.count_outcomes(results)
+        processed_count = 0
+        failed_count = 0
+
+        for punch, success in zip(valid_records, results):
+            try:
+                if success is None:
+                    failed_count += 1
+                    continue
+                elif success:
                     processed_count += 1
                     status = "Success"
                 else:
                     failed_count += 1
                     status = "Queued for retry"
-                
+
                 # Log to CSV (always log, regardless of ERP status)
-                await asyncio.to_thread(
-                    log_attendance_to_csv, enroll_id, name, device_id, status, timestamp
-                )
+                await self.audit_writer.write(punch, device_id, status)
 
             except Exception as e:
                 logger.error(f"Error processing attendance record: {e}")
                 failed_count += 1
 
+        return processed_count, failed_count
+
+    async def forward_ingest_log(self):
+        """Background task streaming the ingest log to ERP from the last checkpoint"""
+        logger.info("Started ingest log forwarder")
+
+        while True:
+            try:
+                rows = await self.ingest_log.read_after_checkpoint(INGEST_FORWARD_BATCH)
+
+                if not rows:
+                    self._ingest_wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._ingest_wakeup.wait(), timeout=INGEST_IDLE_INTERVAL)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                by_device: Dict[str, List[Tuple[int, Punch]]] = {}
+                for row in rows:
+                    punch = _make_punch(row['punchingcode'], row['employee_name'], row['timestamp_str'])
+                    if punch is not None:
+                        by_device.setdefault(row['device_id'], []).append((row['seq'], punch))
+
+                held_seqs: List[int] = []
+
+                async def _forward_device(device_id: str, device_rows: List[Tuple[int, Punch]]):
+                    device_records = [punch for _, punch in device_rows]
+                    results = await self._forward_records(device_records, device_id)
+                    # Rows that reached neither ERP nor LocalQueue stay in the log
+                    held_seqs.extend(seq for (seq, _), success in zip(device_rows, results) if success is None)
+                    return await self._log_outcomes(device_records, results, device_id)
+
+                outcomes = await asyncio.gather(*(
+                    _forward_device(device_id, device_rows) for device_id, device_rows in by_device.items()
+                ))
+
+                if held_seqs:
+                    # The checkpoint stops before the first held row; rows after it that
+                    # were delivered or queued are dropped individually
+                    first_held = min(held_seqs)
+                    held = set(held_seqs)
+                    await self.ingest_log.checkpoint(first_held - 1, [
+                        row['seq'] for row in rows if row['seq'] > first_held and row['seq'] not in held
+                    ])
+                else:
+                    # Every row is now in ERP or LocalQueue, so the checkpoint can move past it
+                    await self.ingest_log.checkpoint(rows[-1]['seq'])
+
+                processed_count = sum(processed for processed, _ in outcomes)
+                failed_count = sum(failed for _, failed in outcomes)
+                logger.info(f"Forwarded {len(rows)} logged records: {processed_count} success, {failed_count} failed/queued")
+
+                if held_seqs:
+                    logger.warning(f"{len(held_seqs)} logged records could not be sent or queued, keeping them for retry")
+                    await asyncio.sleep(INGEST_IDLE_INTERVAL)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in ingest log forwarder: {e}")
+                await asyncio.sleep(INGEST_IDLE_INTERVAL)
+
+    async def store_attendance(self, records, device_id, replay: bool = False):
+        """Store attendance with improved error handling
+
+        replay marks getalllog history, which yields to live punches and is
+        refused with a busy reply while too much of it is already waiting.
+        """
+        if not records:
+            return {"ret": "sendlog", "result": False, "reason": "No records provided"}
+
+        valid_records = []
+        for record in records:
+            name = record.get("name")
+            enroll_id = record.get("enrollid")
+            timestamp = record.get("time")
+
+            if not enroll_id or not timestamp or not name:
+                logger.warning(f"Malformed record skipped: {record}")
+                continue
+
+            punch = _make_punch(enroll_id, name, timestamp)
+            if punch is None:
+                logger.error(f"Invalid timestamp format, record skipped: {record}")
+                continue
+
+            valid_records.append(punch)
+
+        self.metrics.count_records(device_id, len(valid_records))
+
+        if DEDUP_ENABLED:
+            received_count = len(valid_records)
+            valid_records = await self.dedup_index.filter_new(device_id, valid_records)
+            duplicate_count = received_count - len(valid_records)
+            if duplicate_count:
+                self.metrics.duplicates_dropped += duplicate_count
+                logger.info(f"Dropped {duplicate_count} already-seen records from {device_id}")
+
+        try:
+            return await self._accept_records(valid_records, device_id, replay)
+        finally:
+            if DEDUP_ENABLED:
+                # Punches marked seen stay dropped through the index; the rest may come back
+                self.dedup_index.release(device_id, valid_records)
+
+    async def _accept_records(self, valid_records: List[Punch], device_id: str, replay: bool):
+        """Log or forward a frame's new records and build the device reply"""
+        if not valid_records:
+            return {"ret": "sendlog", "result": True, "processed": 0, "failed": 0, "cloudtime": _cloudtime()}
+
+        if INGEST_ACK_FIRST:
+            return await self._ingest_attendance(valid_records, device_id)
+
+        if replay and ERP_BATCH_ENABLED and not self.erp_batcher.accepts_replay(len(valid_records)):
+            # Unacked history is resent by the device, so it can simply come back later
+            self.metrics.flow_control_rejections += 1
+            logger.warning(f"Replay buffer full, asking {device_id} to resend {len(valid_records)} records later")
+            return {
+                "ret": "sendlog",
+                "result": False,
+                "reason": "Server busy, retry later",
+                "cloudtime": _cloudtime(),
+            }
+
+        priority = PRIORITY_REPLAY if replay else PRIORITY_LIVE
+        results = await self._forward_records(valid_records, device_id, priority)
+        processed_count, failed_count = await self._log_outcomes(valid_records, results, device_id)
+
+        if DEDUP_ENABLED:
+            # Sent or queued punches are safe to drop on replay; errored ones must come back
+            await self.dedup_index.mark_seen(device_id, [
+                punch for punch, success in zip(valid_records, results) if success is not None
+            ])
+
         logger.info(f"Attendance processing complete: {processed_count} success, {failed_count} failed/queued")
 
         return {
@@ -313,10 +1930,34 @@ class BiometricServer:
             "result": True,
             "processed": processed_count,
             "failed": failed_count,
-            "cloudtime": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "cloudtime": _cloudtime(),
         }
    
 
+    async def _ingest_attendance(self, valid_records: List[Punch], device_id: str):
+        """Durably log a frame and ack it; forward_ingest_log delivers it to ERP"""
+        try:
+            await self.ingest_log.append([
+                (punch.enroll_id, punch.name, punch.timestamp_str, device_id) for punch in valid_records
+            ])
+        except Exception as e:
+            logger.error(f"Failed to write {len(valid_records)} records to ingest log: {e}")
+            return {"ret": "sendlog", "result": False, "reason": "Failed to store records"}
+
+        if DEDUP_ENABLED:
+            await self.dedup_index.mark_seen(device_id, valid_records)
+
+        self._ingest_wakeup.set()
+        logger.info(f"Logged {len(valid_records)} records from {device_id} for forwarding")
+
+        return {
+            "ret": "sendlog",
+            "result": True,
+            "processed": len(valid_records),
+            "failed": 0,
+            "cloudtime": _cloudtime(),
+        }
+
     async def handle_user_enrollment(self, data, device_id):
         """Handle user enrollment/fingerprint data from devices"""
         try:
@@ -341,7 +1982,7 @@ class BiometricServer:
             return {
                 "ret": "senduser",
                 "result": True,
-                "cloudtime": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "cloudtime": _cloudtime(),
             }
             
         except Exception as e:
@@ -356,8 +1997,8 @@ class BiometricServer:
         try:
             # Validate JSON
             try:
-                data = json.loads(message)
-            except json.JSONDecodeError as e:
+                data = _json_loads(message)
+            except _JSON_DECODE_ERRORS as e:
                 logger.error(f"JSON decode error from {_safe_remote_addr(websocket.remote_address)}: {e}")
                 return {"ret": "error", "result": False, "reason": "Invalid JSON format"}
 
@@ -369,16 +2010,17 @@ class BiometricServer:
                     "ret": "error",
                     "result": False,
                     "reason": "Missing 'cmd' field",
-                    "cloudtime": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    "cloudtime": _cloudtime(),
                 }
 
             cmd = data["cmd"]
+            self.metrics.count_frame(cmd)
 
             # Route commands
             if cmd == "reg":
                 return await self.register_device(websocket, data)
             elif cmd in ("sendlog", "getalllog"):
-                return await self.store_attendance(data.get("record", []), device_id)
+                return await self.store_attendance(data.get("record", []), device_id, replay=cmd == "getalllog")
             elif cmd == "senduser":
                 return await self.handle_user_enrollment(data, device_id)
             else:
@@ -387,7 +2029,7 @@ class BiometricServer:
                     "ret": cmd,
                     "result": False,
                     "reason": "Unknown command",
-                    "cloudtime": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    "cloudtime": _cloudtime(),
                 }
 
         except Exception as e:
@@ -396,50 +2038,56 @@ class BiometricServer:
                 "ret": "error",
                 "result": False,
                 "reason": "Internal server error",
-                "cloudtime": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "cloudtime": _cloudtime(),
             }
 
-    # async def cleanup_stale_connections(self):
-    #     """Remove connections that have been idle too long"""
-    #     current_time = time.time()
-    #     stale_connections = []
-        
-    #     for websocket, connect_time in self.connection_times.items():
-    #         if current_time - connect_time > CONNECTION_TIMEOUT:
-    #             stale_connections.append(websocket)
-        
-    #     for websocket in stale_connections:
-    #         try:
-    #             await websocket.close()
-    #             logger.info("Closed stale connection")
-    #         except:
-    #             pass  # Connection might already be closed
-    #         finally:
-    #             self._cleanup_device_connection(websocket)
-
-    # def _cleanup_device_connection(self, websocket):
-    #     """Clean up device connection data"""
-    #     if websocket in self.connected_devices:
-    #         serial = self.connected_devices[websocket]
-    #         del self.connected_devices[websocket]
-    #         if serial in self.device_info:
-    #             del self.device_info[serial]
-        
-    #     if websocket in self.connection_times:
-    #         del self.connection_times[websocket]
+    async def cleanup_stale_connections(self):
+        """Close connections that have not sent a message for CONNECTION_TIMEOUT"""
+        current_time = time.time()
+        stale_connections = [
+            websocket for websocket, last_message in self.last_message_times.items()
+            if current_time - last_message > CONNECTION_TIMEOUT
+        ]
+
+        for websocket in stale_connections:
+            serial_number = self.connected_devices.get(websocket, "unregistered")
+            logger.info(f"Closing idle connection {serial_number} from {_safe_remote_addr(websocket.remote_address)}")
+            await self._unregister_with_supervisor(websocket)
+            self._cleanup_device_connection(websocket)
+            await self._close_quietly(websocket)
+
+        return len(stale_connections)
+
+    def _cleanup_device_connection(self, websocket):
+        """Clean up device connection data"""
+        serial = self.connected_devices.pop(websocket, None)
+        if serial is not None and self.device_sockets.get(serial) is websocket:
+            del self.device_sockets[serial]
+            self.device_info.pop(serial, None)
+
+        self.connection_times.pop(websocket, None)
+        self.last_message_times.pop(websocket, None)
+
+    @staticmethod
+    async def _close_quietly(websocket):
+        try:
+            await asyncio.wait_for(websocket.close(), timeout=REQUEST_TIMEOUT)
+        except Exception:
+            pass  # Connection might already be closed
 
     async def handle_device(self, websocket, path=None):
         """Handle device connection with proper cleanup"""
         client_addr = _safe_remote_addr(websocket.remote_address)
         logger.info(f"Device connected: {client_addr}")
+        self.last_message_times[websocket] = time.time()
 
-        
         try:
             async for message in websocket:
+                self.last_message_times[websocket] = time.time()
                 try:
                     response = await self.process_message(websocket, message)
                     if response:
-                        await websocket.send(json.dumps(response))
+                        await websocket.send(_json_dumps(response))
                 except Exception as e:
                     logger.error(f"Error handling message from {client_addr}: {e}")
                     # Try to send error response
@@ -449,7 +2097,7 @@ class BiometricServer:
                             "result": False,
                             "reason": "Message processing failed"
                         }
-                        await websocket.send(json.dumps(error_response))
+                        await websocket.send(_json_dumps(error_response))
                     except:
                         break  # Connection is likely broken
 
@@ -460,61 +2108,188 @@ class BiometricServer:
         except Exception as e:
             logger.error(f"Unhandled connection error from {client_addr}: {e}")
         finally:
-            # self._cleanup_device_connection(websocket)
+            await self._unregister_with_supervisor(websocket)
+            self._cleanup_device_connection(websocket)
             logger.info(f"Device disconnected and cleaned up: {client_addr}")
 
+    async def _drain_queued_batch(self, pending: List[Dict], semaphore: asyncio.Semaphore) -> Tuple[List[int], Dict[str, List[int]], bool]:
+        """Send one batch of queued rows with bounded parallelism
+
+        Returns (succeeded ids, failed ids grouped by error, whether ERP itself
+        was unreachable). Every row gets a single attempt here; retry timing is
+        owned by the queue's per-row backoff. Rows skipped because the circuit
+        is open are left untouched, without using up a retry.
+        """
+        succeeded_ids: List[int] = []
+        failed: Dict[str, List[int]] = {}
+        erp_down = False
+
+        def _record(request_id: int, error: Optional[str]):
+            if error is None:
+                succeeded_ids.append(request_id)
+            else:
+                failed.setdefault(error, []).append(request_id)
+
+        async def _send_chunk(chunk: List[Dict]):
+            nonlocal erp_down
+            items = []
+            for request in chunk:
+                punch = _make_punch(request['punchingcode'], request['employee_name'], request['timestamp_str'])
+                if punch is None:
+                    _record(request['id'], "Invalid timestamp format")
+                else:
+                    items.append((request['id'], self._build_checkin_item(punch, request['device_id'])))
+
+            if not items:
+                return
+
+            async with semaphore:
+                try:
+                    if ERP_BATCH_ENABLED:
+                        errors = await self._post_checkin_batch([item for _, item in items])
+                    else:
+                        # Without batching every chunk holds a single row
+                        item = items[0][1]
+                        response = await self._make_http_request({
+                            "punchingcode": item["punchingcode"],
+                            "employee_name": item["employee_name"],
+                            "time": item["time"],
+                            "device_id": item["device_id"],
+                        })
+                        if response.get('circuit_open'):
+                            raise CircuitOpenError(response['error'])
+                        if _is_erp_outage(response):
+                            raise Exception(response['error'])
+                        errors = [None if response['success'] else response['error']]
+                except CircuitOpenError:
+                    erp_down = True
+                    return
+                except Exception as e:
+                    erp_down = True
+                    errors = [str(e)] * len(items)
+
+            for (request_id, _), error in zip(items, errors):
+                _record(request_id, error)
+
+        chunk_size = ERP_BATCH_MAX_SIZE if ERP_BATCH_ENABLED else 1
+        await asyncio.gather(*(
+            _send_chunk(pending[i:i + chunk_size]) for i in range(0, len(pending), chunk_size)
+        ))
+
+        return succeeded_ids, failed, erp_down
+
     async def process_queued_requests(self):
-        """Background task to process queued failed requests"""
+        """Background task to process queued failed requests
+
+        Runs continuously while due rows remain, growing the batch size while
+        ERP keeps up and backing off only when ERP itself is failing.
+        """
         logger.info("Started background queue processor")
+
+        semaphore = asyncio.Semaphore(QUEUE_DRAIN_CONCURRENCY)
+        batch_size = QUEUE_BATCH_MIN
+        failure_delay = 0
         
         while True:
             try:
-                # Get pending requests
-                pending = await self.local_queue.get_pending_requests(limit=5)
+                # Get requests that are due for another attempt
+                pending = await self.local_queue.get_pending_requests(limit=batch_size)
                 
                 if not pending:
-                    await asyncio.sleep(30)  # Wait 30 seconds before checking again
+                    await asyncio.sleep(QUEUE_IDLE_INTERVAL)
                     continue
 
                 logger.info(f"Processing {len(pending)} queued requests")
 
-                for request in pending:
-                    try:
-                        success = await self._send_to_erp_with_retry(
-                            request['punchingcode'],
-                            request['employee_name'], 
-                            request['timestamp_str'],
-                            request['device_id']
-                        )
-                        
-                        if success:
-                            await self.local_queue.remove_request(request['id'])
-                            logger.info(f"Successfully processed queued request ID: {request['id']}")
-                        else:
-                            await self.local_queue.update_retry_count(
-                                request['id'], "Retry failed"
-                            )
-                            
-                    except Exception as e:
-                        logger.error(f"Error processing queued request {request['id']}: {e}")
-                        await self.local_queue.update_retry_count(request['id'], str(e))
-
-                # Wait before next batch
-                await asyncio.sleep(60)  # Process queue every minute
+                succeeded_ids, failed, erp_down = await self._drain_queued_batch(pending, semaphore)
+
+                await self.local_queue.remove_requests(succeeded_ids)
+                for error, request_ids in failed.items():
+                    await self.local_queue.update_retry_counts(request_ids, error)
+
+                failed_count = sum(len(request_ids) for request_ids in failed.values())
+                self.metrics.queue_rescheduled += failed_count
+                logger.info(f"Queue batch complete: {len(succeeded_ids)} sent, {failed_count} rescheduled")
+
+                if erp_down:
+                    # ERP is failing: shrink the batch and wait before the next poll
+                    batch_size = max(batch_size // 2, QUEUE_BATCH_MIN)
+                    failure_delay = min(max(failure_delay * 2, RETRY_DELAY_BASE), QUEUE_FAILURE_BACKOFF_MAX)
+                    logger.warning(f"ERP unavailable while draining queue, backing off {failure_delay}s")
+                    await asyncio.sleep(failure_delay)
+                else:
+                    # ERP is healthy: grow the batch once a full batch went through
+                    failure_delay = 0
+                    if len(pending) == batch_size:
+                        batch_size = min(batch_size * 2, QUEUE_BATCH_MAX)
                 
             except Exception as e:
                 logger.error(f"Error in queue processor: {e}")
                 await asyncio.sleep(60)
 
-    # async def periodic_cleanup(self):
-    #     """Periodic maintenance tasks"""
-    #     while True:
-    #         try:
-    #             await asyncio.sleep(300)  # Every 5 minutes
-    #             await self.cleanup_stale_connections()
-    #             logger.debug(f"Active connections: {len(self.connected_devices)}")
-    #         except Exception as e:
-    #             logger.error(f"Error in periodic cleanup: {e}")
+    async def periodic_cleanup(self):
+        """Periodic maintenance tasks"""
+        while True:
+            try:
+                await asyncio.sleep(CLEANUP_INTERVAL)
+                reaped = await self.cleanup_stale_connections()
+                logger.debug(f"Active connections: {len(self.last_message_times)}, reaped {reaped}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in periodic cleanup: {e}")
+
+    async def monitor_loop_lag(self):
+        """Background task measuring how late the event loop wakes a sleeping task"""
+        loop = asyncio.get_running_loop()
+        while True:
+            scheduled = loop.time() + LOOP_LAG_INTERVAL
+            await asyncio.sleep(LOOP_LAG_INTERVAL)
+            self.metrics.observe_loop_lag(max(loop.time() - scheduled, 0.0))
+
+    async def _collect_gauges(self) -> Dict[str, Tuple[str, float]]:
+        """Point-in-time values read when metrics are scraped"""
+        gauges = {
+            "biometric_connected_devices": ("Devices registered on this process", len(self.connected_devices)),
+            "biometric_local_queue_depth": ("Requests waiting in the local retry queue", await self.local_queue.count()),
+            "biometric_local_queue_oldest_age_seconds": (
+                "Age of the oldest request in the local retry queue", await self.local_queue.oldest_age()
+            ),
+            "biometric_records_queued_total": ("Records added to the local retry queue", self.local_queue.enqueued_total),
+            "biometric_records_dead_lettered_total": (
+                "Queued requests moved to the dead-letter table", self.local_queue.dead_lettered_total
+            ),
+            "biometric_forwarder_live_queued": (
+                "Live records waiting for a bulk ERP call", self.erp_batcher.queued(PRIORITY_LIVE)
+            ),
+            "biometric_forwarder_replay_queued": (
+                "Replayed records waiting for a bulk ERP call", self.erp_batcher.queued(PRIORITY_REPLAY)
+            ),
+            "biometric_erp_circuit_open": ("1 while the ERP circuit breaker is open", int(self.circuit_breaker.is_open())),
+            "biometric_event_loop_lag_last_seconds": ("Most recent event-loop lag probe", self.metrics.last_loop_lag),
+        }
+        if INGEST_ACK_FIRST:
+            gauges["biometric_ingest_log_depth"] = (
+                "Acknowledged records not yet forwarded to ERP", await self.ingest_log.count()
+            )
+        return gauges
+
+    async def _handle_metrics(self, request: web.Request) -> web.Response:
+        body = self.metrics.render(await self._collect_gauges())
+        return web.Response(text=body, content_type="text/plain", charset="utf-8")
+
+    async def start_metrics_server(self):
+        """Serve /metrics from this event loop; failures leave the gateway running"""
+        port = METRICS_PORT + (self.worker_id or 0)
+        try:
+            app = web.Application()
+            app.router.add_get("/metrics", self._handle_metrics)
+            self._metrics_runner = web.AppRunner(app, access_log=None)
+            await self._metrics_runner.setup()
+            await web.TCPSite(self._metrics_runner, METRICS_HOST, port).start()
+            logger.info(f"Metrics available on http://{METRICS_HOST}:{port}/metrics")
+        except Exception as e:
+            logger.error(f"Failed to start metrics server on port {port}: {e}")
 
     async def start_server(self):
         """Start server with background tasks"""
@@ -522,7 +2297,15 @@ class BiometricServer:
         
         # Start background tasks
         self._queue_processor_task = asyncio.create_task(self.process_queued_requests())
-        # cleanup_task = asyncio.create_task(self.periodic_cleanup())
+        if INGEST_ACK_FIRST:
+            self._ingest_forwarder_task = asyncio.create_task(self.forward_ingest_log())
+        self._audit_flush_task = asyncio.create_task(self.audit_writer.run_periodic_flush())
+        if DEDUP_ENABLED:
+            self._dedup_prune_task = asyncio.create_task(self.dedup_index.run_periodic_prune())
+        if METRICS_ENABLED:
+            await self.start_metrics_server()
+            self._loop_lag_task = asyncio.create_task(self.monitor_loop_lag())
+        cleanup_task = asyncio.create_task(self.periodic_cleanup())
         
         try:
             async with websockets.serve(
@@ -530,8 +2313,10 @@ class BiometricServer:
                 self.host, 
                 self.port,
                 max_size=1000000,  # 1MB message limit
+                max_queue=DEVICE_INBOUND_FRAMES,  # reads pause while a device's frames are unprocessed
                 ping_interval=30,   # Send ping every 30 seconds
-                ping_timeout=10     # Wait 10 seconds for pong
+                ping_timeout=10,    # Wait 10 seconds for pong
+                reuse_port=self.worker_id is not None,  # workers share the port
             ):
                 logger.info(f"Server listening on {self.host}:{self.port}")
                 logger.info(f"Max connections: {MAX_CONNECTIONS}")
@@ -547,41 +2332,201 @@ class BiometricServer:
             # Cancel background tasks
             if self._queue_processor_task:
                 self._queue_processor_task.cancel()
-            # cleanup_task.cancel()
+            if self._ingest_forwarder_task:
+                # Unforwarded rows stay in the ingest log and resume on restart
+                self._ingest_forwarder_task.cancel()
+            cleanup_task.cancel()
+            await self.erp_batcher.flush()
+            if self._audit_flush_task:
+                self._audit_flush_task.cancel()
+            await self.audit_writer.close()
+            if self._loop_lag_task:
+                self._loop_lag_task.cancel()
+            if self._metrics_runner:
+                await self._metrics_runner.cleanup()
+            await self.http_client.close()
+            self.local_queue.close()
+            self.ingest_log.close()
+            if self._dedup_prune_task:
+                self._dedup_prune_task.cancel()
+            self.dedup_index.close()
+            if self.control:
+                await self.control.close()
+
+
+class AuditCsvWriter:
+    """Buffered writer for the monthly CSV audit log
 
+    Rows are buffered in memory and written on a size or time threshold, or
+    on shutdown. The current month's file stays open between flushes and is
+    rotated when rows for a newer month arrive; rows for older months (from
+    getalllog replays) are appended to their own file and that file closed.
+    """
 
-def log_attendance_to_csv(enroll_id, name, device_id, status, timestamp_str):
-    """Log attendance to CSV with error handling"""
+    HEADER = ["Timestamp", "Enroll ID", "Name", "Device ID", "ERP Status"]
+
+    def __init__(self, log_dir: str, flush_rows: int = AUDIT_FLUSH_ROWS,
+                 flush_interval: float = AUDIT_FLUSH_INTERVAL):
+        self.log_dir = log_dir
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self._buffers: Dict[str, List[List]] = {}
+        self._buffered = 0
+        self._month: Optional[str] = None
+        self._handle = None
+        self._flush_lock = asyncio.Lock()
+
+    async def write(self, punch: Punch, device_id, status):
+        """Buffer one audit row, flushing once the buffer is full"""
+        # Punch timestamps are already validated, so the month is a prefix slice
+        self._buffers.setdefault(punch.timestamp_str[:7], []).append([
+            punch.timestamp_str,
+            punch.enroll_id,
+            punch.name,
+            device_id,
+            status,
+        ])
+        self._buffered += 1
+
+        if self._buffered >= self.flush_rows:
+            await self.flush()
+
+    async def flush(self):
+        """Write all buffered rows"""
+        async with self._flush_lock:
+            buffers, self._buffers = self._buffers, {}
+            self._buffered = 0
+            if buffers:
+                await asyncio.to_thread(self._write_buffers, buffers)
+
+    def _write_buffers(self, buffers: Dict[str, List[List]]):
+        for month in sorted(buffers):
+            try:
+                if self._month is None or month >= self._month:
+                    if month != self._month:
+                        self._rotate(month)
+                    self._handle.write(self._render(buffers[month]))
+                    self._handle.flush()
+                else:
+                    with self._open(month) as f:
+                        f.write(self._render(buffers[month]))
+            except Exception as e:
+                logger.error(f"Failed to log {len(buffers[month])} rows to CSV for {month}: {e}")
+
+    @staticmethod
+    def _render(rows: List[List]) -> str:
+        # One write per flush keeps rows whole when several workers append to the same file
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        return buffer.getvalue()
+
+    def _open(self, month: str):
+        filepath = os.path.join(self.log_dir, month + ".csv")
+        f = open(filepath, mode="a", newline="", encoding="utf-8")
+        if f.tell() == 0:
+            csv.writer(f).writerow(self.HEADER)
+        return f
+
+    def _rotate(self, month: str):
+        if self._handle:
+            self._handle.close()
+            self._handle = None
+        self._handle = self._open(month)
+        self._month = month
+
+    async def run_periodic_flush(self):
+        """Background task flushing buffered rows every flush_interval seconds"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing CSV audit log: {e}")
+
+    async def close(self):
+        """Flush remaining rows and close the open file"""
+        await self.flush()
+        if self._handle:
+            self._handle.close()
+            self._handle = None
+            self._month = None
+
+
+def _run_worker(worker_id: int, control_path: str, worker_count: int):
+    """Entry point of one worker process"""
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    server = BiometricServer(HOST, PORT, worker_id=worker_id, control_path=control_path, worker_count=worker_count)
     try:
-        try:
-            punch_time = datetime.strptime(timestamp_str, "%Y-%m-%d %H:%M:%S")
-        except ValueError:
-            punch_time = datetime.now()
+        asyncio.run(server.start_server())
+    except KeyboardInterrupt:
+        pass
 
-        filename = punch_time.strftime("%Y-%m") + ".csv"
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        log_dir = os.path.join(script_dir, "logs")
-        
-        filepath = os.path.join(log_dir, filename)
-        file_exists = os.path.isfile(filepath)
-
-        with open(filepath, mode="a", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            if not file_exists:
-                writer.writerow(["Timestamp", "Enroll ID", "Name", "Device ID", "ERP Status"])
-            writer.writerow([
-                punch_time.strftime("%Y-%m-%d %H:%M:%S"),
-                enroll_id,
-                name,
-                device_id,
-                status,
-            ])
-    except Exception as e:
-        logger.error(f"Failed to log to CSV: {e}")
+
+async def _supervise(worker_count: int, control_path: str):
+    """Run the control channel and keep worker_count workers alive"""
+    control = RegistryControlServer(control_path)
+    await control.start()
+
+    # spawn rather than fork: the supervisor already has a running event loop
+    context = multiprocessing.get_context("spawn")
+    workers: Dict[int, multiprocessing.Process] = {}
+
+    def _start(worker_id: int):
+        process = context.Process(target=_run_worker, args=(worker_id, control_path, worker_count), daemon=False)
+        process.start()
+        workers[worker_id] = process
+        logger.info(f"Started worker {worker_id} (pid {process.pid})")
+
+    # Stop on SIGINT/SIGTERM without tearing down the loop the shutdown runs on
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    try:
+        for worker_id in range(worker_count):
+            _start(worker_id)
+
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=WORKER_RESTART_DELAY)
+                break
+            except asyncio.TimeoutError:
+                pass
+
+            for worker_id, process in list(workers.items()):
+                if not process.is_alive():
+                    logger.warning(f"Worker {worker_id} exited with code {process.exitcode}, restarting")
+                    _start(worker_id)
+    finally:
+        # Let workers flush their batches and audit buffers before exiting
+        for process in workers.values():
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGINT)
+        for process in workers.values():
+            await asyncio.to_thread(process.join, 10)
+            if process.is_alive():
+                process.terminate()
+        await control.close()
+        logger.info("Supervisor stopped")
+
+
+def run_supervisor(worker_count: int = WORKER_PROCESSES):
+    """Run worker_count gateway processes sharing PORT via SO_REUSEPORT"""
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    control_path = os.path.join(script_dir, "queue", "control.sock")
+    os.makedirs(os.path.dirname(control_path), exist_ok=True)
+
+    logger.info(f"Supervisor starting {worker_count} workers on {HOST}:{PORT}")
+    asyncio.run(_supervise(worker_count, control_path))
 
 
 def main():
     """Main function with graceful shutdown"""
+    if WORKER_PROCESSES > 1:
+        run_supervisor(WORKER_PROCESSES)
+        return
+
     server = BiometricServer(HOST, PORT)
     
     try:
@@ -0,0 +1,99 @@
+from datetime import datetime
+
+import frappe
+import pytz
+from frappe.utils import cint
+
+from task_manager.services.attendance_cache import get_last_punches, record_last_punch, resequence_employee_day
+from task_manager.services.attendance_summary import refresh_daily_summaries
+
+
+# Shared by the add_checkins endpoints of the biometric API modules: Employee
+# Checkin rows for a whole batch of punches, sequenced in memory and written
+# with multi-row INSERTs.
+BULK_INSERT_CHUNK_SIZE = 500  # rows per multi-row INSERT statement
+
+
+def insert_employee_checkins(punches):
+    """
+    Insert Employee Checkin rows for many punches; caller owns the transaction
+
+    punches are (index, (employee_id, full_name), checkin_time, device_id, location). Each
+    employee-day continues from its latest existing log_type and alternates
+    IN/OUT in time order, the same sequence one add_checkin call per punch
+    would produce; a day that receives a punch older than its latest one is
+    resequenced whole. Returns (index, result) pairs.
+    """
+    punches = sorted(punches, key=lambda punch: punch[2])
+
+    # Latest existing punch per employee and day, from the last-punch state store
+    last_punches = get_last_punches({(punch[1][0], punch[2].date()) for punch in punches})
+    last_log_types = {key: log_type for key, (_, log_type) in last_punches.items()}
+    late_days = set()
+
+    names = reserve_series_names("CHKIN-", len(punches))
+    ist = pytz.timezone('Asia/Kolkata')
+    current_ist = datetime.now(ist).replace(microsecond=0)
+    user = frappe.session.user
+
+    rows = []
+    last_rows = {}
+    results = []
+    for name, (index, (employee_id, full_name), checkin_time, device_id, location) in zip(names, punches):
+        key = (employee_id, checkin_time.date())
+        if key in last_punches and checkin_time < last_punches[key][0]:
+            late_days.add(key)
+        log_type = "OUT" if last_log_types.get(key) == "IN" else "IN"
+        last_log_types[key] = log_type
+
+        rows.append((
+            name, current_ist, current_ist, user, user,
+            employee_id, full_name, checkin_time, device_id, log_type, location
+        ))
+        last_rows[key] = rows[-1]
+        results.append((index, {
+            "status": "success",
+            "name": name,
+            "log_type": log_type,
+            "checkin_time": checkin_time,
+            "table": "Employee Checkin"
+        }))
+
+    for offset in range(0, len(rows), BULK_INSERT_CHUNK_SIZE):
+        chunk = rows[offset:offset + BULK_INSERT_CHUNK_SIZE]
+        placeholders = ", ".join(["(%s, %s, %s, %s, %s, 0, 0, %s, %s, %s, %s, %s, %s)"] * len(chunk))
+        frappe.db.sql(f"""
+            INSERT INTO `tabEmployee Checkin`
+            (name, creation, modified, modified_by, owner, docstatus, idx,
+             employee, employee_name, time, device_id, log_type, custom_device_location)
+            VALUES {placeholders}
+        """, [value for row in chunk for value in row])
+
+    # Days that received late punches are re-alternated as a whole; the rest just advance
+    log_types = {}
+    for employee_id, checkin_date in late_days:
+        log_types.update(resequence_employee_day(employee_id, checkin_date))
+    for key, last_row in last_rows.items():
+        if key not in late_days:
+            record_last_punch(key[0], last_row[7], last_row[9])
+    refresh_daily_summaries(last_rows)
+
+    for _index, result in results:
+        result["log_type"] = log_types.get(result["name"], result["log_type"])
+    return results
+
+
+def reserve_series_names(prefix, count, digits=5):
+    """
+    Reserve count consecutive names from a naming series with one counter update,
+    formatted the way make_autoname('<prefix>.#####') formats them
+    """
+    current = frappe.db.sql("SELECT current FROM `tabSeries` WHERE name = %s FOR UPDATE", (prefix,))
+    if current:
+        start = cint(current[0][0])
+        frappe.db.sql("UPDATE `tabSeries` SET current = %s WHERE name = %s", (start + count, prefix))
+    else:
+        start = 0
+        frappe.db.sql("INSERT INTO `tabSeries` (name, current) VALUES (%s, %s)", (prefix, count))
+
+    return [f"{prefix}{str(number).zfill(digits)}" for number in range(start + 1, start + count + 1)]
@@ -0,0 +1,135 @@
+from datetime import date
+
+
+# Calendar days as bits of a Python int: bit i stands for base + i days. Whole
+# ranges are set with one shift-and-or and windows are counted with one mask
+# and int.bit_count(), instead of walking the days one by one.
+
+
+def _mask(length):
+    return (1 << length) - 1 if length > 0 else 0
+
+
+def _aligned_bits(day_set, base):
+    """day_set's bits re-expressed against another base"""
+    if day_set.base is None:
+        return 0
+    shift = day_set.base - base
+    return day_set.bits << shift if shift >= 0 else day_set.bits >> -shift
+
+
+class DaySet:
+    """Set of calendar days stored as a bitset from a base date"""
+
+    __slots__ = ("base", "bits")
+
+    def __init__(self, base=None, bits=0):
+        self.base = base.toordinal() if isinstance(base, date) else base
+        self.bits = bits
+
+    def _offset(self, day):
+        if self.base is None:
+            self.base = day.toordinal()
+        return day.toordinal() - self.base
+
+    def add(self, day):
+        self.add_range(day, day)
+
+    def add_range(self, start, end):
+        """Add every day from start to end inclusive; days before base are dropped"""
+        start_offset = max(self._offset(start), 0)
+        end_offset = self._offset(end)
+        if end_offset >= start_offset:
+            self.bits |= _mask(end_offset - start_offset + 1) << start_offset
+
+    def _window_mask(self, start, end):
+        if self.base is None:
+            return 0
+        start_offset = max(start.toordinal() - self.base, 0)
+        end_offset = end.toordinal() - self.base
+        return _mask(end_offset - start_offset + 1) << start_offset if end_offset >= start_offset else 0
+
+    def __contains__(self, day):
+        if self.base is None:
+            return False
+        offset = day.toordinal() - self.base
+        return offset >= 0 and bool(self.bits >> offset & 1)
+
+    def __bool__(self):
+        return bool(self.bits)
+
+    def count(self, start, end, excluding=None):
+        """Days in [start, end], optionally leaving out the days of another DaySet"""
+        if self.base is None:
+            return 0
+        bits = self.bits & self._window_mask(start, end)
+        if excluding is not None and excluding.bits:
+            bits &= ~_aligned_bits(excluding, self.base)
+        return bits.bit_count()
+
+
+class LeaveDays:
+    """Approved leave of one employee as full-day and half-day DaySets"""
+
+    __slots__ = ("full", "half")
+
+    def __init__(self, base):
+        self.full = DaySet(base)
+        self.half = DaySet(base)
+
+    def add_range(self, start, end):
+        self.full.add_range(start, end)
+
+    def add_half_day(self, day):
+        # Two half-day leaves on the same date make a full day, as the per-day sum capped at 1.0 did
+        if day in self.half:
+            self.full.add(day)
+        else:
+            self.half.add(day)
+
+    def fraction(self, day):
+        """1.0, 0.5 or 0 for one day"""
+        if day in self.full:
+            return 1.0
+        return 0.5 if day in self.half else 0
+
+    def total(self, start, end, excluding=None):
+        """Sum of leave fractions over [start, end], optionally not counting the days of excluding"""
+        full_days = self.full.count(start, end, excluding)
+        half_only = DaySet(self.half.base, self.half.bits & ~_aligned_bits(self.full, self.half.base))
+        half_days = half_only.count(start, end, excluding)
+        return full_days + 0.5 * half_days
+
+    def __bool__(self):
+        return bool(self.full) or bool(self.half)
+
+
+class _FrozenDaySet(DaySet):
+    """Empty DaySet that refuses changes, so one instance can be shared"""
+
+    __slots__ = ()
+
+    def __init__(self):
+        object.__setattr__(self, "base", None)
+        object.__setattr__(self, "bits", 0)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("shared empty DaySet is read-only")
+
+
+class _FrozenLeaveDays(LeaveDays):
+    """LeaveDays without any leave that refuses changes, so one instance can be shared"""
+
+    __slots__ = ()
+
+    def __init__(self):
+        object.__setattr__(self, "full", _FrozenDaySet())
+        object.__setattr__(self, "half", _FrozenDaySet())
+
+    def __setattr__(self, name, value):
+        raise AttributeError("shared empty LeaveDays is read-only")
+
+
+# Stand-ins for employees without any holiday or leave in the period; read-only
+NO_DAYS = _FrozenDaySet()
+NO_LEAVE = _FrozenLeaveDays()
@@ -0,0 +1,224 @@
+import hashlib
+from datetime import datetime, time, timedelta
+
+import frappe
+from frappe.utils import getdate, now_datetime, today
+
+from task_manager.services.attendance_cache import (
+    CACHE_PREFIX,
+    EMPLOYEE_INDEX_KEY,
+    get_cache_version,
+    run_after_commit,
+)
+
+
+# Every cached response has a metadata entry with the date windows and
+# employees it was computed from, and is listed in small Redis sets: one per
+# day of its attendance window and one per month of its leave window. A change
+# to checkins, leaves or holidays reads only the sets of the days (or, for
+# leaves, months) it touches and drops the responses whose window and employee
+# scope overlap it. Sets expire no earlier than the responses they list.
+RESPONSE_PREFIX = f"{CACHE_PREFIX}fetch_checkins:"
+LIVE_TTL = 60  # seconds; responses showing today's punches as they arrive
+
+ATTENDANCE = "attendance"  # checkins and holidays: compared with the attendance window
+LEAVE = "leave"  # leave applications and allocations: compared with the leave window
+
+
+def _months(start_date, end_date):
+    month = getdate(start_date).replace(day=1)
+    end_date = getdate(end_date)
+    while month <= end_date:
+        yield month.strftime("%Y-%m")
+        month = (month + timedelta(days=32)).replace(day=1)
+
+
+def _days(start_date, end_date):
+    day = getdate(start_date)
+    end_date = getdate(end_date)
+    while day <= end_date:
+        yield day.isoformat()
+        day += timedelta(days=1)
+
+
+def _index_names(kind, date_ranges):
+    """
+    Index sets covering date_ranges: per day for attendance, per month for leaves
+
+    Leave windows span a whole year and change rarely, so they are indexed by month.
+    """
+    names = set()
+    for start, end in date_ranges:
+        if kind == LEAVE:
+            names.update(f"{RESPONSE_PREFIX}index:{LEAVE}:{month}" for month in _months(start, end))
+        else:
+            names.update(f"{RESPONSE_PREFIX}index:{ATTENDANCE}:{day}" for day in _days(start, end))
+    return names
+
+
+def _meta_key(response_key):
+    return f"{response_key}:meta"
+
+
+def _response_ttl(attendance_end, live):
+    """
+    None (keep) for closed past windows, LIVE_TTL for today, otherwise until midnight
+
+    A window reaching past today still depends on the current date through the
+    current week/month summaries, so it cannot outlive the day.
+    """
+    if live:
+        return LIVE_TTL
+    current_date = getdate(today())
+    if getdate(attendance_end) < current_date:
+        return None
+    midnight = datetime.combine(current_date + timedelta(days=1), time.min)
+    return max(int((midnight - now_datetime()).total_seconds()), 1)
+
+
+def _register(response_key, index_names, ttl):
+    """
+    List response_key in index_names, extending each set's expiry to cover ttl
+    """
+    cache = frappe.cache()
+    keys = [cache.make_key(name) for name in index_names]
+
+    pipeline = cache.pipeline()
+    for key in keys:
+        pipeline.ttl(key)
+    remaining = pipeline.execute()
+
+    pipeline = cache.pipeline()
+    for key, current in zip(keys, remaining):
+        pipeline.sadd(key, response_key)
+        if ttl is None:
+            pipeline.persist(key)
+        elif current != -1 and current < ttl:
+            # -1: already kept without expiry; -2: new set
+            pipeline.expire(key, ttl)
+    pipeline.execute()
+
+
+def get_cached_response(request_key, scope, attendance_window, leave_window, live, builder):
+    """
+    Return the cached fetch_checkins response for request_key, or build and cache it
+
+    scope is the set of employees the response covers (None for everyone);
+    attendance_window and leave_window are the (start, end) dates whose
+    checkins/holidays and leaves it was computed from. Error responses are not cached.
+    """
+    cache = frappe.cache()
+    # Employee details (names, departments, images) are part of the response
+    signature = repr((request_key, sorted(scope) if scope is not None else None, get_cache_version(EMPLOYEE_INDEX_KEY)))
+    response_key = f"{RESPONSE_PREFIX}response:{hashlib.md5(signature.encode()).hexdigest()}"
+    meta_key = _meta_key(response_key)
+
+    # A response is only valid while its metadata, which invalidation deletes, carries the same token
+    cached = cache.get_value(response_key)
+    if cached is not None:
+        meta = cache.get_value(meta_key)
+        if meta and meta[0] == cached[0]:
+            return cached[1]
+
+    # Registered before building, so an invalidation during the build finds and drops the claim
+    token = frappe.generate_hash(length=12)
+    ttl = _response_ttl(attendance_window[1], live)
+    attendance_window = (getdate(attendance_window[0]), getdate(attendance_window[1]))
+    leave_window = (getdate(leave_window[0]), getdate(leave_window[1]))
+    cache.set_value(
+        meta_key,
+        (token, attendance_window, leave_window, frozenset(scope) if scope is not None else None),
+        expires_in_sec=ttl
+    )
+    _register(
+        response_key,
+        _index_names(ATTENDANCE, [attendance_window]) | _index_names(LEAVE, [leave_window]),
+        ttl
+    )
+
+    response = builder()
+    if isinstance(response, dict) and "error" in response:
+        return response
+
+    # Skip storing if an invalidation ran while the response was being built
+    meta = cache.get_value(meta_key)
+    if meta and meta[0] == token:
+        cache.set_value(response_key, (token, response), expires_in_sec=ttl)
+    return response
+
+
+def invalidate_responses(kind, employees, date_ranges):
+    """
+    Drop cached responses whose kind window overlaps any of date_ranges and whose scope includes employees
+
+    employees None matches every scope. Runs now and again after commit, so a
+    response rebuilt from uncommitted data does not survive.
+    """
+    date_ranges = [(getdate(start), getdate(end)) for start, end in date_ranges]
+    if not date_ranges or (employees is not None and not employees):
+        return
+    employees = set(employees) if employees is not None else None
+    index_names = _index_names(kind, date_ranges)
+
+    def _invalidate():
+        cache = frappe.cache()
+        for index_name in index_names:
+            for member in cache.smembers(index_name) or ():
+                response_key = frappe.safe_decode(member)
+                meta = cache.get_value(_meta_key(response_key))
+                if meta is None:
+                    # Expired, or already dropped through another index set
+                    cache.srem(index_name, response_key)
+                    continue
+
+                _, attendance_window, leave_window, scope = meta
+                window = leave_window if kind == LEAVE else attendance_window
+                if not any(start <= window[1] and window[0] <= end for start, end in date_ranges):
+                    continue
+                if scope is not None and employees is not None and scope.isdisjoint(employees):
+                    continue
+                cache.delete_value([response_key, _meta_key(response_key)])
+                cache.srem(index_name, response_key)
+
+    _invalidate()
+    run_after_commit(_invalidate)
+
+
+def invalidate_for_employee_days(employee_days):
+    """
+    Checkins of these (employee, date) pairs were inserted, resequenced or edited
+    """
+    employee_days = list(employee_days)
+    invalidate_responses(
+        ATTENDANCE,
+        {employee_id for employee_id, _ in employee_days},
+        [(checkin_date, checkin_date) for _, checkin_date in employee_days]
+    )
+
+
+def invalidate_for_leave(doc=None, method=None):
+    """
+    Leave Application / Leave Allocation doc_events hook
+    """
+    for leave in (doc, doc and doc.get_doc_before_save()):
+        # An edit may move the leave to another employee or period
+        if leave and leave.get("employee") and leave.get("from_date") and leave.get("to_date"):
+            invalidate_responses(LEAVE, {leave.employee}, [(leave.from_date, leave.to_date)])
+
+
+def invalidate_for_holiday_list(doc=None, method=None):
+    """
+    Holiday List doc_events hook: only added or removed holiday dates matter
+    """
+    if not doc:
+        return
+
+    holiday_dates = {getdate(holiday.holiday_date) for holiday in doc.get("holidays") or []}
+    previous = doc.get_doc_before_save() if method != "on_trash" else None
+    if previous:
+        holiday_dates ^= {getdate(holiday.holiday_date) for holiday in previous.get("holidays") or []}
+    if not holiday_dates:
+        return
+
+    employees = frappe.get_all("Employee", filters={"holiday_list": doc.name}, pluck="name")
+    invalidate_responses(ATTENDANCE, employees, [(holiday_date, holiday_date) for holiday_date in holiday_dates])
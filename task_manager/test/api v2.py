@@ -87,7 +87,7 @@ def _get_employee_data(start_date, end_date):
                 FROM `tabEmployee Checkin` AS ec
                 JOIN `tabEmployee` AS em ON ec.employee = em.name
                 LEFT JOIN `tabShift Type` AS st on em.default_shift=st.name
-                WHERE DATE(ec.time) BETWEEN %s and %s AND em.status = 'Active'
+                WHERE ec.time >= %s AND ec.time < %s + INTERVAL 1 DAY AND em.status = 'Active'
                 ORDER BY ec.employee, ec.time
             """
         raw_checkin_data = frappe.db.sql(query, (start_date, end_date), as_dict=True)
@@ -5,6 +5,11 @@ from datetime import datetime, date, timedelta
 import calendar
 from typing import List, Dict, Any, Tuple, Optional
 
+from task_manager.services.attendance_summary import get_daily_summaries
+from task_manager.services.attendance_cache import get_all_subordinates
+from task_manager.services.fetch_checkins_cache import get_cached_response
+from task_manager.services.day_sets import DaySet, LeaveDays, NO_DAYS, NO_LEAVE
+
 
 # ===========================
 # SECTION 1: LEAVE BALANCE FUNCTIONS
@@ -213,30 +218,38 @@ def _build_employee_info(record, leave_balance=None):
 # SECTION 3: EXISTING FUNCTIONS (UNCHANGED)
 # ===========================
 
-# Get employee holidays
-def _get_employee_holidays(start_date, end_date):
+# Get employee holidays (employees: restrict to these employee ids, default all active)
+def _get_employee_holidays(start_date, end_date, employees=None):
     try:
-        holiday_query = """
+        if employees is not None and not employees:
+            return {}
+
+        conditions = "em.status='Active'"
+        params = {"start_date": start_date, "end_date": end_date}
+        if employees is not None:
+            conditions += " AND em.name IN %(employees)s"
+            params["employees"] = list(employees)
+
+        holiday_query = f"""
             SELECT em.name as employee, em.holiday_list, h.holiday_date
             FROM `tabEmployee` em 
             LEFT JOIN `tabHoliday` h ON em.holiday_list=h.parent
-                AND h.holiday_date BETWEEN %s AND %s
-            WHERE em.status='Active'
+                AND h.holiday_date BETWEEN %(start_date)s AND %(end_date)s
+            WHERE {conditions}
             ORDER BY em.name
         """
-        employee_holiday_data = frappe.db.sql(holiday_query, (start_date, end_date), as_dict=True)
+        employee_holiday_data = frappe.db.sql(holiday_query, params, as_dict=True)
 
-        employee_holidays = defaultdict(list)
+        # Map: employee -> DaySet of holiday dates within the period
+        start_date = getdate(start_date)
+        employee_holidays = {}
 
         for holiday in employee_holiday_data:
             emp = holiday['employee']
+            holidays = employee_holidays.setdefault(emp, DaySet(start_date))
             if holiday['holiday_date']:
-                employee_holidays[emp].append(getdate(holiday['holiday_date']))
-            else:
-                employee_holidays.setdefault(emp, [])
+                holidays.add(holiday['holiday_date'])
 
-        employee_holidays = dict(employee_holidays)
-        
         return employee_holidays
 
     except Exception as e:
@@ -246,16 +259,26 @@ def _get_employee_holidays(start_date, end_date):
 
 # Get all approved leaves for all employees in the date range
 # we dont consider Leave Without Pay (so in output that day will be marked absent)
-def _get_leaves_for_period(start_date, end_date):
+def _get_leaves_for_period(start_date, end_date, employees=None):
     try:
         # - We now fetch leave_type and half_day related fields so we can
         # - exclude 'Leave Without Pay' from leave-based stats
         # - handle half-day leaves (subtract 0.5 rather than 1)
-        leaves_query = """
+        if employees is not None and not employees:
+            return {}
+
+        params = {"start_date": start_date, "end_date": end_date}
+        employee_condition = ""
+        if employees is not None:
+            employee_condition = "AND employee IN %(employees)s"
+            params["employees"] = list(employees)
+
+        leaves_query = f"""
             SELECT employee, from_date, to_date, leave_type, half_day, half_day_date
             FROM `tabLeave Application`
             WHERE status = 'Approved'
             AND docstatus = 1
+            {employee_condition}
             AND (
                 (from_date BETWEEN %(start_date)s AND %(end_date)s) OR
                 (to_date BETWEEN %(start_date)s AND %(end_date)s) OR  
@@ -263,13 +286,11 @@ def _get_leaves_for_period(start_date, end_date):
             )
         """
 
-        leaves_data = frappe.db.sql(leaves_query, {
-            "start_date": start_date,
-            "end_date": end_date
-        }, as_dict=True)
+        leaves_data = frappe.db.sql(leaves_query, params, as_dict=True)
 
-        # Map: employee -> { 'YYYY-MM-DD': fraction } where fraction is 1.0 or 0.5
-        employee_leaves = defaultdict(lambda: defaultdict(float))
+        # Map: employee -> LeaveDays (full-day and half-day bitsets over the period)
+        start_date, end_date = getdate(start_date), getdate(end_date)
+        employee_leaves = {}
 
         for leave in leaves_data:
             # Skip Leave Without Pay as per requirement
@@ -281,30 +302,15 @@ def _get_leaves_for_period(start_date, end_date):
                 # half_day_date might be None in some setups; fall back to from_date
                 hd_date = leave.get('half_day_date') or leave.get('from_date')
                 if hd_date and (hd_date >= start_date and hd_date <= end_date):
-                    # add 0.5 for this date (supports overlapping leaves by adding fractions)
-                    hd_key = str(getdate(hd_date))
-                    employee_leaves[leave['employee']][hd_key] = min(
-                        employee_leaves[leave['employee']].get(hd_key, 0) + 0.5, 1.0
-                    )
-                    # cap half-day addition too
+                    # 0.5 for this date; a second half day on it makes a full day
+                    employee_leaves.setdefault(leave['employee'], LeaveDays(start_date)).add_half_day(hd_date)
 
             else:
-                # Full day or multi-day leave -> add 1.0 for each date in the intersection
+                # Full day or multi-day leave -> 1.0 for every date in the intersection, set in one step
+                # (overlapping leaves stay at 1.0 per date)
                 leave_start = max(leave.get('from_date'), start_date)
                 leave_end = min(leave.get('to_date'), end_date)
-            
-                current_date = leave_start
-                while current_date <= leave_end:
-                    key = str(getdate(current_date))
-                    employee_leaves[leave['employee']][key] = min(
-                        employee_leaves[leave['employee']].get(key, 0) + 1.0, 1.0
-                    )
-                    # cap per-date leave fraction at 1.0 to avoid double-subtraction for overlapping leaves
-
-                    current_date += timedelta(days=1)
-        
-        # Convert nested defaultdicts to normal dicts for easier serialization
-        employee_leaves = {emp: dict(dates) for emp, dates in employee_leaves.items()}
+                employee_leaves.setdefault(leave['employee'], LeaveDays(start_date)).add_range(leave_start, leave_end)
 
         # When logs are absent and record shows a half-day, it returns Halfday     
         return employee_leaves
@@ -314,47 +320,6 @@ def _get_leaves_for_period(start_date, end_date):
         return {}
     
 
-# Get employee checkin data with shift info
-def _get_employee_data(start_date, end_date):
-    try:
-        query = """
-                SELECT
-                    ec.employee, ec.time, ec.log_type,
-                    em.name,em.employee_name as emp_display_name, em.department, em.reports_to, em.default_shift, em.holiday_list, em.image,
-                    em.custom_team,
-                    st.end_time
-                FROM `tabEmployee Checkin` AS ec
-                JOIN `tabEmployee` AS em ON ec.employee = em.name
-                LEFT JOIN `tabShift Type` AS st on em.default_shift=st.name
-                WHERE DATE(ec.time) BETWEEN %s and %s AND em.status = 'Active'
-                ORDER BY ec.employee, ec.time
-            """
-        raw_checkin_data = frappe.db.sql(query, (start_date, end_date), as_dict=True)
-        
-        return raw_checkin_data
-    
-    except Exception as e:
-        frappe.log_error("Error in employee data sql", str(e))
-        return []
-
-
-# Filter checkins to exclude holidays
-def _filter_checkins(raw_checkin_data, employee_holidays):
-    try:
-        filtered_data = []
-        for record in raw_checkin_data:
-            employee = record['employee']
-            checkin_date = getdate(record['time'])
-            if checkin_date not in employee_holidays.get(employee, []):
-                filtered_data.append(record) 
-
-        return filtered_data
-    
-    except Exception as e:
-        frappe.log_error("Error in filtering checkins", str(e))
-        return []
-
-
 # Calculate work hours
 def _calculate_employee_work_hours(logs, shift_end=None):
     try:
@@ -437,66 +402,25 @@ def _calculate_employee_work_hours(logs, shift_end=None):
         return {"error": "Error in calculating work hours"}
 
 
-# Sort and process checkin data
-def _sort_checkin_data(filtered_checkin_data):
-    try:
-        # Keep original logs grouped per day so downstream logic can decide leave precedence
-        grouped_emp_data = defaultdict(lambda: defaultdict(list))
-        for entry in filtered_checkin_data:
-            date_str = format_datetime(entry['time'], 'yyyy-MM-dd')
-            grouped_emp_data[entry['employee']][date_str].append(entry)
-
-        daily_summaries = []
-        for employee, day in grouped_emp_data.items():
-            for date, logs in day.items():
-                if logs:
-                    # preserve raw logs for later decisioning
-                    raw_logs = logs
-
-                    shift_end = logs[0]['end_time']
-                    if isinstance(shift_end, timedelta):
-                        shift_end = (datetime.min + shift_end).time()
-                    elif isinstance(shift_end, str):
-                        shift_end = datetime.strptime(shift_end, "%H:%M").time()
-                    elif isinstance(shift_end, datetime):
-                        shift_end = shift_end.time() 
-                    
-                    if shift_end:
-                        shift_end = datetime.combine(getdate(logs[0]['time']), shift_end)
-                    daily_summary = _calculate_employee_work_hours(logs, shift_end)
-
-                    # attach raw_logs and date for downstream leave/status logic
-                    daily_summary['raw_logs'] = raw_logs  # keep raw logs
-                    daily_summary['date'] = date
-                    daily_summaries.append(daily_summary)
-
-        return daily_summaries
-
-    except Exception as e:
-        frappe.log_error("Error in processing checkin data", str(e))
-        return []
-
-
 # daily work hours calculation with status and leave
 def _calculate_daily_work_hours_with_status(logs, employee_holidays, employee_leaves_map, date_str, employee_info):
-    # employee_leaves_map is expected to be a dict: { 'YYYY-MM-DD': fraction }
-    # ie, {date:1.0/0.5,....,}
+    # employee_leaves_map is the employee's LeaveDays: fraction(date) is 1.0/0.5/0
     if not logs:
         if not employee_info:
             return None
 
-        check_date = getdate(date_str)
+        check_date = date.fromisoformat(date_str)
         # default absent/holiday handling
-        if date_str in (employee_leaves_map or {}):
-            # If present in map, decide based on fraction
-            frac = employee_leaves_map.get(date_str, 0)
+        frac = (employee_leaves_map or NO_LEAVE).fraction(check_date)
+        if frac > 0:
+            # On leave this date, decide based on fraction
             if frac >= 1:
                 status = "On Leave"
             elif frac == 0.5:
                 status = "Halfday"
             else:
                 status = "Absent"
-        elif check_date in (employee_holidays or []):
+        elif check_date in (employee_holidays or NO_DAYS):
             status = "Holiday"
         else:
             status = "Absent"
@@ -521,7 +445,7 @@ def _calculate_daily_work_hours_with_status(logs, employee_holidays, employee_le
     status = "Present"
 
     # Decide if a leave applies on this date (leave overrides present for full-day leaves)
-    frac = (employee_leaves_map or {}).get(date_str, 0)
+    frac = (employee_leaves_map or NO_LEAVE).fraction(date.fromisoformat(date_str))
     if frac >= 1:
         # Full day approved (non-LWP) leave: treat as On Leave and ignore attendance for this day
         status = "On Leave"
@@ -563,23 +487,17 @@ def _calculate_effective_working_days(start_date, end_date, emp_holidays, emp_le
         if actual_end_date < start_date:
             return 0
             
-        # emp_leaves_map is expected to be { 'YYYY-MM-DD': fraction }
+        emp_holidays = emp_holidays or NO_DAYS
         # Sum up leave fractions within the period (full day =1, half day =0.5)
-        leave_fraction_sum = 0.0
-        for leave_date_str, frac in (emp_leaves_map or {}).items():
-            leave_date = getdate(leave_date_str)
-            if start_date <= leave_date <= actual_end_date:
-                # If the same date is already a holiday, do NOT subtract leave fraction (holiday takes precedence)
-                if leave_date in (emp_holidays or []):
-                    continue
-                leave_fraction_sum += float(frac)
+        # If the same date is already a holiday, do NOT subtract leave fraction (holiday takes precedence)
+        leave_fraction_sum = (emp_leaves_map or NO_LEAVE).total(start_date, actual_end_date, excluding=emp_holidays)
         
         total_days_in_period = (actual_end_date - start_date).days + 1
         
-        holidays_in_period = [h for h in (emp_holidays or []) if start_date <= h <= actual_end_date]
+        holidays_in_period = emp_holidays.count(start_date, actual_end_date)
         
         # Effective working days = total - holidays - sum(leave fractions)
-        effective_working_days = total_days_in_period - len(holidays_in_period) - leave_fraction_sum
+        effective_working_days = total_days_in_period - holidays_in_period - leave_fraction_sum
 
         return max(round(effective_working_days, 2), 0)
         
@@ -593,7 +511,7 @@ def _calculate_effective_working_days(start_date, end_date, emp_holidays, emp_le
 # ===========================
 
 # Process checkin data with holiday and leave
-def _get_processed_checkin_data(from_date, to_date, leave_balances=None):
+def _get_processed_checkin_data(from_date, to_date, leave_balances=None, employees=None):
     try:
         if not from_date or not to_date:
             return [], {}, {} 
@@ -601,28 +519,31 @@ def _get_processed_checkin_data(from_date, to_date, leave_balances=None):
         # # debug line for fetching date range
         # frappe.log_error("DEBUG: Fetching data from", f"from_date: {from_date}, to_date: {to_date}")
         
-        raw_checkin_data = _get_employee_data(from_date, to_date)
-        if not raw_checkin_data:
+        # Employee-days are precomputed in Daily Attendance Summary as punches arrive
+        daily_summaries = get_daily_summaries(from_date, to_date, employees)
+        if not daily_summaries:
             return [], {}, {} 
         
-        employee_holidays = _get_employee_holidays(from_date, to_date)
-        # employee_leaves now maps to { emp: { 'YYYY-MM-DD': fraction } }
-        employee_leaves = _get_leaves_for_period(from_date, to_date)
+        employee_holidays = _get_employee_holidays(from_date, to_date, employees)
+        # employee_leaves maps to { emp: LeaveDays }, employee_holidays to { emp: DaySet }
+        employee_leaves = _get_leaves_for_period(from_date, to_date, employees)
 
         if not employee_holidays:
             frappe.log_error("No holiday data found", "Holiday mapping is empty")
 
-        filtered_checkin_data = _filter_checkins(raw_checkin_data, employee_holidays)
-
-        daily_summaries = _sort_checkin_data(filtered_checkin_data)
+        # Exclude holidays
+        daily_summaries = [
+            summary for summary in daily_summaries
+            if date.fromisoformat(summary['date']) not in employee_holidays.get(summary['employee'], NO_DAYS)
+        ]
         if not daily_summaries:
             return [], employee_holidays, employee_leaves
 
         enhanced_summaries = []
         for summary in daily_summaries:
             emp_name = summary['employee']
-            emp_holidays = employee_holidays.get(emp_name, [])
-            emp_leaves_map = employee_leaves.get(emp_name, {})
+            emp_holidays = employee_holidays.get(emp_name, NO_DAYS)
+            emp_leaves_map = employee_leaves.get(emp_name, NO_LEAVE)
             
             # Get leave balance for this employee if available
             emp_leave_balance = leave_balances.get(emp_name) if leave_balances else None
@@ -631,7 +552,7 @@ def _get_processed_checkin_data(from_date, to_date, leave_balances=None):
             
             # Instead of calling the status function with None (which was used earlier),
             # decide status by using the available work-summary and leave map
-            frac = emp_leaves_map.get(summary['date'], 0)
+            frac = emp_leaves_map.fraction(date.fromisoformat(summary['date']))
             if frac >= 1:
                 # Full day leave overrides presence -> mark On Leave and zero out hours
                 enhanced = {
@@ -715,8 +636,8 @@ def _create_summary_with_effective_working_days(daily_records, start_date, end_d
         
         result = []
         for emp_name, stats in employee_stats.items():
-            emp_holidays = employee_holidays.get(emp_name, [])
-            emp_leaves_map = employee_leaves_map.get(emp_name, {}) if employee_leaves_map else {}
+            emp_holidays = employee_holidays.get(emp_name, NO_DAYS)
+            emp_leaves_map = employee_leaves_map.get(emp_name, NO_LEAVE) if employee_leaves_map else NO_LEAVE
 
             effective_working_days = _calculate_effective_working_days(
                 start_date, end_date, emp_holidays, emp_leaves_map, 
@@ -726,15 +647,11 @@ def _create_summary_with_effective_working_days(daily_records, start_date, end_d
             avg_hours = round(stats['total_work_hours'] / effective_working_days, 2) if effective_working_days > 0 else 0
             
             # Sum up leave fractions within the period for reporting
-            leaves_in_period = 0.0
-            for ld_str, frac in emp_leaves_map.items():
-                ld = getdate(ld_str)
-                if start_date <= ld <= end_date:
-                    leaves_in_period += float(frac)
+            leaves_in_period = emp_leaves_map.total(start_date, end_date)
             
-            holidays_in_period = [h for h in emp_holidays if start_date <= h <= end_date]
+            holidays_in_period = emp_holidays.count(start_date, end_date)
             total_days_for_company_working_days = (end_date - start_date).days + 1
-            company_working_days = total_days_for_company_working_days - len(holidays_in_period)
+            company_working_days = total_days_for_company_working_days - holidays_in_period
 
             result.append({
                 "employee": emp_name, 
@@ -742,7 +659,7 @@ def _create_summary_with_effective_working_days(daily_records, start_date, end_d
                 "total_hours_worked": round(stats['total_work_hours'], 2),
                 "total_days_worked": stats['days_worked'],
                 "effective_working_days": effective_working_days,
-                "holidays_in_period": len(holidays_in_period),
+                "holidays_in_period": holidays_in_period,
                 "leaves_in_period": round(leaves_in_period, 2),
                 "company_working_days": company_working_days
             })
@@ -764,42 +681,6 @@ def _add_to_registry(registry, data, data_key):
                 clean_record.pop(field, None)
             registry[emp_name][data_key] = clean_record
 
-# manager to subordinates mapping
-def _get_hierarchy_map():
-    try:
-        employees = frappe.get_all("Employee", filters={"status": "Active"}, fields=["name", "reports_to"])
-        hierarchy = defaultdict(list)
-        for emp in employees:
-            if emp.reports_to:
-                hierarchy[emp.reports_to].append(emp.name)
-        return hierarchy
-    except Exception as e:
-        frappe.log_error("Error in hierarchy mapping", str(e))
-        return defaultdict(list)
-
-
-# Get all subordinates using bfs
-def _get_all_subordinates(manager_id, hierarchy_map):
-    if not manager_id or not hierarchy_map:
-        return []
-
-    all_subordinates = set()
-    queue = hierarchy_map.get(manager_id, [])
-    visited = set(queue)
-    all_subordinates.update(queue)
-
-    while queue:
-        current = queue.pop(0)
-        direct_reports = hierarchy_map.get(current, [])
-        for report in direct_reports:
-            if report not in visited:
-                visited.add(report)
-                all_subordinates.add(report)
-                queue.append(report)
-    
-    return list(all_subordinates)
-
-
 # Calculate week/month boundaries with current vs past 
 def _get_date_boundaries(target_date):
     try:
@@ -891,7 +772,7 @@ def _process_data_by_periods(registry, all_data, boundaries, target_date, employ
         daily_data, weekly_data, monthly_data = [], [], []
         
         for record in all_data:
-            record_date = getdate(record['date'])
+            record_date = date.fromisoformat(record['date'])
             
             # For monthly summary - use summary_month_end (excludes today)
             if boundaries['month_start'] <= record_date <= boundaries['summary_month_end']:
@@ -928,8 +809,8 @@ def _process_data_by_periods(registry, all_data, boundaries, target_date, employ
         target_date_str = format_datetime(target_date, 'yyyy-MM-dd')
         
         for emp_name, emp_data in registry.items():
-            emp_holidays = employee_holidays.get(emp_name, [])
-            emp_leaves = employee_leaves_map.get(emp_name, {}) if employee_leaves_map else {}
+            emp_holidays = employee_holidays.get(emp_name, NO_DAYS)
+            emp_leaves = employee_leaves_map.get(emp_name, NO_LEAVE) if employee_leaves_map else NO_LEAVE
             employee_info = emp_data['employee_info']
 
             if not emp_data['daily_data']:
@@ -947,19 +828,15 @@ def _process_data_by_periods(registry, all_data, boundaries, target_date, employ
                     emp_leaves, set(), boundaries['is_current_week']
                 )
 
-                holidays_in_week = [h for h in emp_holidays if boundaries['week_start'] <= h <= boundaries['week_end']]
-                emp_leave_dates_sum = 0.0
-                for ld_str, frac in emp_leaves.items():
-                    ld = getdate(ld_str)
-                    if boundaries['week_start'] <= ld <= boundaries['week_end']:
-                        emp_leave_dates_sum += float(frac)
+                holidays_in_week = emp_holidays.count(boundaries['week_start'], boundaries['week_end'])
+                emp_leave_dates_sum = emp_leaves.total(boundaries['week_start'], boundaries['week_end'])
                 
                 emp_data['weekly_summary'] = {
                     "average_work_hours": 0.0, 
                     "total_hours_worked": 0.0, 
                     "total_days_worked": 0,
                     "effective_working_days": effective_working_days,
-                    "holidays_in_period": len(holidays_in_week),
+                    "holidays_in_period": holidays_in_week,
                     "leaves_in_period": round(emp_leave_dates_sum, 2)
                 }
 
@@ -969,19 +846,15 @@ def _process_data_by_periods(registry, all_data, boundaries, target_date, employ
                     emp_leaves, set(), boundaries['is_current_month']
                 )
 
-                holidays_in_month = [h for h in emp_holidays if boundaries['month_start'] <= h <= boundaries['month_end']]
-                emp_leave_dates_sum = 0.0
-                for ld_str, frac in emp_leaves.items():
-                    ld = getdate(ld_str)
-                    if boundaries['month_start'] <= ld <= boundaries['month_end']:
-                        emp_leave_dates_sum += float(frac)
+                holidays_in_month = emp_holidays.count(boundaries['month_start'], boundaries['month_end'])
+                emp_leave_dates_sum = emp_leaves.total(boundaries['month_start'], boundaries['month_end'])
                 
                 emp_data['monthly_summary'] = {
                     "average_work_hours": 0.0, 
                     "total_hours_worked": 0.0, 
                     "total_days_worked": 0,
                     "effective_working_days": effective_working_days,
-                    "holidays_in_period": len(holidays_in_month),
+                    "holidays_in_period": holidays_in_month,
                     "leaves_in_period": round(emp_leave_dates_sum, 2)
                 }
 
@@ -1002,6 +875,61 @@ def _create_hierarchy_response(registry, manager_id, subordinate_ids):
     }
 
 
+# Date range summary, computed when not served from the response cache
+def _build_range_response(start_date, end_date, from_date, to_date):
+    # No need to fetch leave balances for date range queries
+    # as they don't need employee_info structure
+    processed_data, employee_holidays, employee_leaves = _get_processed_checkin_data(
+        start_date, end_date, leave_balances=None
+    )
+    
+    if not processed_data:
+        return {"message": f"No check-in data found between {from_date} and {to_date}."}
+    
+    is_current_period = end_date >= getdate(today())
+        
+    return _create_summary_with_effective_working_days(
+        processed_data, start_date, end_date, 
+        employee_holidays, employee_leaves, is_current_period
+    )
+
+
+# Daily/weekly/monthly hierarchy view, computed when not served from the response cache
+def _build_specific_date_response(target_date, manager_id, scope, boundaries):
+    if scope is None:
+        all_employees = frappe.get_all("Employee", 
+            filters=[["status", "=", 'Active']], 
+            fields=["name", 'department', 'reports_to', 'image','employee_name','custom_team']
+        )
+        subordinate_ids = [emp.name for emp in all_employees if emp.name != manager_id]
+    else:
+        all_employees = frappe.get_all("Employee", 
+            filters={"name": ["in", list(scope)]},
+            fields=["name", "department", "reports_to", 'image','employee_name','custom_team']
+        )
+        subordinate_ids = [emp_id for emp_id in scope if emp_id != manager_id]
+
+    # FETCH LEAVE BALANCES FOR ALL EMPLOYEES
+    employee_list = [emp.name for emp in all_employees]
+    leave_balances = _calculate_all_leave_balances(employee_list, target_date)
+
+    # Build registry with leave balances
+    registry = _build_employee_registry(all_employees, leave_balances)
+    
+    # Fetch attendance data with leave balances
+    all_data, employee_holidays, employee_leaves = _get_processed_checkin_data(
+        boundaries['earliest_date'], boundaries['latest_date'], leave_balances, scope
+    )
+    
+    # Process data into daily/weekly/monthly periods
+    _process_data_by_periods(
+        registry, all_data, boundaries, target_date, 
+        employee_holidays, employee_leaves
+    )
+
+    return _create_hierarchy_response(registry, manager_id, subordinate_ids)
+
+
 # ===========================
 # SECTION 7: MAIN ENDPOINT (UPDATED TO FETCH AND USE LEAVE BALANCES)
 # ===========================
@@ -1023,22 +951,13 @@ def fetch_checkins(from_date=None, to_date=None, specific_date=None):
         if from_date and to_date:
             try:
                 start_date, end_date = getdate(from_date), getdate(to_date)
-                
-                # No need to fetch leave balances for date range queries
-                # as they don't need employee_info structure
-                processed_data, employee_holidays, employee_leaves = _get_processed_checkin_data(
-                    start_date, end_date, leave_balances=None
-                )
-                
-                if not processed_data:
-                    return {"message": f"No check-in data found between {from_date} and {to_date}."}
-                
-                days_diff = (end_date - start_date).days + 1
-                is_current_period = end_date >= getdate(today())
-                    
-                return _create_summary_with_effective_working_days(
-                    processed_data, start_date, end_date, 
-                    employee_holidays, employee_leaves, is_current_period
+
+                return get_cached_response(
+                    ("range", start_date, end_date), None,
+                    attendance_window=(start_date, end_date),
+                    leave_window=(start_date, end_date),
+                    live=end_date >= getdate(today()),
+                    builder=lambda: _build_range_response(start_date, end_date, from_date, to_date)
                 )
                 
             except Exception as e:
@@ -1051,47 +970,32 @@ def fetch_checkins(from_date=None, to_date=None, specific_date=None):
                 if target_date > getdate(today()):
                     return {"error": "Cannot fetch data for future date."}
 
-                # Determine which employees to fetch
+                # Determine which employees to fetch; None loads the whole company
+                scope = None
                 if frappe.session.user == 'Administrator':
                     manager_id = "Administrator"
-                    all_employees = frappe.get_all("Employee", 
-                        filters=[["status", "=", 'Active']], 
-                        fields=["name", 'department', 'reports_to', 'image','employee_name','custom_team']
-                    )
-                    subordinate_ids = [emp.name for emp in all_employees if emp.name != manager_id]
                 else:
                     manager_id = frappe.db.get_value("Employee", {"user_id": frappe.session.user}, "name")
                     if not manager_id:
                         frappe.throw("User not linked to active employee record.")
 
-                    hierarchy_map = _get_hierarchy_map()
-                    subordinate_ids = _get_all_subordinates(manager_id, hierarchy_map)
-                    allowed_employees = set(subordinate_ids + [manager_id])
-                    all_employees = frappe.get_all("Employee", 
-                        filters={"name": ["in", list(allowed_employees)]},
-                        fields=["name", "department", "reports_to", 'image','employee_name','custom_team']
-                    )
+                    scope = set(get_all_subordinates(manager_id) + [manager_id])
 
-                # FETCH LEAVE BALANCES FOR ALL EMPLOYEES
-                employee_list = [emp.name for emp in all_employees]
-                leave_balances = _calculate_all_leave_balances(employee_list, target_date)
-
-                # Build registry with leave balances
-                registry = _build_employee_registry(all_employees, leave_balances)
                 boundaries = _get_date_boundaries(target_date)
-                
-                # Fetch attendance data with leave balances
-                all_data, employee_holidays, employee_leaves = _get_processed_checkin_data(
-                    boundaries['earliest_date'], boundaries['latest_date'], leave_balances
-                )
-                
-                # Process data into daily/weekly/monthly periods
-                _process_data_by_periods(
-                    registry, all_data, boundaries, target_date, 
-                    employee_holidays, employee_leaves
+                attendance_window = (boundaries['earliest_date'], boundaries['latest_date'])
+                # Leave balances count the whole calendar year of target_date
+                leave_window = (
+                    min(date(target_date.year, 1, 1), attendance_window[0]),
+                    max(date(target_date.year, 12, 31), attendance_window[1])
                 )
 
-                return _create_hierarchy_response(registry, manager_id, subordinate_ids)
+                return get_cached_response(
+                    ("specific_date", target_date, manager_id), scope,
+                    attendance_window=attendance_window,
+                    leave_window=leave_window,
+                    live=target_date == getdate(today()),
+                    builder=lambda: _build_specific_date_response(target_date, manager_id, scope, boundaries)
+                )
                 
             except Exception as e:
                 frappe.log_error("Error in specific date processing", str(e))
@@ -4,16 +4,22 @@ from frappe.model.naming import make_autoname
 from datetime import datetime
 import pytz
 
+from task_manager.services.attendance_cache import (
+    get_employee_by_device_id,
+    get_employees_by_device_ids,
+    get_last_punch,
+    record_last_punch,
+    resequence_employee_day,
+)
+from task_manager.services.attendance_summary import refresh_daily_summaries
+from task_manager.services.checkin_inserts import insert_employee_checkins
+
 
 @frappe.whitelist(allow_guest=True)
 def add_checkin(punchingcode, employee_name, time, device_id):
     try:
         # Step 1: Get employee by biometric ID
-        employee = frappe.db.get_value(
-            "Employee",
-            {"attendance_device_id": punchingcode},
-            ["name", "employee_name"]
-        )
+        employee = get_employee_by_device_id(punchingcode)
 
         if not employee:
             frappe.throw(_("No Employee found for Biometric ID: {0}").format(punchingcode))
@@ -32,25 +38,70 @@ def add_checkin(punchingcode, employee_name, time, device_id):
         return {"error":str(e)}
 
 
+@frappe.whitelist(allow_guest=True)
+def add_checkins(checkins):
+    """
+    Bulk variant of add_checkin used by the biometric gateway
+
+    checkins is a JSON list of {punchingcode, employee_name, time, device_id}
+    with time as "%d-%m-%Y %H:%M:%S". Returns one result per item, in order:
+    {"status": "success", ...} or {"status": "error", "error": ...}.
+    Every punch is an Employee Checkin, written in a single transaction.
+    """
+    items = frappe.parse_json(checkins) or []
+    results = [None] * len(items)
+
+    # Step 1: Parse times and resolve all employees at once
+    punches = []
+    for index, item in enumerate(items):
+        try:
+            checkin_time = datetime.strptime(item.get("time"), "%d-%m-%Y %H:%M:%S")
+        except (TypeError, ValueError):
+            results[index] = {"status": "error", "error": f"Invalid time format received: {item.get('time')}"}
+            continue
+        punches.append((index, str(item.get("punchingcode")), checkin_time, item.get("device_id")))
+
+    employees = get_employees_by_device_ids({punchingcode for _index, punchingcode, _time, _device in punches})
+
+    employee_checkins = []
+    missing_codes = set()
+    for index, punchingcode, checkin_time, device_id in punches:
+        employee = employees.get(punchingcode)
+        if not employee:
+            missing_codes.add(punchingcode)
+            results[index] = {"status": "error", "error": f"No Employee found for Biometric ID: {punchingcode}"}
+            continue
+        employee_checkins.append((index, employee, checkin_time, device_id, None))
+
+    if missing_codes:
+        frappe.log_error(
+            f"No Employee found for Biometric IDs: {', '.join(sorted(missing_codes))}", "Employee Not Found"
+        )
+
+    # Step 2: Employee Checkin rows in one transaction
+    if employee_checkins:
+        try:
+            for index, result in insert_employee_checkins(employee_checkins):
+                results[index] = result
+            frappe.db.commit()
+        except Exception as e:
+            frappe.db.rollback()
+            error_msg = f"Failed to create Employee Checkin records: {str(e)}"
+            frappe.log_error(f"Bulk Employee Checkin Error: {error_msg}", "Employee Checkin Error")
+            for index, *_rest in employee_checkins:
+                results[index] = {"status": "error", "error": error_msg}
+
+    return results
+
 
 def handle_employee_checkin(employee_id, full_name, checkin_time, checkin_date, device_id, location=None):
     """
     Handle Employee Checkin - creates new row for each punch
     """
-    # Determine log_type by checking last entry for the day
-    log_type = "IN"
-    last_log_type = frappe.db.sql(
-        """
-        SELECT log_type FROM `tabEmployee Checkin`
-        WHERE employee = %s AND DATE(time) = %s
-        ORDER BY time DESC LIMIT 1
-        """,
-        (employee_id, checkin_date),
-        as_dict=False
-    )
-
-    if last_log_type:
-        log_type = "OUT" if last_log_type[0][0] == "IN" else "IN"
+    # Determine log_type from the last punch of the day
+    last_punch = get_last_punch(employee_id, checkin_date)
+    late = bool(last_punch) and checkin_time < last_punch[0]
+    log_type = "OUT" if last_punch and last_punch[1] == "IN" else "IN"
 
     # Generate name using naming series
     name = make_autoname('CHKIN-.#####')
@@ -74,6 +125,12 @@ def handle_employee_checkin(employee_id, full_name, checkin_time, checkin_date,
     }
     try:
         frappe.get_doc(employee_checkin).insert(ignore_permissions=True)
+        if late:
+            # Arrived after later punches of the same day: redo that day's IN/OUT sequence
+            resequence_employee_day(employee_id, checkin_date)
+            refresh_daily_summaries([(employee_id, checkin_date)])
+        else:
+            record_last_punch(employee_id, checkin_time, log_type)
         frappe.db.commit()
 
         return {
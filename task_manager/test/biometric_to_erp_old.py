@@ -5,6 +5,17 @@ from frappe.model.naming import make_autoname
 from datetime import datetime, timedelta, time
 import pytz
 
+from task_manager.services.attendance_cache import (
+    get_device_mapping as get_cached_device_mapping,
+    get_employee_by_device_id,
+    get_employees_by_device_ids,
+    get_last_punch,
+    record_last_punch,
+    resequence_employee_day,
+)
+from task_manager.services.attendance_summary import refresh_daily_summaries
+from task_manager.services.checkin_inserts import insert_employee_checkins
+
 
 @frappe.whitelist(allow_guest=True)
 def add_checkin(punchingcode, employee_name, time, device_id):
@@ -14,11 +25,7 @@ def add_checkin(punchingcode, employee_name, time, device_id):
     """
     try:
         # Step 1: Get employee by biometric ID
-        employee = frappe.db.get_value(
-            "Employee",
-            {"attendance_device_id": punchingcode},
-            ["name", "employee_name"]
-        )
+        employee = get_employee_by_device_id(punchingcode)
 
         if not employee:
             error_msg = f"No Employee found for Biometric ID: {punchingcode}"
@@ -74,22 +81,110 @@ def add_checkin(punchingcode, employee_name, time, device_id):
         frappe.throw(_(error_msg))
 
 
+@frappe.whitelist(allow_guest=True)
+def add_checkins(checkins):
+    """
+    Bulk variant of add_checkin used by the biometric gateway
+
+    checkins is a JSON list of {punchingcode, employee_name, time, device_id}
+    with time as "%d-%m-%Y %H:%M:%S". Returns one result per item, in order:
+    {"status": "success", ...} or {"status": "error", "error": ...}.
+
+    Employees are resolved in one query, IN/OUT is sequenced in memory per
+    employee and day, and Employee Checkin rows are written with multi-row
+    INSERTs in a single transaction. Overtime and Security Gate punches keep
+    going through their per-punch handlers.
+    """
+    items = frappe.parse_json(checkins) or []
+    results = [None] * len(items)
+
+    # Step 1: Parse times and resolve all employees at once
+    punches = []
+    for index, item in enumerate(items):
+        try:
+            checkin_time = datetime.strptime(item.get("time"), "%d-%m-%Y %H:%M:%S")
+        except (TypeError, ValueError):
+            results[index] = {"status": "error", "error": f"Invalid time format received: {item.get('time')}"}
+            continue
+        punches.append((index, str(item.get("punchingcode")), checkin_time, item.get("device_id")))
+
+    employees = get_employees_by_device_ids({punchingcode for _, punchingcode, _, _ in punches})
+
+    # Step 2: Route each punch by its device mapping
+    device_mappings = {}
+    employee_checkins = []
+    other_checkins = []
+    missing_codes = set()
+
+    for index, punchingcode, checkin_time, device_id in punches:
+        employee = employees.get(punchingcode)
+        if not employee:
+            missing_codes.add(punchingcode)
+            results[index] = {"status": "error", "error": f"No Employee found for Biometric ID: {punchingcode}"}
+            continue
+
+        if device_id not in device_mappings:
+            device_mappings[device_id] = get_device_mapping(device_id)
+        device_mapping = device_mappings[device_id]
+
+        if not device_mapping:
+            target_table, location = "tabEmployee Checkin", None
+        else:
+            target_table = device_mapping.get("database_table").strip("`").strip()
+            location = device_mapping.get("location")
+
+        punch = (index, employee, checkin_time, device_id, location)
+        if target_table == "tabEmployee Checkin":
+            employee_checkins.append(punch)
+        elif target_table in ("tabOvertime Checkin", "tabSecurity Gate Checkin"):
+            other_checkins.append((target_table, punch))
+        else:
+            results[index] = {"status": "error", "error": f"Invalid database table configuration: {target_table}"}
+
+    if missing_codes:
+        frappe.log_error(
+            f"No Employee found for Biometric IDs: {', '.join(sorted(missing_codes))}", "Employee Not Found"
+        )
+
+    # Step 3: Employee Checkin rows in one transaction
+    if employee_checkins:
+        try:
+            for index, result in insert_employee_checkins(employee_checkins):
+                results[index] = result
+            frappe.db.commit()
+        except Exception as e:
+            frappe.db.rollback()
+            error_msg = f"Failed to create Employee Checkin records: {str(e)}"
+            frappe.log_error(f"Bulk Employee Checkin Error: {error_msg}", "Employee Checkin Error")
+            for index, *_rest in employee_checkins:
+                results[index] = {"status": "error", "error": error_msg}
+
+    # Step 4: Session-based tables, one punch at a time in time order
+    handlers = {
+        "tabOvertime Checkin": handle_overtime_checkin,
+        "tabSecurity Gate Checkin": handle_security_checkin,
+    }
+    for target_table, (index, employee, checkin_time, device_id, location) in sorted(
+        other_checkins, key=lambda entry: entry[1][2]
+    ):
+        try:
+            employee_id, full_name = employee
+            results[index] = handlers[target_table](
+                employee_id, full_name, checkin_time, checkin_time.date(), device_id, location
+            )
+        except Exception as e:
+            results[index] = {"status": "error", "error": str(e)}
+
+    return results
+
+
 def get_device_mapping(device_id):
     """
     Get device mapping configuration from Biometric Device Mapping doctype
     """
     try:
-        device_doc = frappe.get_single("Biometric Device Mapping")
-        
-        # Search in the child table for matching serial number
-        for row in device_doc.table_sgvh:
-            if row.serial_number == device_id:
-                return {
-                    'database_table': row.database_table,
-                    'location': row.location
-                }
-        return None
-        
+        return get_cached_device_mapping(device_id)
+
     except frappe.DoesNotExistError:
         frappe.log_error(f"Biometric Device Mapping doctype not found", "Device Mapping Error")
         return None
@@ -103,20 +198,10 @@ def handle_employee_checkin(employee_id, full_name, checkin_time, checkin_date,
     Handle traditional Employee Checkin - creates new row for each punch
     """
     try:
-        # Determine log_type by checking last entry for the day
-        log_type = "IN"
-        last_log_type = frappe.db.sql(
-            """
-            SELECT log_type FROM `tabEmployee Checkin`
-            WHERE employee = %s AND DATE(time) = %s
-            ORDER BY time DESC LIMIT 1
-            """,
-            (employee_id, checkin_date),
-            as_dict=False
-        )
-
-        if last_log_type:
-            log_type = "OUT" if last_log_type[0][0] == "IN" else "IN"
+        # Determine log_type from the last punch of the day
+        last_punch = get_last_punch(employee_id, checkin_date)
+        late = bool(last_punch) and checkin_time < last_punch[0]
+        log_type = "OUT" if last_punch and last_punch[1] == "IN" else "IN"
 
         # Generate name using naming series
         name = make_autoname('CHKIN-.#####')
@@ -136,6 +221,13 @@ def handle_employee_checkin(employee_id, full_name, checkin_time, checkin_date,
             employee_id, full_name, checkin_time, device_id, log_type, location
         ))
 
+        if late:
+            # Arrived after later punches of the same day: redo that day's IN/OUT sequence
+            log_type = resequence_employee_day(employee_id, checkin_date)[name]
+        else:
+            record_last_punch(employee_id, checkin_time, log_type)
+        refresh_daily_summaries([(employee_id, checkin_date)])
+
         frappe.db.commit()
 
         return {
@@ -112,10 +112,10 @@ def _get_employee_data(selected_date):
                 FROM `tabEmployee Checkin` AS ec
                 JOIN `tabEmployee` AS em ON ec.employee = em.name
                 JOIN `tabShift Type` AS st on em.default_shift=st.name
-                WHERE DATE(ec.time) = %s AND em.status = 'Active'
+                WHERE ec.time >= %s AND ec.time < %s + INTERVAL 1 DAY AND em.status = 'Active'
                 ORDER BY ec.employee, ec.time    
         """                         #frappe.db.sql expects parameters as a list/tuple. so pass accordingly   
-        raw_checkin_data=frappe.db.sql(query,(selected_date,),as_dict=True)
+        raw_checkin_data=frappe.db.sql(query,(selected_date,selected_date),as_dict=True)
 
         return _process_employee_data(raw_checkin_data)
     
@@ -13,6 +13,8 @@ from hrms.hr.doctype.shift_assignment.shift_assignment import (
 )
 from hrms.hr.utils import validate_active_employee
 
+from task_manager.services.attendance_cache import get_employee_by_name
+
 #for changing the date&time format
 def convert_datetime(datetime_str):
     try:
@@ -70,7 +72,7 @@ def AddCheckInStatus(data):
         frappe.logger().info(f"Extracted data: {data_dict}")
 
         # Get employee details
-        employee = frappe.db.get_value("Employee", {"employee_name": name}, ["name", "employee_name"], as_dict=True)
+        employee = get_employee_by_name(name)
         if not employee:
             frappe.throw(_("No Employee found for the given name: {}".format(name)))
         
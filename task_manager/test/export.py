@@ -86,7 +86,7 @@ def _calculate_daily_work_hours(logs):
 
 def _get_employee_data(start,end,emp=None,dept=None):
     try:
-        conditions="DATE(ec.time) BETWEEN %(start)s AND %(end)s"
+        conditions="ec.time >= %(start)s AND ec.time < %(end)s + INTERVAL 1 DAY"
         params={"start":start,"end":end}
 
         if emp:
@@ -169,7 +169,7 @@ def _get_employee_data(start_date, end_date):
                     ec.time, ec.log_type
                 FROM `tabEmployee` AS em
                 LEFT JOIN `tabEmployee Checkin` AS ec ON ec.employee = em.name
-                WHERE DATE(ec.time) BETWEEN %s and %s AND em.status = 'Active'
+                WHERE ec.time >= %s AND ec.time < %s + INTERVAL 1 DAY AND em.status = 'Active'
                 ORDER BY ec.employee, ec.time
             """
         raw_checkin_data = frappe.db.sql(query, (start_date, end_date), as_dict=True)
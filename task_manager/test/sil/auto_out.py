@@ -130,14 +130,14 @@ def _get_raw_checkin_data(checkin_date):
                         SUBSTRING_INDEX(GROUP_CONCAT(log_type ORDER BY time DESC), ',', 1) AS log_type,
                         SUBSTRING_INDEX(GROUP_CONCAT(device_id ORDER BY time DESC), ',', 1) AS device_id
                     FROM `tabEmployee Checkin`
-                    WHERE DATE(time) = %s
+                    WHERE time >= %s AND time < %s + INTERVAL 1 DAY
                     GROUP BY employee
                 ) AS ec ON ec.employee = em.name
                 LEFT JOIN `tabShift Type` AS st ON em.default_shift = st.name
                 WHERE em.status = 'Active'
                 ORDER BY em.name;
             """
-        raw_checkin_data = frappe.db.sql(query, (checkin_date,), as_dict=True)
+        raw_checkin_data = frappe.db.sql(query, (checkin_date, checkin_date), as_dict=True)
         
         return raw_checkin_data
     
@@ -149,7 +149,7 @@ def _get_employee_checkin_data_for_period(employee_name: str, start_date: str, e
             JOIN `tabEmployee` AS em ON ec.employee = em.name
             LEFT JOIN `tabShift Type` AS st ON em.default_shift = st.name
             WHERE ec.employee = %(employee_name)s
-              AND DATE(ec.time) BETWEEN %(start_date)s AND %(end_date)s
+              AND ec.time >= %(start_date)s AND ec.time < %(end_date)s + INTERVAL 1 DAY
             ORDER BY ec.time
         """
         return frappe.db.sql(query, {
@@ -6,25 +6,18 @@ from datetime import datetime, timedelta, time
 import pytz
 import pymysql
 
+from task_manager.services.attendance_cache import get_last_punch, record_last_punch, resequence_employee_day
+from task_manager.services.attendance_summary import refresh_daily_summaries
+
 def handle_employee_checkin(employee_id, full_name, checkin_time, checkin_date, device_id, location):
     """
     Create Employee Checkin Log 
     """
     try:    
-        # Determine log_type by checking last entry for the day
-        log_type = "IN"
-        last_log_type = frappe.db.sql(
-            """
-            SELECT log_type FROM `tabEmployee Checkin`
-            WHERE employee = %s AND DATE(time) = %s
-            ORDER BY time DESC LIMIT 1
-            """,
-            (employee_id, checkin_date),
-            as_dict=False
-        )
-
-        if last_log_type:
-            log_type = "OUT" if last_log_type[0][0] == "IN" else "IN"
+        # Determine log_type from the last punch of the day
+        last_punch = get_last_punch(employee_id, checkin_date)
+        late = bool(last_punch) and checkin_time < last_punch[0]
+        log_type = "OUT" if last_punch and last_punch[1] == "IN" else "IN"
 
         # Generate name using naming series
         name = make_autoname('CHKIN-.#####')
@@ -44,6 +37,13 @@ def handle_employee_checkin(employee_id, full_name, checkin_time, checkin_date,
             employee_id, full_name, checkin_time, device_id, log_type, location
         ))
 
+        if late:
+            # Arrived after later punches of the same day: redo that day's IN/OUT sequence
+            log_type = resequence_employee_day(employee_id, checkin_date)[name]
+        else:
+            record_last_punch(employee_id, checkin_time, log_type)
+        refresh_daily_summaries([(employee_id, checkin_date)])
+
         return {
             "status": "success",
             "name": name,
@@ -5,6 +5,8 @@ from datetime import datetime, date, timedelta
 import calendar
 from typing import List, Dict, Any, Tuple, Optional
 
+from task_manager.services.attendance_cache import get_all_subordinates
+
 
 # helper function to build employee info
 def _build_employee_info(record):
@@ -125,7 +127,7 @@ def _get_employee_data(start_date, end_date):
                 FROM `tabEmployee Checkin` AS ec
                 JOIN `tabEmployee` AS em ON ec.employee = em.name
                 LEFT JOIN `tabShift Type` AS st on em.default_shift=st.name
-                WHERE DATE(ec.time) BETWEEN %s and %s AND em.status = 'Active'
+                WHERE ec.time >= %s AND ec.time < %s + INTERVAL 1 DAY AND em.status = 'Active'
                 ORDER BY ec.employee, ec.time
             """
         raw_checkin_data = frappe.db.sql(query, (start_date, end_date), as_dict=True)
@@ -498,42 +500,6 @@ def _add_to_registry(registry, data, data_key):
                 clean_record.pop(field, None)
             registry[emp_name][data_key] = clean_record
 
-# manager to subordinates mapping
-def _get_hierarchy_map():
-    try:
-        employees = frappe.get_all("Employee", filters={"status": "Active"}, fields=["name", "reports_to"])
-        hierarchy = defaultdict(list)
-        for emp in employees:
-            if emp.reports_to:
-                hierarchy[emp.reports_to].append(emp.name)
-        return hierarchy
-    except Exception as e:
-        frappe.log_error("Error in hierarchy mapping", str(e))
-        return defaultdict(list)
-
-
-# Get all subordinates using bfs
-def _get_all_subordinates(manager_id, hierarchy_map):
-    if not manager_id or not hierarchy_map:
-        return []
-
-    all_subordinates = set()
-    queue = hierarchy_map.get(manager_id, [])
-    visited = set(queue)
-    all_subordinates.update(queue)
-
-    while queue:
-        current = queue.pop(0)
-        direct_reports = hierarchy_map.get(current, [])
-        for report in direct_reports:
-            if report not in visited:
-                visited.add(report)
-                all_subordinates.add(report)
-                queue.append(report)
-    
-    return list(all_subordinates)
-
-
 # Calculate week/month boundaries with current vs past 
 def _get_date_boundaries(target_date):
     try:
@@ -765,8 +731,7 @@ def fetch_checkins(from_date=None, to_date=None, specific_date=None):
                     if not manager_id:
                         frappe.throw("User not linked to active employee record.")
 
-                    hierarchy_map = _get_hierarchy_map()
-                    subordinate_ids = _get_all_subordinates(manager_id, hierarchy_map)
+                    subordinate_ids = get_all_subordinates(manager_id)
                     allowed_employees = set(subordinate_ids + [manager_id])
                     all_employees = frappe.get_all("Employee", 
                         filters={"name": ["in", list(allowed_employees)]},
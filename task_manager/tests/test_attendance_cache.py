@@ -0,0 +1,63 @@
+# Copyright (c) 2025, aaa and Contributors
+# See license.txt
+
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from task_manager.services import attendance_cache
+
+
+def _employees(*pairs):
+	return [frappe._dict(name=name, reports_to=reports_to) for name, reports_to in pairs]
+
+
+class TestReportingHierarchy(FrappeTestCase):
+	def build(self, *pairs):
+		with patch("frappe.get_all", return_value=_employees(*pairs)):
+			hierarchy = attendance_cache._build_reporting_hierarchy()
+		patcher = patch.object(attendance_cache, "_get_shared", return_value=hierarchy)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+		return hierarchy
+
+	def test_subtree_lookups(self):
+		self.build(
+			("CEO", None),
+			("CTO", "CEO"),
+			("DEV1", "CTO"),
+			("DEV2", "CTO"),
+			("INTERN", "DEV1"),
+			("CFO", "CEO"),
+			("ACC", "CFO"),
+		)
+
+		self.assertCountEqual(
+			attendance_cache.get_all_subordinates("CEO"), ["CTO", "DEV1", "DEV2", "INTERN", "CFO", "ACC"]
+		)
+		self.assertCountEqual(attendance_cache.get_all_subordinates("CTO"), ["DEV1", "DEV2", "INTERN"])
+		self.assertEqual(attendance_cache.get_all_subordinates("INTERN"), [])
+		self.assertEqual(attendance_cache.get_all_subordinates("UNKNOWN"), [])
+		self.assertEqual(attendance_cache.get_all_subordinates(None), [])
+
+		self.assertTrue(attendance_cache.is_subordinate("INTERN", "CEO"))
+		self.assertTrue(attendance_cache.is_subordinate("INTERN", "CTO"))
+		self.assertFalse(attendance_cache.is_subordinate("ACC", "CTO"))
+		self.assertFalse(attendance_cache.is_subordinate("CTO", "CTO"))
+		self.assertFalse(attendance_cache.is_subordinate("CEO", "INTERN"))
+		self.assertFalse(attendance_cache.is_subordinate("UNKNOWN", "CEO"))
+
+	def test_inactive_manager_still_heads_reports(self):
+		# LEFT is not an active employee but is still the reports_to of two of them
+		self.build(("A", "LEFT"), ("B", "LEFT"), ("C", "A"))
+
+		self.assertCountEqual(attendance_cache.get_all_subordinates("LEFT"), ["A", "B", "C"])
+		self.assertTrue(attendance_cache.is_subordinate("C", "LEFT"))
+
+	def test_reports_to_cycle_is_covered(self):
+		self.build(("A", "B"), ("B", "A"), ("C", "A"))
+
+		hierarchy = attendance_cache._get_shared(attendance_cache.HIERARCHY_KEY, None)
+		self.assertCountEqual(hierarchy["order"], ["A", "B", "C"])
+		self.assertCountEqual(hierarchy["intervals"], ["A", "B", "C"])
@@ -0,0 +1,263 @@
+# Copyright (c) 2025, aaa and Contributors
+# See license.txt
+
+import asyncio
+import os
+import shutil
+import sqlite3
+import tempfile
+from unittest.mock import patch
+
+from frappe.tests.utils import FrappeTestCase
+
+from task_manager.services import biometric_to_server as gateway
+from task_manager.services.biometric_to_server import (
+	PRIORITY_LIVE,
+	PRIORITY_REPLAY,
+	CircuitBreaker,
+	ErpBatchForwarder,
+	LocalQueue,
+	Punch,
+	PunchDedupIndex,
+)
+
+
+def _punch(enroll_id, timestamp_str="2025-01-06 09:00:00"):
+	return gateway._make_punch(enroll_id, f"Employee {enroll_id}", timestamp_str)
+
+
+class _TempDirTestCase(FrappeTestCase):
+	def setUp(self):
+		self.tmp_dir = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, self.tmp_dir, True)
+
+	def path(self, name):
+		return os.path.join(self.tmp_dir, name)
+
+
+class TestErpBatchForwarder(FrappeTestCase):
+	def test_live_first_then_devices_round_robin(self):
+		batches = []
+
+		async def send_batch(items):
+			batches.append([item["id"] for item in items])
+			return [True] * len(items)
+
+		async def run():
+			forwarder = ErpBatchForwarder(send_batch, max_size=4, max_inflight=1, device_share=2, window=0.05)
+			replay_a = [{"id": f"a{i}"} for i in range(6)]
+			replay_b = [{"id": f"b{i}"} for i in range(2)]
+			live_c = [{"id": "c0"}]
+			return await asyncio.gather(
+				forwarder.submit(replay_a, "a", PRIORITY_REPLAY),
+				forwarder.submit(replay_b, "b", PRIORITY_REPLAY),
+				forwarder.submit(live_c, "c", PRIORITY_LIVE),
+			)
+
+		results = asyncio.run(run())
+
+		self.assertEqual(results, [[True] * 6, [True] * 2, [True]])
+		# Full batches go out at once; the live punch leads and replaying devices take turns
+		self.assertEqual(batches[0], ["c0", "a0", "a1", "b0"])
+		self.assertEqual(batches[1], ["a2", "a3", "b1", "a4"])
+		self.assertEqual(batches[2], ["a5"])
+
+	def test_live_punch_uses_short_window(self):
+		async def send_batch(items):
+			return [True] * len(items)
+
+		async def run():
+			forwarder = ErpBatchForwarder(send_batch, window=30, live_window=0.01)
+			return await asyncio.wait_for(forwarder.submit([{"id": 1}], "a", PRIORITY_LIVE), timeout=5)
+
+		self.assertEqual(asyncio.run(run()), [True])
+
+	def test_failed_batch_reports_neither_sent_nor_queued(self):
+		async def send_batch(items):
+			raise RuntimeError("ERP unreachable")
+
+		async def run():
+			forwarder = ErpBatchForwarder(send_batch, live_window=0)
+			return await forwarder.submit([{"id": 1}, {"id": 2}], "a", PRIORITY_LIVE)
+
+		self.assertEqual(asyncio.run(run()), [None, None])
+
+	def test_replay_limit(self):
+		async def run():
+			forwarder = ErpBatchForwarder(None, replay_limit=10)
+			self.assertTrue(forwarder.accepts_replay(50))
+			forwarder._queued[PRIORITY_REPLAY] = 8
+			self.assertTrue(forwarder.accepts_replay(2))
+			self.assertFalse(forwarder.accepts_replay(3))
+
+		asyncio.run(run())
+
+
+class TestCircuitBreaker(FrappeTestCase):
+	def test_opens_after_threshold(self):
+		breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+		breaker.record_failure()
+		self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+		self.assertTrue(breaker.allow_request())
+
+		breaker.record_failure()
+		self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+		self.assertTrue(breaker.is_open())
+		self.assertFalse(breaker.allow_request())
+
+	def test_success_resets_failure_count(self):
+		breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+		breaker.record_failure()
+		breaker.record_success()
+		breaker.record_failure()
+		self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+	def test_half_open_lets_one_probe_through(self):
+		breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+		breaker.record_failure()
+
+		self.assertTrue(breaker.allow_request())
+		self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+		self.assertTrue(breaker.is_open())
+		self.assertFalse(breaker.allow_request())
+
+		breaker.record_success()
+		self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+		self.assertFalse(breaker.is_open())
+
+	def test_failed_probe_reopens(self):
+		breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0)
+		for _ in range(3):
+			breaker.record_failure()
+
+		self.assertTrue(breaker.allow_request())
+		breaker.record_failure()
+		self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+	def test_released_probe_can_be_retried(self):
+		breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+		breaker.record_failure()
+
+		self.assertTrue(breaker.allow_request())
+		breaker.release_probe()
+		self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+		self.assertTrue(breaker.allow_request())
+
+
+class TestLocalQueue(_TempDirTestCase):
+	def setUp(self):
+		super().setUp()
+		self.queue = LocalQueue(self.path("failed_requests.db"))
+		self.addCleanup(self.queue.close)
+
+	def add(self, count):
+		asyncio.run(self.queue.add_failed_requests([
+			(str(i), f"Employee {i}", "2025-01-06 09:00:00", "DEV1", "ERP down") for i in range(count)
+		]))
+
+	def rows(self, table):
+		with sqlite3.connect(self.queue.db_path) as conn:
+			return conn.execute(f"SELECT id, retry_count FROM {table} ORDER BY id").fetchall()
+
+	def test_backoff_grows_and_is_capped(self):
+		with patch.object(gateway.random, "uniform", return_value=1.0):
+			self.assertEqual(LocalQueue._backoff_delay(1), gateway.QUEUE_BACKOFF_BASE)
+			self.assertEqual(LocalQueue._backoff_delay(2), gateway.QUEUE_BACKOFF_BASE * 2)
+			self.assertEqual(LocalQueue._backoff_delay(3), gateway.QUEUE_BACKOFF_BASE * 4)
+			self.assertEqual(LocalQueue._backoff_delay(30), gateway.QUEUE_BACKOFF_MAX)
+
+	def test_new_rows_wait_for_first_retry(self):
+		self.add(3)
+		self.assertEqual(asyncio.run(self.queue.get_pending_requests(10)), [])
+
+		with patch.object(gateway.time, "time", return_value=gateway.time.time() + gateway.QUEUE_BACKOFF_BASE + 1):
+			self.assertEqual(len(asyncio.run(self.queue.get_pending_requests(10))), 3)
+
+	def test_retry_reschedules_then_dead_letters(self):
+		self.add(2)
+		request_ids = [row[0] for row in self.rows("failed_requests")]
+
+		with patch.object(gateway, "QUEUE_MAX_RETRIES", 2):
+			asyncio.run(self.queue.update_retry_counts(request_ids, "ERP down"))
+			self.assertEqual([row[1] for row in self.rows("failed_requests")], [1, 1])
+			self.assertEqual(self.rows("dead_requests"), [])
+
+			asyncio.run(self.queue.update_retry_counts(request_ids[:1], "ERP down"))
+
+		self.assertEqual(self.rows("failed_requests"), [(request_ids[1], 1)])
+		self.assertEqual(self.rows("dead_requests"), [(request_ids[0], 2)])
+		self.assertEqual(self.queue.dead_lettered_total, 1)
+
+	def test_dead_letter_move_spans_several_chunks(self):
+		count = gateway.QUEUE_ID_CHUNK_SIZE * 2 + 7
+		self.add(count)
+		request_ids = [row[0] for row in self.rows("failed_requests")]
+
+		with patch.object(gateway, "QUEUE_MAX_RETRIES", 1):
+			asyncio.run(self.queue.update_retry_counts(request_ids, "ERP down"))
+
+		self.assertEqual(self.rows("failed_requests"), [])
+		self.assertEqual([row[0] for row in self.rows("dead_requests")], request_ids)
+
+	def test_remove_requests(self):
+		self.add(3)
+		request_ids = [row[0] for row in self.rows("failed_requests")]
+
+		asyncio.run(self.queue.remove_requests(request_ids[:2]))
+		self.assertEqual(asyncio.run(self.queue.count()), 1)
+
+
+class TestPunchDedupIndex(_TempDirTestCase):
+	def setUp(self):
+		super().setUp()
+		self.index = PunchDedupIndex(self.path("seen_punches.db"), capacity=2)
+		self.addCleanup(self.index.close)
+
+	def test_repeats_within_frame_are_dropped(self):
+		punches = [_punch("1"), _punch("1"), _punch("2")]
+		self.assertEqual(asyncio.run(self.index.filter_new("DEV1", punches)), [_punch("1"), _punch("2")])
+
+	def test_marked_punches_are_dropped(self):
+		punches = [_punch("1"), _punch("2")]
+		fresh = asyncio.run(self.index.filter_new("DEV1", punches))
+		asyncio.run(self.index.mark_seen("DEV1", fresh))
+
+		resent = punches + [_punch("3")]
+		self.assertEqual(asyncio.run(self.index.filter_new("DEV1", resent)), [_punch("3")])
+		# Same enroll id and time from another device is a different punch
+		self.assertEqual(asyncio.run(self.index.filter_new("DEV2", punches)), punches)
+
+	def test_reserved_until_released(self):
+		punches = [_punch("1")]
+		self.assertEqual(asyncio.run(self.index.filter_new("DEV1", punches)), punches)
+		# A resent copy arriving while the first is still being forwarded
+		self.assertEqual(asyncio.run(self.index.filter_new("DEV1", punches)), [])
+
+		# Forwarding failed: the device's next resend must get through
+		self.index.release("DEV1", punches)
+		self.assertEqual(asyncio.run(self.index.filter_new("DEV1", punches)), punches)
+
+	def test_keys_beyond_memory_are_found_on_disk(self):
+		punches = [_punch(str(i)) for i in range(5)]
+		asyncio.run(self.index.mark_seen("DEV1", punches))
+		self.assertEqual(len(self.index._recent), 2)
+
+		self.assertEqual(asyncio.run(self.index.filter_new("DEV1", punches)), [])
+
+		other = PunchDedupIndex(self.index.db_path)
+		self.addCleanup(other.close)
+		self.assertEqual(asyncio.run(other.filter_new("DEV1", punches)), [])
+
+	def test_expired_keys_are_new_again(self):
+		punches = [_punch("1")]
+		asyncio.run(self.index.mark_seen("DEV1", punches))
+
+		later = gateway.time.time() + self.index.ttl + 1
+		with patch.object(gateway.time, "time", return_value=later):
+			self.assertEqual(asyncio.run(self.index.filter_new("DEV1", punches)), punches)
+			self.index.release("DEV1", punches)
+			self.assertEqual(asyncio.run(self.index.prune()), 1)
+
+	def test_punch_key_uses_device_time(self):
+		punch = Punch("7", "Employee 7", "2025-01-06 09:00:00", "06-01-2025 09:00:00")
+		self.assertEqual(PunchDedupIndex._key("DEV1", punch), ("DEV1", "7", "2025-01-06 09:00:00"))
@@ -0,0 +1,101 @@
+# Copyright (c) 2025, aaa and Contributors
+# See license.txt
+
+from datetime import date
+
+from frappe.tests.utils import FrappeTestCase
+
+from task_manager.services.day_sets import NO_DAYS, NO_LEAVE, DaySet, LeaveDays
+
+
+class TestDaySet(FrappeTestCase):
+	def test_add_range_is_inclusive(self):
+		days = DaySet(date(2025, 1, 1))
+		days.add_range(date(2025, 1, 5), date(2025, 1, 7))
+
+		self.assertEqual(days.count(date(2025, 1, 1), date(2025, 1, 31)), 3)
+		self.assertIn(date(2025, 1, 5), days)
+		self.assertIn(date(2025, 1, 7), days)
+		self.assertNotIn(date(2025, 1, 4), days)
+		self.assertNotIn(date(2025, 1, 8), days)
+
+	def test_days_before_base_are_dropped(self):
+		days = DaySet(date(2025, 1, 10))
+		days.add_range(date(2025, 1, 1), date(2025, 1, 12))
+		days.add(date(2025, 1, 5))
+
+		self.assertEqual(days.count(date(2025, 1, 1), date(2025, 1, 31)), 3)
+		self.assertNotIn(date(2025, 1, 9), days)
+
+	def test_base_is_taken_from_first_day_added(self):
+		days = DaySet()
+		self.assertEqual(days.count(date(2025, 1, 1), date(2025, 12, 31)), 0)
+
+		days.add(date(2025, 3, 1))
+		days.add(date(2025, 3, 3))
+		self.assertEqual(days.count(date(2025, 1, 1), date(2025, 12, 31)), 2)
+
+	def test_count_clips_to_window(self):
+		days = DaySet(date(2025, 1, 1))
+		days.add_range(date(2025, 1, 1), date(2025, 3, 31))
+
+		self.assertEqual(days.count(date(2025, 2, 1), date(2025, 2, 28)), 28)
+		self.assertEqual(days.count(date(2024, 12, 1), date(2025, 1, 10)), 10)
+		self.assertEqual(days.count(date(2025, 3, 31), date(2025, 4, 30)), 1)
+		self.assertEqual(days.count(date(2025, 4, 1), date(2025, 4, 30)), 0)
+		self.assertEqual(days.count(date(2025, 2, 10), date(2025, 2, 1)), 0)
+
+	def test_count_excluding_other_base(self):
+		leave = DaySet(date(2025, 1, 1))
+		leave.add_range(date(2025, 1, 1), date(2025, 1, 10))
+		holidays = DaySet(date(2025, 1, 5))
+		holidays.add(date(2025, 1, 5))
+		holidays.add(date(2025, 1, 12))
+
+		self.assertEqual(leave.count(date(2025, 1, 1), date(2025, 1, 31), excluding=holidays), 9)
+		self.assertEqual(leave.count(date(2025, 1, 1), date(2025, 1, 31), excluding=NO_DAYS), 10)
+
+
+class TestLeaveDays(FrappeTestCase):
+	def test_half_days_and_fractions(self):
+		leave = LeaveDays(date(2025, 1, 1))
+		leave.add_range(date(2025, 1, 6), date(2025, 1, 7))
+		leave.add_half_day(date(2025, 1, 9))
+
+		self.assertEqual(leave.fraction(date(2025, 1, 6)), 1.0)
+		self.assertEqual(leave.fraction(date(2025, 1, 9)), 0.5)
+		self.assertEqual(leave.fraction(date(2025, 1, 10)), 0)
+		self.assertEqual(leave.total(date(2025, 1, 1), date(2025, 1, 31)), 2.5)
+
+	def test_two_half_days_make_a_full_day(self):
+		leave = LeaveDays(date(2025, 1, 1))
+		leave.add_half_day(date(2025, 1, 9))
+		leave.add_half_day(date(2025, 1, 9))
+
+		self.assertEqual(leave.fraction(date(2025, 1, 9)), 1.0)
+		self.assertEqual(leave.total(date(2025, 1, 1), date(2025, 1, 31)), 1.0)
+
+	def test_half_day_inside_full_leave_counts_once(self):
+		leave = LeaveDays(date(2025, 1, 1))
+		leave.add_range(date(2025, 1, 1), date(2025, 1, 3))
+		leave.add_half_day(date(2025, 1, 2))
+
+		self.assertEqual(leave.total(date(2025, 1, 1), date(2025, 1, 31)), 3.0)
+
+	def test_total_excluding_holidays(self):
+		leave = LeaveDays(date(2025, 1, 1))
+		leave.add_range(date(2025, 1, 1), date(2025, 1, 5))
+		leave.add_half_day(date(2025, 1, 8))
+		holidays = DaySet(date(2025, 1, 1))
+		holidays.add(date(2025, 1, 4))
+		holidays.add(date(2025, 1, 8))
+
+		self.assertEqual(leave.total(date(2025, 1, 1), date(2025, 1, 31), excluding=holidays), 4.0)
+
+	def test_shared_empty_sets_are_read_only(self):
+		self.assertRaises(AttributeError, NO_DAYS.add, date(2025, 1, 1))
+		self.assertRaises(AttributeError, NO_LEAVE.add_range, date(2025, 1, 1), date(2025, 1, 2))
+		self.assertRaises(AttributeError, NO_LEAVE.add_half_day, date(2025, 1, 1))
+		self.assertFalse(NO_DAYS)
+		self.assertFalse(NO_LEAVE)
+		self.assertEqual(NO_LEAVE.total(date(2025, 1, 1), date(2025, 1, 31)), 0)
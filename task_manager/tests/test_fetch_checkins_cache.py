@@ -0,0 +1,170 @@
+# Copyright (c) 2025, aaa and Contributors
+# See license.txt
+
+from datetime import date
+from unittest.mock import patch
+
+from frappe.tests.utils import FrappeTestCase
+
+from task_manager.services import fetch_checkins_cache
+from task_manager.services.fetch_checkins_cache import ATTENDANCE, LEAVE
+
+
+class _FakePipeline:
+	def __init__(self, cache):
+		self.cache = cache
+		self.calls = []
+
+	def __getattr__(self, name):
+		def _queue(*args):
+			self.calls.append((name, args))
+			return self
+
+		return _queue
+
+	def execute(self):
+		results = [getattr(self.cache, name)(*args) for name, args in self.calls]
+		self.calls = []
+		return results
+
+
+class _FakeCache:
+	"""The parts of frappe's RedisWrapper the response cache uses, in memory"""
+
+	def __init__(self):
+		self.values = {}
+		self.sets = {}
+
+	def make_key(self, key):
+		return key
+
+	def get_value(self, key):
+		return self.values.get(key)
+
+	def set_value(self, key, value, expires_in_sec=None):
+		self.values[key] = value
+
+	def delete_value(self, keys):
+		for key in keys if isinstance(keys, (list, tuple)) else [keys]:
+			self.values.pop(key, None)
+
+	def pipeline(self):
+		return _FakePipeline(self)
+
+	def ttl(self, key):
+		return -1 if key in self.sets else -2
+
+	def sadd(self, key, member):
+		self.sets.setdefault(key, set()).add(member)
+
+	def srem(self, key, member):
+		self.sets.get(key, set()).discard(member)
+
+	def smembers(self, key):
+		return set(self.sets.get(key, ()))
+
+	def persist(self, key):
+		pass
+
+	def expire(self, key, ttl):
+		pass
+
+
+class TestResponseInvalidation(FrappeTestCase):
+	def setUp(self):
+		self.cache = _FakeCache()
+		self.builds = 0
+		for patcher in (
+			patch("frappe.cache", return_value=self.cache),
+			patch.object(fetch_checkins_cache, "get_cache_version", return_value="v1"),
+			# Invalidation already runs once immediately; the after-commit pass is the same work
+			patch.object(fetch_checkins_cache, "run_after_commit"),
+		):
+			patcher.start()
+			self.addCleanup(patcher.stop)
+
+	def fetch(self, request_key, scope=None, attendance_window=None, leave_window=None):
+		def _build():
+			self.builds += 1
+			return {"request": request_key}
+
+		return fetch_checkins_cache.get_cached_response(
+			request_key,
+			scope,
+			attendance_window or (date(2025, 1, 1), date(2025, 1, 31)),
+			leave_window or (date(2025, 1, 1), date(2025, 12, 31)),
+			False,
+			_build,
+		)
+
+	def assertRebuilt(self, request_key, expected, **kwargs):
+		builds = self.builds
+		self.fetch(request_key, **kwargs)
+		self.assertEqual(self.builds - builds, 1 if expected else 0, request_key)
+
+	def test_cached_response_is_served(self):
+		self.assertEqual(self.fetch("jan"), {"request": "jan"})
+		self.assertEqual(self.fetch("jan"), {"request": "jan"})
+		self.assertEqual(self.builds, 1)
+
+	def test_attendance_change_drops_overlapping_windows_only(self):
+		self.fetch("jan")
+		self.fetch("feb", attendance_window=(date(2025, 2, 1), date(2025, 2, 28)))
+		self.fetch("week", attendance_window=(date(2025, 1, 27), date(2025, 2, 2)))
+
+		fetch_checkins_cache.invalidate_for_employee_days([("EMP-1", date(2025, 1, 31))])
+
+		self.assertRebuilt("jan", True)
+		self.assertRebuilt("feb", False, attendance_window=(date(2025, 2, 1), date(2025, 2, 28)))
+		self.assertRebuilt("week", True, attendance_window=(date(2025, 1, 27), date(2025, 2, 2)))
+
+	def test_change_outside_scope_keeps_response(self):
+		self.fetch("team", scope={"EMP-1", "EMP-2"})
+		self.fetch("other", scope={"EMP-3"})
+
+		fetch_checkins_cache.invalidate_for_employee_days([("EMP-2", date(2025, 1, 15))])
+
+		self.assertRebuilt("team", True, scope={"EMP-1", "EMP-2"})
+		self.assertRebuilt("other", False, scope={"EMP-3"})
+
+	def test_everyone_scope_matches_any_employee(self):
+		self.fetch("all")
+		fetch_checkins_cache.invalidate_for_employee_days([("EMP-9", date(2025, 1, 2))])
+		self.assertRebuilt("all", True)
+
+	def test_leave_compares_leave_window(self):
+		# Same attendance window, leave windows in different years
+		self.fetch("y2025")
+		self.fetch("y2024", leave_window=(date(2024, 1, 1), date(2024, 12, 31)))
+
+		fetch_checkins_cache.invalidate_responses(LEAVE, {"EMP-1"}, [(date(2025, 6, 2), date(2025, 6, 3))])
+
+		self.assertRebuilt("y2025", True)
+		self.assertRebuilt("y2024", False, leave_window=(date(2024, 1, 1), date(2024, 12, 31)))
+
+	def test_leave_change_ignores_attendance_window(self):
+		self.fetch("jan")
+		# June is outside the attendance window but inside the leave window
+		fetch_checkins_cache.invalidate_responses(ATTENDANCE, None, [(date(2025, 6, 2), date(2025, 6, 2))])
+		self.assertRebuilt("jan", False)
+
+		fetch_checkins_cache.invalidate_responses(LEAVE, None, [(date(2025, 6, 2), date(2025, 6, 2))])
+		self.assertRebuilt("jan", True)
+
+	def test_invalidation_during_build_is_not_stored(self):
+		def _build():
+			self.builds += 1
+			fetch_checkins_cache.invalidate_for_employee_days([("EMP-1", date(2025, 1, 10))])
+			return {"request": "racing"}
+
+		window = (date(2025, 1, 1), date(2025, 1, 31))
+		fetch_checkins_cache.get_cached_response("racing", None, window, window, False, _build)
+		fetch_checkins_cache.get_cached_response("racing", None, window, window, False, _build)
+		self.assertEqual(self.builds, 2)
+
+	def test_dropped_responses_leave_the_index(self):
+		self.fetch("jan")
+		fetch_checkins_cache.invalidate_for_employee_days([("EMP-1", date(2025, 1, 15))])
+
+		index = fetch_checkins_cache._index_names(ATTENDANCE, [(date(2025, 1, 15), date(2025, 1, 15))]).pop()
+		self.assertEqual(self.cache.smembers(index), set())